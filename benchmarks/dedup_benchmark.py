@@ -0,0 +1,90 @@
+"""
+Benchmark of memory deduplication: exact clustering (`task.tools.memory._dedup`) vs the previous greedy
+k=10 nearest neighbors method.
+
+Synthetic collections consist of clusters of near-identical memories (as produced when the same fact is stored on
+every turn) mixed with unique memories, so the expected number of survivors is known.
+
+Run from repository root:
+    python -m benchmarks.dedup_benchmark [--sizes 1000 10000 50000]
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from task.tools.memory._dedup import deduplicate
+from task.embeddings.utils import normalize
+from task.embeddings.index import VectorIndex
+from task.tools.memory._models import EMBEDDING_DIM
+
+THRESHOLD = 0.75
+
+
+def make_collection(size: int, cluster_size: int, duplicate_share: float, seed: int = 0):
+    """Returns (embeddings, importance, expected number of survivors)."""
+    rng = np.random.default_rng(seed)
+    duplicated = int(size * duplicate_share)
+    clusters = max(1, duplicated // cluster_size)
+    unique = size - clusters * cluster_size
+
+    centers = normalize(rng.standard_normal((clusters + unique, EMBEDDING_DIM)).astype(np.float32))
+    noise = rng.standard_normal((clusters * cluster_size, EMBEDDING_DIM)).astype(np.float32) * 0.02
+    duplicates = np.repeat(centers[:clusters], cluster_size, axis=0) + noise
+    embeddings = normalize(np.vstack([duplicates, centers[clusters:]]))
+
+    order = rng.permutation(size)
+    importance = rng.random(size).astype(np.float32)
+    return embeddings[order], importance[order], clusters + unique
+
+
+def greedy_knn(embeddings: np.ndarray, importance: np.ndarray) -> list[int]:
+    """The previous `_deduplicate_fast` implementation."""
+    n = len(embeddings)
+    k = min(10, n)
+    similarities, indices = VectorIndex.build(embeddings).search(embeddings, k)
+    duplicates_to_remove = set()
+    for i in range(n):
+        if i in duplicates_to_remove:
+            continue
+        for j in range(1, k):
+            neighbor_idx = indices[i][j]
+            if neighbor_idx in duplicates_to_remove:
+                continue
+            if similarities[i][j] > THRESHOLD:
+                if importance[i] >= importance[neighbor_idx]:
+                    duplicates_to_remove.add(neighbor_idx)
+                else:
+                    duplicates_to_remove.add(i)
+                    break
+    return [i for i in range(n) if i not in duplicates_to_remove]
+
+
+def measure(func, *args) -> tuple[float, int]:
+    started_at = time.perf_counter()
+    kept = func(*args)
+    return time.perf_counter() - started_at, len(kept)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--cluster-size", type=int, default=25)
+    parser.add_argument("--duplicate-share", type=float, default=0.5)
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(1)
+    print(f"{'size':>8} {'expected':>9} | {'greedy k=10':>22} | {'exact clustering':>22}")
+    for size in args.sizes:
+        embeddings, importance, expected = make_collection(size, args.cluster_size, args.duplicate_share)
+        greedy_time, greedy_kept = measure(greedy_knn, embeddings, importance)
+        exact_time, exact_kept = measure(deduplicate, embeddings, importance, THRESHOLD)
+        print(
+            f"{size:>8} {expected:>9} | {greedy_kept:>8} kept {greedy_time:>7.2f}s | "
+            f"{exact_kept:>8} kept {exact_time:>7.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
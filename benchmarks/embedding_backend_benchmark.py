@@ -0,0 +1,71 @@
+"""
+Benchmark of embedding backends (`task.embeddings.registry.EMBEDDING_BACKENDS`) on CPU: load time, throughput of
+document chunk batches, latency of single queries and compatibility of vectors with the first listed backend (torch by default).
+
+Requires the model to be downloadable (or cached) and `optimum[onnxruntime]` for ONNX backends.
+
+Run from repository root:
+    python -m benchmarks.embedding_backend_benchmark [--backends torch onnx onnx-int8] [--chunks 512]
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from task.embeddings.registry import EMBEDDING_BACKENDS, EmbeddingModelRegistry
+from task.embeddings.utils import normalize
+
+WORDS = (
+    "user prefers python meetings morning lives paris works google learning spanish travel japan cat named "
+    "document section report revenue quarter analysis results method data model training evaluation table figure "
+    "contract party agreement terms payment delivery schedule customer support product release version"
+).split()
+
+
+def make_texts(count: int, words: int, rng: random.Random) -> list[str]:
+    return [" ".join(rng.choice(WORDS) for _ in range(words)) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS))
+    parser.add_argument("--chunks", type=int, default=512, help="Number of ~500 chars document chunks")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    chunks = make_texts(args.chunks, 80, rng)
+    queries = make_texts(args.queries, 8, rng)
+
+    reference = None
+    print(f"{'backend':>10} | {'load s':>6} | {'chunks/s':>8} | {'query p50 ms':>12} | {'query p95 ms':>12} | {'min cos':>7} | {'mean cos':>8}")
+    for backend in args.backends:
+        started_at = time.perf_counter()
+        model = EmbeddingModelRegistry.get(args.model, backend)
+        load_time = time.perf_counter() - started_at
+
+        model.encode(chunks[:args.batch_size], batch_size=args.batch_size)  # warm-up
+        started_at = time.perf_counter()
+        embeddings = normalize(model.encode(chunks, batch_size=args.batch_size))
+        throughput = len(chunks) / (time.perf_counter() - started_at)
+
+        latencies = []
+        for query in queries:
+            started_at = time.perf_counter()
+            model.encode([query])
+            latencies.append((time.perf_counter() - started_at) * 1000)
+
+        if reference is None:
+            reference = embeddings
+        similarities = np.sum(embeddings * reference, axis=1)
+        print(
+            f"{backend:>10} | {load_time:>6.2f} | {throughput:>8.1f} | {np.percentile(latencies, 50):>12.2f} | "
+            f"{np.percentile(latencies, 95):>12.2f} | {similarities.min():>7.4f} | {similarities.mean():>8.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Benchmark of long-term memory store (`task.tools.memory.memory_store`): load, search, add, save and dedup latency
+and throughput for collections of different sizes.
+
+DIAL files API is replaced with `FakeFiles` (in memory or on local disk) with simulated request latency and
+bandwidth, embeddings come from a deterministic hash embedder (`--embedder model` uses the real model instead).
+Collections are generated with fixed seeds and every measurement is repeated after a discarded warm-up run,
+so numbers are comparable between runs and can be tracked for regressions (`--json` saves them).
+
+Measured operations:
+- load cold: fresh store (empty caches) loads the memory folder root and all shards of the user
+- search cold: fresh store searches one category, only the root and shards of the category are downloaded
+- search warm: loaded store, distinct queries (search cache misses)
+- add: sequential `add_memory` calls; add concurrent: `add_memory` calls issued at once (merged by write queue)
+- save: compaction of all shards (snapshot upload)
+- dedup: `_deduplicate_fast` of all shards (CPU only)
+
+Throughput (items/s) counts memories for load, add, save and dedup and queries for search. Requests and MB are
+per run of the operation.
+
+Run from repository root:
+    python -m benchmarks.memory_benchmark [--sizes 100 1000 10000 100000] [--latency-ms 10] [--json results.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import time
+from datetime import datetime, UTC
+
+import numpy as np
+
+from task.embeddings.index import INDEX_KINDS
+from task.embeddings.service import EmbeddingService
+from task.tools.memory._models import MemoryCollection, MemoryData, MemoryManifest, MemoryShard
+from task.tools.memory.memory_store import LongTermMemoryStore
+from tests._fakes import FakeClientPool, FakeFiles, HashEmbeddingService
+
+API_KEY = "benchmark"
+CATEGORIES = ("preferences", "personal_info", "goals", "plans", "context")
+WORDS = (
+    "user prefers python meetings morning lives paris works google learning spanish travel japan cat named "
+    "coffee tea running hiking books movies music guitar piano sister brother daughter son wife husband "
+    "birthday anniversary allergy vegetarian project deadline manager team remote office berlin london tokyo "
+    "marathon diet budget savings mortgage apartment car bike garden dog doctor dentist gym yoga chess"
+).split()
+
+
+def make_texts(count: int, rng: np.random.Generator, words: int = 8) -> list[str]:
+    vocabulary = np.array(WORDS + [f"entity{i}" for i in range(2_000)])
+    picked = vocabulary[rng.integers(0, len(vocabulary), (count, words))]
+    return [" ".join(row) for row in picked]
+
+
+async def populate(store: LongTermMemoryStore, size: int, seed: int = 0) -> None:
+    """
+    Write `size` memories as compacted, already deduplicated collections (the layout the store converges to): the
+    memory folder root up to `MAX_SHARD_SIZE` memories, category shards listed in the manifest above it.
+    """
+    rng = np.random.default_rng(seed)
+    texts = make_texts(size, rng)
+    embeddings = await store.embedding_service.embed(texts)
+    created_at = datetime.now(UTC)
+    memories = [
+        MemoryData(
+            id=int(created_at.timestamp()) - i,
+            content=text,
+            importance=float(rng.random()),
+            category=CATEGORIES[i % len(CATEGORIES)],
+            created_at=created_at,
+        )
+        for i, text in enumerate(texts)
+    ]
+
+    client = store.client_pool.get_client(store.endpoint, API_KEY)
+    folder_path = await store._get_memory_folder_path(API_KEY)
+    if size <= store.MAX_SHARD_SIZE:
+        collection = MemoryCollection(memories=memories, embeddings=embeddings, last_deduplicated_at=created_at)
+        await store._upload_snapshot(client, folder_path, collection)
+        return
+
+    manifest = MemoryManifest()
+    for category in CATEGORIES:
+        rows = [i for i, memory in enumerate(memories) if memory.category == category]
+        for start in range(0, len(rows), store.MAX_SHARD_SIZE):
+            shard_rows = rows[start:start + store.MAX_SHARD_SIZE]
+            shard = MemoryShard(name=store._new_shard_name(category), category=category)
+            collection = MemoryCollection(
+                memories=[memories[i] for i in shard_rows],
+                embeddings=embeddings[shard_rows],
+                last_deduplicated_at=created_at,
+            )
+            await store._upload_snapshot(client, store._get_shard_path(folder_path, shard), collection)
+            manifest.shards.append(shard)
+    await store._upload_manifest(client, folder_path, manifest, None)
+
+
+def summarize(samples: list[float], items: int = 1) -> dict[str, float]:
+    """Latency percentiles in ms and throughput in items per second, `items` are processed by each sample."""
+    samples_ms = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(samples_ms, 50)),
+        "p95_ms": float(np.percentile(samples_ms, 95)),
+        "per_second": items * len(samples) / float(np.sum(samples)),
+    }
+
+
+async def timed(coroutine) -> float:
+    gc.collect()
+    started_at = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await coroutine
+    return time.perf_counter() - started_at
+
+
+async def run_size(
+        size: int,
+        files: FakeFiles,
+        embedding_service: EmbeddingService,
+        repeats: int,
+        operations: int,
+        cache_max_bytes: int,
+        index_kind: str,
+) -> dict[str, dict[str, float]]:
+    def new_store() -> LongTermMemoryStore:
+        return LongTermMemoryStore(
+            endpoint="benchmark",
+            embedding_service=embedding_service,
+            client_pool=FakeClientPool(files),
+            cache_max_bytes=cache_max_bytes,
+            index_kind=index_kind,
+        )
+
+    results: dict[str, dict[str, float]] = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        await populate(new_store(), size)
+    rng = np.random.default_rng(1)
+
+    async def measure(name: str, make_coroutine, runs: int, items: int = 1) -> None:
+        await timed(make_coroutine())  # warm-up
+        files.reset_stats()
+        samples = [await timed(make_coroutine()) for _ in range(runs)]
+        results[name] = summarize(samples, items)
+        results[name]["requests"] = files.requests / runs
+        results[name]["mb_transferred"] = (files.bytes_downloaded + files.bytes_uploaded) / runs / 1024 ** 2
+
+    await measure("load cold", lambda: new_store()._load_shards(API_KEY), repeats, items=size)
+    queries = iter(make_texts(10 * (repeats + operations + 2), rng, words=4))
+    await measure(
+        "search cold",
+        lambda: new_store().search_memories_multi(API_KEY, [next(queries)], 5, categories=[CATEGORIES[0]]),
+        repeats,
+    )
+
+    store = new_store()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await store._load_shards(API_KEY)
+    await measure("search warm", lambda: store.search_memories(API_KEY, next(queries), 5), operations)
+
+    contents = iter(make_texts(10 * (operations + 2) * 2, rng))
+    await measure(
+        "add",
+        lambda: store.add_memory(API_KEY, next(contents), 0.5, CATEGORIES[1], []),
+        operations,
+    )
+
+    async def add_concurrent():
+        await asyncio.gather(*[
+            store.add_memory(API_KEY, next(contents), 0.5, CATEGORIES[1], []) for _ in range(operations)
+        ])
+
+    await measure("add concurrent", add_concurrent, 1, items=operations)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        shards = await store._load_shards(API_KEY)
+
+    async def save_all():
+        for shard_path, collection in shards:
+            await store._save_memories(API_KEY, shard_path, collection)
+
+    await measure("save", save_all, repeats, items=size)
+
+    async def dedup_all():
+        for _, collection in shards:
+            await asyncio.to_thread(store._deduplicate_fast, collection.memories, collection.embeddings)
+
+    await measure("dedup", dedup_all, repeats, items=size)
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 10_000, 100_000])
+    parser.add_argument("--repeats", type=int, default=5, help="Runs of load, save and dedup per size")
+    parser.add_argument("--operations", type=int, default=50, help="Search and add calls per size")
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="Simulated latency of DIAL files API requests")
+    parser.add_argument("--bandwidth-mbps", type=float, default=200.0, help="Simulated bandwidth, 0 for unlimited")
+    parser.add_argument("--storage-dir", help="Keep fake bucket files on local disk instead of in memory")
+    parser.add_argument(
+        "--cache-mb", type=int, default=256,
+        help="Memory cache budget, warm operations reload shards evicted from the cache if it is too small"
+    )
+    parser.add_argument("--index-kind", choices=INDEX_KINDS, default="flat")
+    parser.add_argument("--embedder", choices=("hash", "model"), default="hash")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backend", default="torch")
+    parser.add_argument("--json", help="Save results to the JSON file")
+    args = parser.parse_args()
+
+    if args.embedder == "hash":
+        embedding_service = HashEmbeddingService()
+    else:
+        embedding_service = EmbeddingService(model_name=args.model, backend=args.backend)
+
+    report = {}
+    print(f"{'size':>7} | {'operation':>14} | {'p50 ms':>9} | {'p95 ms':>9} | {'items/s':>10} | {'requests':>8} | {'MB':>7}")
+    for size in args.sizes:
+        files = FakeFiles(latency_ms=args.latency_ms, bandwidth_mbps=args.bandwidth_mbps, root=args.storage_dir)
+        results = await run_size(
+            size, files, embedding_service, args.repeats, args.operations, args.cache_mb * 1024 ** 2, args.index_kind
+        )
+        report[size] = results
+        for operation, result in results.items():
+            print(
+                f"{size:>7} | {operation:>14} | {result['p50_ms']:>9.2f} | {result['p95_ms']:>9.2f} | "
+                f"{result['per_second']:>10.1f} | {result['requests']:>8.1f} | {result['mb_transferred']:>7.2f}"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {"parameters": vars(args), "results": report},
+                f,
+                indent=2,
+            )
+    embedding_service.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
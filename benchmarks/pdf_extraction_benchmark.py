@@ -0,0 +1,63 @@
+"""
+Benchmark of PDF text extraction: sequential `page.extract_text()` loop vs page range split across worker processes
+of `FileParserPool`, and time to the first page of `iter_pdf_pages`. Parallel text is checked to be identical to
+the sequential one.
+
+Synthetic multi-page PDFs with lines of text are generated (no PDF library needed), `--pdf` benchmarks real files.
+Speedup is bounded by the number of CPU cores.
+
+Run from repository root:
+    python -m benchmarks.pdf_extraction_benchmark [--pages 200 500] [--workers 4] [--pdf report.pdf]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from task.utils.dial_file_conent_extractor import FileParserPool, _extract_text
+from tests._fakes import make_pdf
+
+
+async def run(name: str, content: bytes, pool: FileParserPool) -> None:
+    started_at = time.perf_counter()
+    sequential = _extract_text(content, ".pdf", name)
+    sequential_time = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    parallel = await pool.extract_text(content, ".pdf", name)
+    parallel_time = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    pages = pool.iter_pdf_pages(content)
+    await anext(pages)
+    first_page_time = time.perf_counter() - started_at
+    await pages.aclose()
+
+    print(
+        f"{name:>24} | {sequential_time:>12.2f} | {parallel_time:>10.2f} | {sequential_time / parallel_time:>7.2f}x | "
+        f"{first_page_time:>12.2f} | {str(parallel == sequential):>9}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, nargs="+", default=[200, 500])
+    parser.add_argument("--pdf", nargs="*", default=[], help="PDF files to benchmark instead of synthetic ones")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--pages-per-task", type=int, default=16)
+    args = parser.parse_args()
+
+    pool = FileParserPool(max_workers=args.workers, timeout_seconds=3600, pdf_pages_per_task=args.pages_per_task)
+    pool.warm_up()
+    documents = [(os.path.basename(path), open(path, "rb").read()) for path in args.pdf] or [
+        (f"synthetic {pages} pages", make_pdf(pages)) for pages in args.pages
+    ]
+    print(f"workers: {args.workers}, pages per task: {args.pages_per_task}")
+    print(f"{'document':>24} | {'sequential s':>12} | {'parallel s':>10} | {'speedup':>8} | {'first page s':>12} | {'identical':>9}")
+    for name, content in documents:
+        await run(name, content, pool)
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+"""
+Benchmark of quantized vector indexes (`task.embeddings.index.VectorIndex`): recall@k against exact search and
+memory used per vector, with and without exact re-ranking.
+
+Two corpora are generated: "memories" (many short facts forming topical clusters) and "documents" (chunks of a
+few long documents, neighbouring chunks are similar). Real texts can be used instead with `--corpus` (one text per
+line) embedded with `--model`.
+
+Run from repository root:
+    python -m benchmarks.quantization_benchmark [--size 20000] [--corpus texts.txt --model all-MiniLM-L6-v2]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from task.embeddings.index import INDEX_KINDS, VectorIndex, rerank
+from task.embeddings.utils import normalize
+from task.tools.memory._models import EMBEDDING_DIM
+
+
+def make_memories(size: int, rng: np.random.Generator) -> np.ndarray:
+    # Anisotropic space (as real sentence embeddings), facts cluster around topics
+    basis = rng.standard_normal((64, EMBEDDING_DIM)).astype(np.float32)
+    topics = rng.standard_normal((size // 50 + 1, 64)).astype(np.float32)
+    latent = topics[rng.integers(0, len(topics), size)] + 0.6 * rng.standard_normal((size, 64)).astype(np.float32)
+    noise = 0.3 * rng.standard_normal((size, EMBEDDING_DIM)).astype(np.float32)
+    return normalize(latent @ basis + noise)
+
+
+def make_documents(size: int, rng: np.random.Generator) -> np.ndarray:
+    # Chunks are a random walk within each document
+    basis = rng.standard_normal((64, EMBEDDING_DIM)).astype(np.float32)
+    chunks_per_document = 200
+    steps = 0.3 * rng.standard_normal((size, 64)).astype(np.float32)
+    starts = rng.standard_normal((size // chunks_per_document + 1, 64)).astype(np.float32)
+    latent = np.concatenate([
+        starts[i] + np.cumsum(steps[i * chunks_per_document:(i + 1) * chunks_per_document], axis=0)
+        for i in range(len(starts))
+    ])[:size]
+    noise = 0.3 * rng.standard_normal((size, EMBEDDING_DIM)).astype(np.float32)
+    return normalize(latent @ basis + noise)
+
+
+def embed_corpus(path: str, model_name: str) -> np.ndarray:
+    from sentence_transformers import SentenceTransformer
+    with open(path, encoding="utf-8") as f:
+        texts = [line.strip() for line in f if line.strip()]
+    return normalize(SentenceTransformer(model_name).encode(texts, batch_size=64))
+
+
+def recall(found: np.ndarray, expected: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, expected)]))
+
+
+def run(name: str, vectors: np.ndarray, queries: np.ndarray, k: int):
+    _, expected = VectorIndex.build(vectors, kind="flat").search(queries, k)
+    rerank_vectors = vectors.astype(np.float16)
+    print(f"\n{name}: {len(vectors)} vectors, {len(queries)} queries, recall@{k}")
+    print(f"{'index':>6} | {'bytes/vector':>12} | {'recall':>6} | {'recall, re-ranked':>17} | {'search ms/query':>15}")
+    for kind in INDEX_KINDS:
+        index = VectorIndex.build(vectors, kind=kind)
+        started_at = time.perf_counter()
+        _, candidates = index.search(queries, k)
+        if index.is_exact:
+            approximate = reranked = candidates
+        else:
+            approximate = candidates[:, :k]
+            _, reranked = rerank(queries, candidates, lambda rows: rerank_vectors[rows], k)
+        elapsed_ms = (time.perf_counter() - started_at) * 1000 / len(queries)
+        print(
+            f"{index.kind:>6} | {index.nbytes / len(vectors):>12.0f} | {recall(approximate, expected):>6.3f} | "
+            f"{recall(reranked, expected):>17.3f} | {elapsed_ms:>15.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--corpus", help="Text file with one text per line, embedded instead of synthetic corpora")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.corpus:
+        vectors = embed_corpus(args.corpus, args.model)
+        corpora = {args.corpus: vectors}
+    else:
+        corpora = {"memories": make_memories(args.size, rng), "documents": make_documents(args.size, rng)}
+
+    for name, vectors in corpora.items():
+        # Queries are perturbed corpus vectors: close to, but not identical with, stored ones
+        picked = vectors[rng.integers(0, len(vectors), args.queries)]
+        queries = normalize(picked + 0.05 * rng.standard_normal(picked.shape).astype(np.float32))
+        run(name, vectors, queries, args.k)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,8 +7,11 @@ from aidial_client.types.chat.legacy.chat_completion import CustomContent, ToolC
 from aidial_sdk.chat_completion import Message, Role, Choice, Request, Response
 
 from task.tools.base import BaseTool
+from task.tools.memory._models import MemoryData
+from task.tools.memory.memory_store import LongTermMemoryStore
 from task.tools.models import ToolCallParams
 from task.utils.constants import TOOL_CALL_HISTORY_KEY
+from task.utils.dial_client_pool import DialClientPool
 from task.utils.history import unpack_messages
 from task.utils.stage import StageProcessor
 
@@ -20,8 +23,17 @@ class GeneralPurposeAgent:
             endpoint: str,
             system_prompt: str,
             tools: list[BaseTool],
+            client_pool: DialClientPool,
+            memory_recall: asyncio.Task | None = None,
     ):
+        """
+        Args:
+            memory_recall: Retrieval of memories relevant to the latest user message started on request entry with
+                `start_memory_recall`, recalled memories are added to the system message, so answers depending on them
+                don't need a `search_memory` round trip
+        """
         self.endpoint = endpoint
+        self.client_pool = client_pool
         self.system_prompt = system_prompt
         self.tools = tools
         self._tools_dict: dict[str, BaseTool] = {
@@ -31,22 +43,27 @@ class GeneralPurposeAgent:
         self.state = {
             TOOL_CALL_HISTORY_KEY: []
         }
+        self._memory_recall = memory_recall
+        self._recalled_memories: list[MemoryData] = []
 
     async def handle_request(
             self, deployment_name: str, choice: Choice, request: Request, response: Response) -> Message:
         api_key = request.api_key
 
-        client: AsyncDial = AsyncDial(
-            base_url=self.endpoint,
-            api_key=api_key,
-            api_version='2025-01-01-preview'
-        )
+        client: AsyncDial = self.client_pool.get_client(self.endpoint, api_key)
+        tools = [tool.schema for tool in self.tools]
+        messages = unpack_messages(request.messages, self.state[TOOL_CALL_HISTORY_KEY])
+        # Recall was started on request entry and ran concurrently with the request setup, awaited once per request
+        if self._memory_recall is not None:
+            self._recalled_memories = await self._memory_recall
+            self._memory_recall = None
 
         chunks = await client.chat.completions.create(
-            messages=self._prepare_messages(request.messages),
-            tools=[tool.schema for tool in self.tools],
+            messages=self._prepare_messages(messages),
+            tools=tools,
             stream=True,
             deployment_name=deployment_name,
+            api_version=DialClientPool.API_VERSION,
         )
 
         tool_call_index_map = {}
@@ -102,13 +119,56 @@ class GeneralPurposeAgent:
 
         return assistant_message
 
-    def _prepare_messages(self, messages: list[Message]) -> list[dict[str, Any]]:
-        unpacked_messages = unpack_messages(messages, self.state[TOOL_CALL_HISTORY_KEY])
+    @staticmethod
+    def start_memory_recall(
+            memory_store: LongTermMemoryStore, top_k: int, api_key: str, messages: list[Message]
+    ) -> asyncio.Task | None:
+        """
+        Start retrieval of `top_k` memories relevant to the latest user message.
+
+        Called on request entry, so collection loading and query embedding run concurrently with each other and with
+        the request setup (tools creation, choice opening, history unpacking). Returns None if recall is disabled or
+        there is no user message.
+        """
+        if top_k <= 0:
+            return None
+        query = next(
+            (m.content for m in reversed(messages) if m.role == Role.USER and isinstance(m.content, str) and m.content),
+            None
+        )
+        if query is None:
+            return None
+        return asyncio.create_task(GeneralPurposeAgent._recall_memories(memory_store, top_k, api_key, query))
+
+    @staticmethod
+    async def _recall_memories(
+            memory_store: LongTermMemoryStore, top_k: int, api_key: str, query: str) -> list[MemoryData]:
+        try:
+            return await memory_store.search_memories(api_key, query, top_k)
+        except Exception as e:
+            print(f"Automatic memory recall failed: {e}")
+            return []
+
+    @staticmethod
+    def _format_recalled_memories(memories: list[MemoryData]) -> str:
+        lines = [
+            "\n\n## Long-term memories relevant to the latest user message",
+            "These memories were retrieved automatically, use `search_memory` only for information not covered here.",
+        ]
+        for memory in memories:
+            topics = f", topics: {', '.join(memory.topics)}" if memory.topics else ""
+            lines.append(f"- {memory.content} (category: {memory.category}{topics})")
+        return "\n".join(lines)
+
+    def _prepare_messages(self, unpacked_messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        system_prompt = self.system_prompt
+        if self._recalled_memories:
+            system_prompt += self._format_recalled_memories(self._recalled_memories)
         unpacked_messages.insert(
             0,
             {
                 "role": Role.SYSTEM.value,
-                "content": self.system_prompt,
+                "content": system_prompt,
             }
         )
 
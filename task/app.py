@@ -1,15 +1,18 @@
 import os
+from concurrent.futures import Future
 
 from aidial_sdk import DIALApp
 from aidial_sdk.chat_completion import ChatCompletion, Request, Response
 
 from task.agent import GeneralPurposeAgent
+from task.embeddings.service import EmbeddingService
 from task.prompts import SYSTEM_PROMPT
 from task.tools.base import BaseTool
 from task.tools.deployment.image_generation_tool import ImageGenerationTool
 from task.tools.files.file_content_extraction_tool import FileContentExtractionTool
 from task.tools.mcp.mcp_client import MCPClient
 from task.tools.mcp.mcp_tool import MCPTool
+from task.tools.memory._ranking import MemoryRanking
 from task.tools.memory.memory_delete_tool import DeleteMemoryTool
 from task.tools.memory.memory_search_tool import SearchMemoryTool
 from task.tools.memory.memory_store import LongTermMemoryStore
@@ -17,17 +20,69 @@ from task.tools.memory.memory_store_tool import StoreMemoryTool
 from task.tools.py_interpreter.python_code_interpreter_tool import PythonCodeInterpreterTool
 from task.tools.rag.document_cache import DocumentCache
 from task.tools.rag.rag_tool import RagTool
+from task.utils.dial_client_pool import DialClientPool
+from task.utils.dial_file_conent_extractor import FileParserPool
 
 DIAL_ENDPOINT = os.getenv('DIAL_ENDPOINT', "http://localhost:8080")
 DEPLOYMENT_NAME = os.getenv('DEPLOYMENT_NAME', 'gpt-4o')
 # DEPLOYMENT_NAME = os.getenv('DEPLOYMENT_NAME', 'claude-sonnet-3-7')
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+# Embedding inference backend: 'torch', 'onnx' or 'onnx-int8' (ONNX backends require `optimum[onnxruntime]`)
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')
+# Vector index kinds: 'flat' (exact), 'sq8' or 'pq' (quantized with exact re-ranking)
+MEMORY_INDEX_KIND = os.getenv('MEMORY_INDEX_KIND', 'flat')
+RAG_INDEX_KIND = os.getenv('RAG_INDEX_KIND', 'flat')
+# Memory search score: similarity * cosine + importance * importance + recency * 0.5 ** (age / half-life),
+# zero importance and recency weights rank by similarity only
+MEMORY_RANKING_SIMILARITY = float(os.getenv('MEMORY_RANKING_SIMILARITY', '1.0'))
+MEMORY_RANKING_IMPORTANCE = float(os.getenv('MEMORY_RANKING_IMPORTANCE', '0.15'))
+MEMORY_RANKING_RECENCY = float(os.getenv('MEMORY_RANKING_RECENCY', '0.1'))
+MEMORY_RANKING_HALF_LIFE_DAYS = float(os.getenv('MEMORY_RANKING_HALF_LIFE_DAYS', '30'))
+# Number of memories retrieved automatically for each request and added to the system prompt, 0 disables it
+MEMORY_RECALL_TOP_K = int(os.getenv('MEMORY_RECALL_TOP_K', '0'))
+# Worker processes parsing attachments (PDF, CSV, HTML) and max parsing time of one file
+FILE_PARSER_WORKERS = int(os.getenv('FILE_PARSER_WORKERS', '2'))
+FILE_PARSER_TIMEOUT_SECONDS = float(os.getenv('FILE_PARSER_TIMEOUT_SECONDS', '60'))
+# Memory budget of RAG document indexes (least recently used are evicted) and their max age
+RAG_CACHE_MEMORY_MB = int(os.getenv('RAG_CACHE_MEMORY_MB', '512'))
+RAG_CACHE_TTL_HOURS = float(os.getenv('RAG_CACHE_TTL_HOURS', '24'))
+# Local directory persisting RAG document indexes across restarts (disabled if not set) and its size budget
+RAG_CACHE_DIR = os.getenv('RAG_CACHE_DIR')
+RAG_CACHE_DISK_MB = int(os.getenv('RAG_CACHE_DISK_MB', '1024'))
 
 
 class GeneralPurposeAgentApplication(ChatCompletion):
 
     def __init__(self):
         self.tools: list[BaseTool] = []
-        self.memory_store = LongTermMemoryStore(endpoint=DIAL_ENDPOINT)
+        self.client_pool = DialClientPool()
+        self.file_parser_pool = FileParserPool(
+            max_workers=FILE_PARSER_WORKERS, timeout_seconds=FILE_PARSER_TIMEOUT_SECONDS
+        )
+        # Workers are started from the fork server in the background while the embedding model is loading
+        self.file_parser_pool.warm_up()
+        self.embedding_service = EmbeddingService(model_name=EMBEDDING_MODEL_NAME, backend=EMBEDDING_BACKEND)
+        self.embedding_service.warm_up().add_done_callback(self._on_embedding_model_loaded)
+        self.memory_store = LongTermMemoryStore(
+            endpoint=DIAL_ENDPOINT,
+            embedding_service=self.embedding_service,
+            client_pool=self.client_pool,
+            index_kind=MEMORY_INDEX_KIND,
+            ranking=MemoryRanking(
+                similarity=MEMORY_RANKING_SIMILARITY,
+                importance=MEMORY_RANKING_IMPORTANCE,
+                recency=MEMORY_RANKING_RECENCY,
+                recency_half_life_days=MEMORY_RANKING_HALF_LIFE_DAYS,
+            ),
+        )
+
+    @staticmethod
+    def _on_embedding_model_loaded(future: Future) -> None:
+        """Exit the process if the embedding model can't be loaded (e.g. missing backend), memory and RAG tools need it."""
+        if future.cancelled() or future.exception() is None:
+            return
+        print(f"Failed to load embedding model '{EMBEDDING_MODEL_NAME}' ({EMBEDDING_BACKEND}): {future.exception()!r}")
+        os._exit(1)
 
     async def _get_mcp_tools(self, url: str) -> list[BaseTool]:
         try:
@@ -47,17 +102,29 @@ class GeneralPurposeAgentApplication(ChatCompletion):
 
     async def _create_tools(self) -> list[BaseTool]:
         tools: list[BaseTool] = [
-            ImageGenerationTool(endpoint=DIAL_ENDPOINT),
-            FileContentExtractionTool(endpoint=DIAL_ENDPOINT),
+            ImageGenerationTool(endpoint=DIAL_ENDPOINT, client_pool=self.client_pool),
+            FileContentExtractionTool(
+                endpoint=DIAL_ENDPOINT, client_pool=self.client_pool, parser_pool=self.file_parser_pool
+            ),
             RagTool(
                 endpoint=DIAL_ENDPOINT,
                 deployment_name=DEPLOYMENT_NAME,
-                document_cache=DocumentCache.create()
+                document_cache=DocumentCache.create(
+                    max_bytes=RAG_CACHE_MEMORY_MB * 1024 * 1024,
+                    ttl_seconds=RAG_CACHE_TTL_HOURS * 60 * 60,
+                    persist_dir=RAG_CACHE_DIR,
+                    disk_max_bytes=RAG_CACHE_DISK_MB * 1024 * 1024,
+                ),
+                embedding_service=self.embedding_service,
+                client_pool=self.client_pool,
+                parser_pool=self.file_parser_pool,
+                index_kind=RAG_INDEX_KIND,
             ),
             await PythonCodeInterpreterTool.create(
                 mcp_url="http://localhost:8050/mcp",
                 tool_name="execute_code",
-                dial_endpoint=DIAL_ENDPOINT
+                dial_endpoint=DIAL_ENDPOINT,
+                client_pool=self.client_pool,
             ),
 
             #TODO:
@@ -73,25 +140,38 @@ class GeneralPurposeAgentApplication(ChatCompletion):
 
     async def chat_completion(self, request: Request, response: Response) -> None:
         print(request.headers)
-        if not self.tools:
-            self.tools = await self._create_tools()
-
-        with response.create_single_choice() as choice:
-            await GeneralPurposeAgent(
-                endpoint=DIAL_ENDPOINT,
-                system_prompt=SYSTEM_PROMPT,
-                tools=self.tools
-            ).handle_request(
-                choice=choice,
-                deployment_name=DEPLOYMENT_NAME,
-                request=request,
-                response=response,
-            )
+        self.client_pool.bind_user(request.jwt)
+        # Memory recall runs concurrently with tools creation and choice opening, it's awaited by the agent
+        memory_recall = GeneralPurposeAgent.start_memory_recall(
+            self.memory_store, MEMORY_RECALL_TOP_K, request.api_key, request.messages
+        )
+        try:
+            if not self.tools:
+                self.tools = await self._create_tools()
+
+            with response.create_single_choice() as choice:
+                await GeneralPurposeAgent(
+                    endpoint=DIAL_ENDPOINT,
+                    system_prompt=SYSTEM_PROMPT,
+                    tools=self.tools,
+                    client_pool=self.client_pool,
+                    memory_recall=memory_recall,
+                ).handle_request(
+                    choice=choice,
+                    deployment_name=DEPLOYMENT_NAME,
+                    request=request,
+                    response=response,
+                )
+        finally:
+            if memory_recall is not None:
+                memory_recall.cancel()
 
 
-app: DIALApp = DIALApp()
-agent_app = GeneralPurposeAgentApplication()
-app.add_chat_completion(deployment_name="general-purpose-agent", impl=agent_app)
+# File parser workers import the main module as `__mp_main__` (when the app is run as script), they don't serve requests
+if __name__ != "__mp_main__":
+    app: DIALApp = DIALApp()
+    agent_app = GeneralPurposeAgentApplication()
+    app.add_chat_completion(deployment_name="general-purpose-agent", impl=agent_app)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,162 @@
+from typing import Callable
+
+import faiss
+import numpy as np
+
+INDEX_KINDS = ("flat", "sq8", "pq")
+
+
+class VectorIndex:
+    """
+    FAISS inner-product index over L2-normalized embeddings with optional quantized storage.
+
+    - flat: exact, 4 bytes per dimension
+    - sq8: 8-bit scalar quantizer, 1 byte per dimension (4x smaller than flat)
+    - pq: product quantizer, `pq_subquantizers` bytes per vector (32x smaller for 384-d with 48 subquantizers)
+
+    Quantizers are trained on the vectors the index is built with, an index built with fewer than
+    `min_train_size(kind)` vectors falls back to flat (small indexes don't matter for memory, and quantizers trained
+    on a handful of vectors are poor). Quantized search returns `rerank_factor * k` approximate candidates, use
+    `rerank` to order them by exact similarity. An index built with `keep_vectors` keeps float16 copies of quantized
+    vectors (2 bytes per dimension) for `search_reranked`, for owners that don't keep the vectors themselves.
+
+    Row `i` of the index corresponds to the `i`-th added vector, so it can be extended incrementally on append, but
+    must be rebuilt whenever vectors are removed or reordered.
+    """
+
+    SQ8_MIN_TRAIN_SIZE = 256
+    PQ_MIN_TRAIN_SIZE = 10_000
+
+    def __init__(self, index: faiss.Index, kind: str, rerank_factor: int = 4, vectors: np.ndarray | None = None):
+        self.index = index
+        self.kind = kind
+        self.rerank_factor = rerank_factor
+        self.vectors = vectors
+
+    @classmethod
+    def build(
+            cls,
+            embeddings: np.ndarray,
+            kind: str = "flat",
+            rerank_factor: int = 4,
+            pq_subquantizers: int = 48,
+            keep_vectors: bool = False,
+    ) -> 'VectorIndex':
+        """Build index of `kind` (trains quantizers, CPU-heavy for large quantized indexes)."""
+        if kind not in INDEX_KINDS:
+            raise ValueError(f"Unknown index kind '{kind}', expected one of {INDEX_KINDS}")
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        dim = embeddings.shape[1]
+        if kind == "pq" and len(embeddings) < cls.PQ_MIN_TRAIN_SIZE:
+            kind = "sq8"
+        if kind == "sq8" and len(embeddings) < cls.SQ8_MIN_TRAIN_SIZE:
+            kind = "flat"
+
+        if kind == "flat":
+            index = faiss.IndexFlatIP(dim)
+        elif kind == "sq8":
+            index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+            # Widen trained ranges, vectors added later are clipped less
+            index.sq.rangestat_arg = 0.05
+        else:
+            index = faiss.IndexPQ(dim, pq_subquantizers, 8, faiss.METRIC_INNER_PRODUCT)
+        if not index.is_trained:
+            index.train(embeddings)
+
+        vectors = embeddings.astype(np.float16) if keep_vectors and kind != "flat" else None
+        instance = cls(index, kind, rerank_factor, vectors)
+        if len(embeddings):
+            instance.index.add(embeddings)
+        return instance
+
+    @staticmethod
+    def estimate_nbytes(count: int, dim: int, kind: str, pq_subquantizers: int = 48) -> int:
+        """Size of vectors stored in the index of `kind`, taking fallback to flat for small indexes into account."""
+        if kind == "pq" and count >= VectorIndex.PQ_MIN_TRAIN_SIZE:
+            return count * pq_subquantizers
+        if kind in ("pq", "sq8") and count >= VectorIndex.SQ8_MIN_TRAIN_SIZE:
+            return count * dim
+        return count * dim * 4
+
+    @property
+    def is_exact(self) -> bool:
+        return self.kind == "flat"
+
+    @property
+    def size(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def nbytes(self) -> int:
+        vectors_size = self.vectors.nbytes if self.vectors is not None else 0
+        return self.index.ntotal * self.index.sa_code_size() + vectors_size
+
+    def add(self, embeddings: np.ndarray) -> None:
+        """Add already normalized embeddings."""
+        if self.vectors is not None:
+            raise ValueError("Index keeping vectors can't be extended, rebuild it")
+        if len(embeddings):
+            self.index.add(np.ascontiguousarray(embeddings, dtype=np.float32))
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Search k most similar vectors (`rerank_factor * k` candidates if index is quantized) for each of normalized
+        queries.
+
+        Returns:
+            Tuple of (similarities, indices), both of shape (len(queries), k or candidates count), missing hits are -1
+        """
+        if not self.is_exact:
+            k = min(k * self.rerank_factor, self.size)
+        return self.index.search(np.ascontiguousarray(queries, dtype=np.float32), k)
+
+    def search_reranked(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Search k most similar vectors for each of normalized queries, candidates of quantized index are re-ranked
+        against vectors kept with `keep_vectors`.
+
+        Returns:
+            Tuple of (similarities, indices), both of shape (len(queries), k), missing hits are -1
+        """
+        similarities, indices = self.search(queries, k)
+        if self.is_exact:
+            return similarities, indices
+        if self.vectors is None:
+            raise ValueError("Quantized index was built without `keep_vectors`, re-rank it with `rerank`")
+        return rerank(queries, indices, lambda rows: self.vectors[rows], k)
+
+
+def rerank(
+        queries: np.ndarray,
+        candidates: np.ndarray,
+        vectors: Callable[[np.ndarray], np.ndarray],
+        k: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Order candidates of each query by exact similarity and keep top k.
+
+    Args:
+        queries: Normalized queries, shape (q, dim)
+        candidates: Candidate indices from `VectorIndex.search`, shape (q, c), -1 for missing hits
+        vectors: Returns exact normalized vectors of provided indices
+        k: Number of results per query
+
+    Returns:
+        Tuple of (similarities, indices), both of shape (q, min(k, c)), missing hits are -1
+    """
+    k = min(k, candidates.shape[1])
+    similarities = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    indices = np.full((len(queries), k), -1, dtype=np.int64)
+    unique = np.unique(candidates[candidates >= 0])
+    if not len(unique):
+        return similarities, indices
+
+    unique_vectors = np.asarray(vectors(unique), dtype=np.float32)
+    scores = queries.astype(np.float32) @ unique_vectors.T
+    for query_idx, query_candidates in enumerate(candidates):
+        valid = query_candidates[query_candidates >= 0]
+        query_scores = scores[query_idx, np.searchsorted(unique, valid)]
+        order = np.argsort(-query_scores)[:k]
+        similarities[query_idx, :len(order)] = query_scores[order]
+        indices[query_idx, :len(order)] = valid[order]
+    return similarities, indices
@@ -0,0 +1,83 @@
+import platform
+import resource
+import threading
+import time
+from typing import Any
+
+# Backends of the same model: vectors of all of them are in the same space, so they can be mixed with stored ones.
+# - torch: PyTorch (reference)
+# - onnx: ONNX Runtime export of the model, same vectors up to float rounding
+# - onnx-int8: ONNX Runtime with int8 dynamic quantization, cosine similarity to the reference vectors is ~0.99
+# ONNX backends require `optimum[onnxruntime]`.
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+class EmbeddingModelRegistry:
+    """
+    Process-wide registry of embedding models.
+
+    Each model is loaded once per backend (on first use or by warm-up) and the same instance is handed to every
+    consumer. Loading is thread-safe, so it can be triggered from embedding worker threads without blocking the
+    event loop.
+    """
+
+    _models: dict[tuple[str, str], Any] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, model_name: str, backend: str = "torch") -> Any:
+        """Return loaded model, loads it in the calling thread if it is not loaded yet."""
+        key = (model_name, backend)
+        model = cls._models.get(key)
+        if model is not None:
+            return model
+
+        with cls._lock:
+            if key not in cls._models:
+                cls._models[key] = cls._load(model_name, backend)
+            return cls._models[key]
+
+    @classmethod
+    def is_loaded(cls, model_name: str, backend: str = "torch") -> bool:
+        return (model_name, backend) in cls._models
+
+    @staticmethod
+    def _load(model_name: str, backend: str) -> Any:
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}', expected one of {EMBEDDING_BACKENDS}")
+        started_at = time.perf_counter()
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        # Imported lazily: importing torch alone takes seconds and hundreds of MB
+        from sentence_transformers import SentenceTransformer
+        if backend == "torch":
+            model = SentenceTransformer(model_name)
+        elif backend == "onnx":
+            model = SentenceTransformer(model_name, backend="onnx")
+        else:
+            model = SentenceTransformer(
+                model_name, backend="onnx", model_kwargs={"file_name": _int8_model_file()}
+            )
+
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(
+            f"[EmbeddingModelRegistry] Loaded '{model_name}' ({backend}) in {time.perf_counter() - started_at:.2f}s, "
+            f"peak RSS {rss_before / 1024:.0f}MB -> {rss_after / 1024:.0f}MB"
+        )
+        return model
+
+
+def _int8_model_file() -> str:
+    """Int8 ONNX export matching the CPU instruction set (as published with sentence-transformers models)."""
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "onnx/model_qint8_arm64.onnx"
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        flags = ""
+    if "avx512_vnni" in flags:
+        return "onnx/model_qint8_avx512_vnni.onnx"
+    if "avx512" in flags:
+        return "onnx/model_qint8_avx512.onnx"
+    return "onnx/model_quint8_avx2.onnx"
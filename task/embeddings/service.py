@@ -0,0 +1,149 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from task.embeddings.registry import EMBEDDING_BACKENDS, EmbeddingModelRegistry
+from task.embeddings.utils import normalize
+
+
+class EmbeddingService:
+    """
+    Non-blocking embedding service shared by memory and RAG tools.
+
+    Model `encode` runs in a dedicated thread pool (PyTorch releases the GIL during inference), so the event loop
+    keeps serving other requests. Concurrent `embed` calls arriving within `batch_window_ms` are coalesced into a
+    single forward pass. Requests bigger than `max_batch_size` (e.g. document chunks) are encoded slice by slice,
+    so small queries are interleaved with them instead of waiting for the whole document.
+
+    The model is taken from `EmbeddingModelRegistry` inside the worker thread, so it is loaded lazily (or by
+    `warm_up`) without delaying application startup. `backend` selects the inference runtime of the model
+    (see `EMBEDDING_BACKENDS`).
+
+    Search queries are embedded with `embed_queries`, which keeps normalized embeddings of recent queries in LRU
+    cache of `query_cache_size` entries: users and the agent repeat the same queries across turns.
+    """
+
+    def __init__(
+            self,
+            model_name: str,
+            backend: str = "torch",
+            max_batch_size: int = 64,
+            batch_window_ms: float = 5.0,
+            max_workers: int = 1,
+            query_cache_size: int = 4096,
+    ):
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}', expected one of {EMBEDDING_BACKENDS}")
+        self.model_name = model_name
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.batch_window_ms = batch_window_ms
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embedding")
+        self._pending: list[tuple[list[str], asyncio.Future]] = []
+        self._pending_size = 0
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self.query_cache_size = query_cache_size
+        self._query_cache: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.query_cache_hits = 0
+        self.query_cache_misses = 0
+
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        """
+        Embed texts.
+
+        Returns:
+            float32 matrix of shape (len(texts), embedding_dim), row `i` is embedding of `texts[i]`
+        """
+        if len(texts) > self.max_batch_size:
+            parts = []
+            for start in range(0, len(texts), self.max_batch_size):
+                parts.append(await self._run(texts[start:start + self.max_batch_size]))
+            return np.vstack(parts)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((texts, future))
+        self._pending_size += len(texts)
+        if self._pending_size >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window_ms / 1000, self._flush)
+        return await future
+
+    async def embed_queries(self, queries: list[str]) -> np.ndarray:
+        """
+        Embed search queries through LRU cache, only queries missing in cache are encoded (in one batch).
+
+        Returns:
+            L2-normalized float32 matrix of shape (len(queries), embedding_dim)
+        """
+        found: dict[str, np.ndarray] = {}
+        for query in queries:
+            embedding = self._query_cache.get(query)
+            if embedding is not None:
+                self._query_cache.move_to_end(query)
+                found[query] = embedding
+        missing = [query for query in dict.fromkeys(queries) if query not in found]
+        self.query_cache_hits += len(queries) - len(missing)
+        self.query_cache_misses += len(missing)
+
+        if missing:
+            for query, embedding in zip(missing, normalize(await self.embed(missing))):
+                found[query] = embedding
+                self._query_cache[query] = embedding
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return np.vstack([found[query] for query in queries])
+
+    def query_cache_stats(self) -> dict[str, int | float]:
+        requests = self.query_cache_hits + self.query_cache_misses
+        return {
+            "entries": len(self._query_cache),
+            "max_entries": self.query_cache_size,
+            "hits": self.query_cache_hits,
+            "misses": self.query_cache_misses,
+            "hit_rate": self.query_cache_hits / requests if requests else 0.0,
+        }
+
+    def warm_up(self) -> Future:
+        """Start loading the model in the background, doesn't require running event loop."""
+        return self._executor.submit(EmbeddingModelRegistry.get, self.model_name, self.backend)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending, self._pending_size = self._pending, [], 0
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._encode_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _encode_batch(self, batch: list[tuple[list[str], asyncio.Future]]) -> None:
+        texts = [text for request_texts, _ in batch for text in request_texts]
+        try:
+            embeddings = await self._run(texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for request_texts, future in batch:
+            if not future.done():
+                future.set_result(embeddings[offset:offset + len(request_texts)])
+            offset += len(request_texts)
+
+    async def _run(self, texts: list[str]) -> np.ndarray:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._encode, texts)
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        model = EmbeddingModelRegistry.get(self.model_name, self.backend)
+        return np.asarray(model.encode(texts, batch_size=self.max_batch_size), dtype=np.float32)
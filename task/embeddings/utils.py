@@ -0,0 +1,8 @@
+import numpy as np
+
+
+def normalize(embeddings: np.ndarray) -> np.ndarray:
+    """L2-normalize embeddings row-wise, so inner product equals cosine similarity."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return np.ascontiguousarray(embeddings / np.maximum(norms, 1e-12), dtype=np.float32)
@@ -8,12 +8,14 @@ from pydantic import StrictStr
 
 from task.tools.base import BaseTool
 from task.tools.models import ToolCallParams
+from task.utils.dial_client_pool import DialClientPool
 
 
 class DeploymentTool(BaseTool, ABC):
 
-    def __init__(self, endpoint: str):
+    def __init__(self, endpoint: str, client_pool: DialClientPool):
         self.endpoint = endpoint
+        self.client_pool = client_pool
 
     @property
     @abstractmethod
@@ -25,11 +27,7 @@ class DeploymentTool(BaseTool, ABC):
         return {}
 
     async def _execute(self, tool_call_params: ToolCallParams) -> str | Message:
-        client: AsyncDial = AsyncDial(
-            base_url=self.endpoint,
-            api_key=tool_call_params.api_key,
-            api_version='2025-01-01-preview'
-        )
+        client: AsyncDial = self.client_pool.get_client(self.endpoint, tool_call_params.api_key)
 
         arguments = json.loads(tool_call_params.tool_call.function.arguments)
         prompt = arguments.get("prompt")
@@ -38,6 +36,7 @@ class DeploymentTool(BaseTool, ABC):
             messages=[{"role": "user", "content": prompt}],
             stream=True,
             deployment_name=self.deployment_name,
+            api_version=DialClientPool.API_VERSION,
             extra_body={
                 "custom_fields": {
                     "configuration": {**arguments}
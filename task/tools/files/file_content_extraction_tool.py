@@ -5,13 +5,16 @@ from aidial_sdk.chat_completion import Message
 
 from task.tools.base import BaseTool
 from task.tools.models import ToolCallParams
-from task.utils.dial_file_conent_extractor import DialFileContentExtractor
+from task.utils.dial_client_pool import DialClientPool
+from task.utils.dial_file_conent_extractor import DialFileContentExtractor, FileParserPool
 
 
 class FileContentExtractionTool(BaseTool):
 
-    def __init__(self, endpoint: str):
+    def __init__(self, endpoint: str, client_pool: DialClientPool, parser_pool: FileParserPool):
         self.endpoint = endpoint
+        self.client_pool = client_pool
+        self.parser_pool = parser_pool
 
     @property
     def show_in_stage(self) -> bool:
@@ -61,9 +64,9 @@ class FileContentExtractionTool(BaseTool):
 
         stage.append_content(f"## Response: \n")
 
-        content = DialFileContentExtractor(
-            endpoint=self.endpoint,
-            api_key=tool_call_params.api_key
+        content = await DialFileContentExtractor(
+            dial_client=self.client_pool.get_client(self.endpoint, tool_call_params.api_key),
+            parser_pool=self.parser_pool,
         ).extract_text(file_url)
 
         if not content:
@@ -0,0 +1,153 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+import numpy as np
+
+from task.tools.memory._models import MemoryCollection
+
+
+class MemoryCache:
+    """
+    LRU cache of memory collections bounded by their approximate size in bytes.
+
+    - Entries validated against the bucket more than `ttl_seconds` ago are reported as expired, the caller
+      revalidates them and calls `put` with `validated=True` (local writes keep the age, so a worker that keeps
+      writing still picks up changes of other workers)
+    - Concurrent loads of the same key are deduplicated with `single_flight`
+    - The most recently used entry is never evicted, even if it alone exceeds the budget
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[MemoryCollection, int, float]] = OrderedDict()
+        self._size = 0
+        self._loading: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> MemoryCollection | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def peek(self, key: str) -> MemoryCollection | None:
+        """Get entry without counting a hit or changing LRU order."""
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def is_expired(self, key: str) -> bool:
+        entry = self._entries.get(key)
+        return entry is None or time.monotonic() - entry[2] > self.ttl_seconds
+
+    def put(self, key: str, collection: MemoryCollection, validated: bool = False) -> None:
+        """
+        Add or refresh entry (size is recalculated, so call it after collection is mutated).
+
+        `validated` marks the entry as checked against the bucket now, otherwise it keeps the validation time of
+        the entry it replaces (a new entry is expired right away).
+        """
+        previous = self._entries.get(key)
+        validated_at = time.monotonic() if validated else (previous[2] if previous is not None else float("-inf"))
+        self.pop(key)
+        size = collection.approximate_size
+        self._entries[key] = (collection, size, validated_at)
+        self._size += size
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+            self.evictions += 1
+
+    def pop(self, key: str) -> MemoryCollection | None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._size -= entry[1]
+        return entry[0]
+
+    async def single_flight(self, key: str, loader: Callable[[], Awaitable[MemoryCollection]]) -> MemoryCollection:
+        """Run `loader` once for all concurrent callers asking for the same key."""
+        future = self._loading.get(key)
+        if future is None:
+            future = asyncio.ensure_future(loader())
+            self._loading[key] = future
+            future.add_done_callback(lambda _: self._loading.pop(key, None))
+        return await asyncio.shield(future)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def stats(self) -> dict[str, int | float]:
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+
+class SearchResultCache:
+    """
+    LRU cache of raw search hits keyed by (memory folder path, collection version, query, top_k, search options).
+
+    Collection version changes on every mutation, so results of a mutated collection are never returned, stale
+    entries are evicted as least recently used.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, int, str, int, tuple], tuple[np.ndarray, np.ndarray]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+            self, key: str, version: int, query: str, top_k: int, options: tuple = ()
+    ) -> tuple[np.ndarray, np.ndarray] | None:
+        """Returns (similarities, indices) of the query or None."""
+        entry_key = (key, version, query, top_k, options)
+        entry = self._entries.get(entry_key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(entry_key)
+        return entry
+
+    def put(
+            self,
+            key: str,
+            version: int,
+            query: str,
+            top_k: int,
+            similarities: np.ndarray,
+            indices: np.ndarray,
+            options: tuple = (),
+    ) -> None:
+        self._entries[(key, version, query, top_k, options)] = (similarities, indices)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict[str, int | float]:
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
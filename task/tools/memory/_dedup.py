@@ -0,0 +1,78 @@
+import numpy as np
+
+
+def find_similar_pairs(embeddings: np.ndarray, threshold: float, block_size: int = 2048) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Find all pairs (i, j), i < j, of L2-normalized embeddings with cosine similarity above threshold.
+
+    Exact: similarities are computed with blocked matrix products over the upper triangle, so peak memory is
+    `block_size^2` floats regardless of the number of embeddings.
+
+    Returns:
+        Tuple of (rows, cols) index arrays
+    """
+    n = len(embeddings)
+    rows, cols = [], []
+    for row_start in range(0, n, block_size):
+        row_block = embeddings[row_start:row_start + block_size].astype(np.float32, copy=False)
+        for col_start in range(row_start, n, block_size):
+            col_block = embeddings[col_start:col_start + block_size].astype(np.float32, copy=False)
+            similarities = row_block @ col_block.T
+            r, c = np.nonzero(similarities > threshold)
+            r += row_start
+            c += col_start
+            upper = r < c
+            rows.append(r[upper])
+            cols.append(c[upper])
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def connected_components(n: int, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """
+    Vectorized union-find: label every node with the smallest node index of its connected component.
+
+    Alternates min-label propagation along edges with pointer jumping, converges in a few iterations.
+    """
+    labels = np.arange(n)
+    if len(rows) == 0:
+        return labels
+    while True:
+        edge_labels = np.minimum(labels[rows], labels[cols])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, rows, edge_labels)
+        np.minimum.at(new_labels, cols, edge_labels)
+        # Pointer jumping: every node takes label of its label until fixpoint
+        while True:
+            jumped = new_labels[new_labels]
+            if np.array_equal(jumped, new_labels):
+                break
+            new_labels = jumped
+        if np.array_equal(new_labels, labels):
+            return labels
+        labels = new_labels
+
+
+def deduplicate(embeddings: np.ndarray, importance: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    Group memories into clusters of duplicates (connected by similarity above threshold) and keep exactly one
+    memory per cluster: the most important one, the most recent (highest index) one among equally important.
+
+    Result doesn't depend on memory order except for the tie-break.
+
+    Returns:
+        Sorted indices of surviving memories
+    """
+    n = len(embeddings)
+    if n < 2:
+        return np.arange(n)
+
+    rows, cols = find_similar_pairs(embeddings, threshold)
+    labels = connected_components(n, rows, cols)
+
+    # Sort by (cluster, importance, index), the last entry of each cluster survives
+    order = np.lexsort((np.arange(n), importance, labels))
+    sorted_labels = labels[order]
+    is_last = np.append(sorted_labels[1:] != sorted_labels[:-1], True)
+    return np.sort(order[is_last])
@@ -0,0 +1,42 @@
+import asyncio
+from typing import Awaitable, Callable
+
+
+class DeduplicationScheduler:
+    """
+    Runs memory deduplication in background, outside of user requests.
+
+    Collections due for deduplication are scheduled by key (memory shard folder path). A key is queued at most once at a
+    time, and at most `max_concurrency` deduplications run concurrently.
+
+    Jobs get no api key: DIAL Core passes the application a per-request key that expires with the request, while
+    jobs run after it. A job must not make DIAL requests.
+    """
+
+    def __init__(self, deduplicate: Callable[[str], Awaitable[None]], max_concurrency: int = 2):
+        """
+        Args:
+            deduplicate: Coroutine function that deduplicates memories under the key
+            max_concurrency: Max number of deduplications running at the same time
+        """
+        self._deduplicate = deduplicate
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._scheduled: dict[str, asyncio.Task] = {}
+
+    def schedule(self, key: str) -> None:
+        """Schedule deduplication, no-op if it is already scheduled or running for the key."""
+        if key in self._scheduled:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(key))
+        self._scheduled[key] = task
+        task.add_done_callback(lambda _: self._scheduled.pop(key, None))
+
+    def is_scheduled(self, key: str) -> bool:
+        return key in self._scheduled
+
+    async def _run(self, key: str) -> None:
+        async with self._semaphore:
+            try:
+                await self._deduplicate(key)
+            except Exception as e:
+                print(f"Background deduplication failed: {e}")
@@ -0,0 +1,133 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from task.tools.memory._models import MemoryData
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class MemoryInvertedIndex:
+    """
+    Inverted index over memory metadata and content, kept next to the vector index with the same row numbering.
+
+    - category and topic postings (case-insensitive) and importance array select candidate rows for filtered
+      searches without scanning memories
+    - importance and creation time arrays are used by ranking
+    - term postings with term frequencies and document lengths give BM25 scores of content and topics
+
+    Like `VectorIndex`, it can be extended on append but must be rebuilt when memories are removed or reordered.
+    """
+
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self):
+        self._categories: dict[str, list[int]] = defaultdict(list)
+        self._topics: dict[str, list[int]] = defaultdict(list)
+        self._terms: dict[str, tuple[list[int], list[int]]] = defaultdict(lambda: ([], []))
+        self._importance = np.empty(0, dtype=np.float32)
+        self._created_at = np.empty(0, dtype=np.float64)
+        self._lengths = np.empty(0, dtype=np.float32)
+
+    @classmethod
+    def build(cls, memories: list['MemoryData']) -> 'MemoryInvertedIndex':
+        instance = cls()
+        instance.add(memories)
+        return instance
+
+    @property
+    def size(self) -> int:
+        return len(self._importance)
+
+    @property
+    def importance(self) -> np.ndarray:
+        return self._importance
+
+    @property
+    def created_at(self) -> np.ndarray:
+        """Creation time of memories, unix seconds."""
+        return self._created_at
+
+    def add(self, memories: list['MemoryData']) -> None:
+        offset = self.size
+        lengths = []
+        for row, memory in enumerate(memories, start=offset):
+            self._categories[memory.category.lower()].append(row)
+            for topic in set(topic.lower() for topic in memory.topics):
+                self._topics[topic].append(row)
+            tokens = tokenize(" ".join([memory.content, *memory.topics]))
+            lengths.append(len(tokens))
+            for term, frequency in Counter(tokens).items():
+                rows, frequencies = self._terms[term]
+                rows.append(row)
+                frequencies.append(frequency)
+        self._importance = np.concatenate(
+            [self._importance, np.fromiter((m.importance for m in memories), dtype=np.float32, count=len(memories))]
+        )
+        self._created_at = np.concatenate(
+            [self._created_at, np.fromiter((m.created_timestamp for m in memories), dtype=np.float64, count=len(memories))]
+        )
+        self._lengths = np.concatenate([self._lengths, np.asarray(lengths, dtype=np.float32)])
+
+    def candidates(
+            self,
+            categories: list[str] | None = None,
+            topics: list[str] | None = None,
+            min_importance: float | None = None,
+    ) -> np.ndarray | None:
+        """
+        Rows matching any of `categories` and any of `topics` with importance >= `min_importance`.
+
+        Returns:
+            Sorted row indices, or None if no filter is set (all rows match)
+        """
+        result = None
+        for values, postings in ((categories, self._categories), (topics, self._topics)):
+            if not values:
+                continue
+            rows = self._union(postings, values)
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+        if min_importance is not None:
+            if result is None:
+                result = np.flatnonzero(self._importance >= min_importance)
+            else:
+                result = result[self._importance[result] >= min_importance]
+        return result
+
+    def bm25(self, query: str, rows: np.ndarray | None = None) -> np.ndarray:
+        """
+        BM25 scores of the query.
+
+        Returns:
+            Scores of `rows` (of all rows if None), zero for rows not containing any query term
+        """
+        scores = np.zeros(self.size, dtype=np.float32)
+        if self.size == 0:
+            return scores if rows is None else scores[rows]
+        average_length = max(float(self._lengths.mean()), 1.0)
+        for term in set(tokenize(query)):
+            postings = self._terms.get(term)
+            if postings is None:
+                continue
+            term_rows = np.asarray(postings[0])
+            frequencies = np.asarray(postings[1], dtype=np.float32)
+            idf = math.log(1 + (self.size - len(term_rows) + 0.5) / (len(term_rows) + 0.5))
+            norm = self.K1 * (1 - self.B + self.B * self._lengths[term_rows] / average_length)
+            scores[term_rows] += idf * frequencies * (self.K1 + 1) / (frequencies + norm)
+        return scores if rows is None else scores[rows]
+
+    @staticmethod
+    def _union(postings: dict[str, list[int]], values: list[str]) -> np.ndarray:
+        rows = [postings[value.lower()] for value in values if value.lower() in postings]
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(rows))
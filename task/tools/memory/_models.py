@@ -1,5 +1,18 @@
+import asyncio
+import itertools
 from datetime import datetime, UTC
-from pydantic import BaseModel, Field
+
+import numpy as np
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr
+
+from task.embeddings.index import VectorIndex, rerank
+from task.embeddings.utils import normalize
+from task.tools.memory._inverted_index import MemoryInvertedIndex
+
+EMBEDDING_DIM = 384
+
+# Globally unique collection versions, so a reloaded collection never reuses a version of the one it replaces
+_versions = itertools.count()
 
 
 class MemoryData(BaseModel):
@@ -14,23 +27,184 @@ class MemoryData(BaseModel):
     )
     category: str = Field(default="general", description="Memory category")
     topics: list[str] = Field(default_factory=list, description="Related topics")
+    created_at: datetime | None = Field(default=None, description="Creation time, `id` is used for older memories")
+
+    @property
+    def created_timestamp(self) -> float:
+        return self.created_at.timestamp() if self.created_at is not None else float(self.id)
+
+
+class NewMemory(BaseModel):
+    """Memory to store, as provided by the LLM (id is assigned by the store)."""
+    content: str = Field(min_length=1, description="Memory content")
+    importance: float = Field(default=0.5, ge=0.0, le=1.0, description="Importance score between 0 and 1")
+    category: str = Field(default="general", description="Memory category")
+    topics: list[str] = Field(default_factory=list, description="Related topics")
 
 
 class Memory(BaseModel):
-    """Memory entry with embedding."""
+    """Memory entry with embedding (legacy `data.json` format)."""
     data: MemoryData
     embedding: list[float] = Field(description="Vector embedding")
 
 
-class MemoryCollection(BaseModel):
-    """Collection of memories for a user."""
+class LegacyMemoryCollection(BaseModel):
+    """Collection of memories as stored in the legacy single-file `data.json`."""
     memories: list[Memory] = Field(default_factory=list)
     updated_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
     last_deduplicated_at: datetime | None = None
 
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
+class MemorySnapshot(BaseModel):
+    """
+    Memory metadata persisted in the bucket.
+
+    Embeddings are not part of the document, they are stored row by row (in the same order as `memories`)
+    in a packed binary sidecar file described by `embedding_dim` and `embedding_dtype`. Every snapshot gets its own
+    sidecar file, so a rejected (or concurrent) snapshot upload never changes embeddings of the current snapshot.
+    """
+    memories: list[MemoryData] = Field(default_factory=list)
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    last_deduplicated_at: datetime | None = None
+    embedding_dim: int = EMBEDDING_DIM
+    embedding_dtype: str = "<f2"
+    embeddings_file: str = Field(default="embeddings.bin", description="Name of the embeddings sidecar file")
+    compacted_segments: list[str] = Field(
+        default_factory=list,
+        description="Journal segments already folded into this snapshot, must be skipped on replay"
+    )
+
+
+class MemoryJournalSegment(BaseModel):
+    """Delta appended to the memory journal by a single write."""
+    memories: list[MemoryData]
+    embeddings: str = Field(description="Base64 of packed embeddings, same layout as the snapshot sidecar blob")
+    embedding_dim: int = EMBEDDING_DIM
+    embedding_dtype: str = "<f2"
+
+
+class MemoryShard(BaseModel):
+    """Partition of user's memories, stored in its own folder with the snapshot + journal layout."""
+    name: str = Field(description="Folder name under `shards/`, empty for memories stored in the memory folder root")
+    category: str | None = Field(default=None, description="Category of all memories in the shard, None if mixed")
+
+
+class MemoryManifest(BaseModel):
+    """List of user's memory shards, the only file downloaded before shards needed by a request are known."""
+    shards: list[MemoryShard] = Field(default_factory=list)
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+
+
+class MemoryCollection(BaseModel):
+    """
+    Collection of memories for a user, `embeddings[i]` is the L2-normalized vector of `memories[i]`.
+
+    Holds a lazily built search index that is extended on `append` and dropped on `replace`.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    memories: list[MemoryData] = Field(default_factory=list)
+    embeddings: np.ndarray = Field(
+        default_factory=lambda: np.empty((0, EMBEDDING_DIM), dtype=np.float32),
+        description="float32 (float16 with quantized index) matrix of shape (len(memories), embedding_dim)"
+    )
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    last_deduplicated_at: datetime | None = None
+    compacted_segments: list[str] = Field(default_factory=list)
+    journal_segments: list[str] = Field(
+        default_factory=list,
+        description="Journal segments applied to this collection that are not compacted into the snapshot yet"
+    )
+    snapshot_etag: str | None = Field(default=None, description="ETag of the snapshot the collection is based on")
+    embeddings_file: str | None = Field(default=None, description="Embeddings sidecar file of the snapshot")
+    needs_compaction: bool = Field(
+        default=False,
+        description="Memories were replaced in memory only (background deduplication), the next compaction saves them"
+    )
+
+    _index: VectorIndex | None = PrivateAttr(default=None)
+    _index_kind: str = PrivateAttr(default="flat")
+    _inverted_index: MemoryInvertedIndex | None = PrivateAttr(default=None)
+    _compaction_lock: asyncio.Lock = PrivateAttr(default_factory=asyncio.Lock)
+    _version: int = PrivateAttr(default_factory=lambda: next(_versions))
+    _generation: int = PrivateAttr(default=0)
+
+    @property
+    def compaction_lock(self) -> asyncio.Lock:
+        return self._compaction_lock
+
+    @property
+    def version(self) -> int:
+        """Changes on every mutation of memories, used to invalidate search results."""
+        return self._version
+
+    @property
+    def generation(self) -> int:
+        """Changes on every `replace`, a result computed from replaced memories must not be swapped in."""
+        return self._generation
+
+    @property
+    def index(self) -> VectorIndex:
+        if self._index is None:
+            self._index = VectorIndex.build(self.embeddings, kind=self._index_kind)
+        return self._index
+
+    @property
+    def embeddings_dtype(self) -> type:
+        """Quantized indexes re-rank against float16 embeddings (the precision they are persisted with)."""
+        return np.float32 if self._index_kind == "flat" else np.float16
+
+    def use_index(self, kind: str) -> None:
+        """Set kind of the vector index (see `VectorIndex`), index is rebuilt on next access."""
+        self._index_kind = kind
+        self.embeddings = self.embeddings.astype(self.embeddings_dtype, copy=False)
+        self._index = None
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Search k most similar memories for each of normalized queries, candidates of quantized index are re-ranked
+        with exact similarity.
+
+        Returns:
+            Tuple of (similarities, indices), both of shape (len(queries), k)
+        """
+        similarities, indices = self.index.search(queries, k)
+        if self.index.is_exact:
+            return similarities, indices
+        return rerank(queries, indices, lambda rows: self.embeddings[rows], k)
+
+    @property
+    def inverted_index(self) -> MemoryInvertedIndex:
+        if self._inverted_index is None:
+            self._inverted_index = MemoryInvertedIndex.build(self.memories)
+        return self._inverted_index
+
+    @property
+    def approximate_size(self) -> int:
+        """Approximate memory footprint in bytes: embeddings, vectors in the index and memory metadata."""
+        metadata_size = sum(
+            len(m.content) + sum(len(topic) for topic in m.topics) + len(m.category) + 200
+            for m in self.memories
+        )
+        index_size = VectorIndex.estimate_nbytes(len(self.embeddings), self.embeddings.shape[1], self._index_kind)
+        return self.embeddings.nbytes + index_size + metadata_size
+
+    def append(self, memories: list[MemoryData], embeddings: np.ndarray) -> None:
+        """Append memories with their (not necessarily normalized) embeddings."""
+        embeddings = normalize(embeddings)
+        self.memories.extend(memories)
+        self.embeddings = np.vstack([self.embeddings, embeddings.astype(self.embeddings_dtype)])
+        if self._index is not None:
+            self._index.add(embeddings)
+        if self._inverted_index is not None:
+            self._inverted_index.add(memories)
+        self._version = next(_versions)
 
+    def replace(self, memories: list[MemoryData], embeddings: np.ndarray) -> None:
+        """Replace all memories (e.g. after deduplication), indexes are rebuilt on next access."""
+        self.memories = memories
+        self.embeddings = normalize(embeddings).astype(self.embeddings_dtype, copy=False)
+        self._index = None
+        self._inverted_index = None
+        self._version = next(_versions)
+        self._generation += 1
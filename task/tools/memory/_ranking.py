@@ -0,0 +1,60 @@
+import numpy as np
+from pydantic import BaseModel, Field
+
+_SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class MemoryRanking(BaseModel):
+    """
+    Ranking of memory search candidates:
+    `similarity * cosine + importance * importance + recency * 0.5 ** (age_days / recency_half_life_days)`.
+
+    The index returns `candidates_factor * top_k` most similar memories, which are re-scored and cut to `top_k`.
+    With zero `importance` and `recency` weights memories are ranked by similarity only.
+    """
+    similarity: float = Field(default=1.0, ge=0.0)
+    importance: float = Field(default=0.15, ge=0.0)
+    recency: float = Field(default=0.1, ge=0.0)
+    recency_half_life_days: float = Field(default=30.0, gt=0.0)
+    candidates_factor: int = Field(default=4, ge=1)
+
+    @property
+    def enabled(self) -> bool:
+        return self.importance > 0 or self.recency > 0
+
+    def rank(
+            self,
+            similarities: np.ndarray,
+            indices: np.ndarray,
+            importance: np.ndarray,
+            created_at: np.ndarray,
+            now: float,
+            k: int,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Re-score candidates of all queries at once.
+
+        Args:
+            similarities: Cosine similarities of candidates, shape (queries, candidates)
+            indices: Memory indices of candidates, -1 for missing hits
+            importance: Importance of every memory in the collection
+            created_at: Creation time (unix seconds) of every memory in the collection
+            now: Current unix time
+            k: Number of results per query
+
+        Returns:
+            Tuple of (scores, indices), both of shape (queries, min(k, candidates)), missing hits are -1
+        """
+        valid = indices >= 0
+        rows = np.where(valid, indices, 0)
+        age_days = np.maximum(now - created_at[rows], 0.0) / _SECONDS_PER_DAY
+        scores = (
+            self.similarity * similarities
+            + self.importance * importance[rows]
+            + self.recency * np.power(0.5, age_days / self.recency_half_life_days)
+        ).astype(np.float32)
+        scores[~valid] = -np.inf
+
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        ranked_indices = np.take_along_axis(indices, order, axis=1)
+        return np.take_along_axis(scores, order, axis=1), ranked_indices
@@ -0,0 +1,22 @@
+import numpy as np
+
+# Little-endian float16: half the size of float32, precision is far beyond what cosine similarity ranking needs
+EMBEDDINGS_DTYPE = "<f2"
+
+
+def pack_embeddings(embeddings: np.ndarray) -> bytes:
+    """Pack embeddings matrix into a contiguous row-major blob."""
+    return np.ascontiguousarray(embeddings, dtype=EMBEDDINGS_DTYPE).tobytes()
+
+
+def unpack_embeddings(blob: bytes, count: int, dim: int, dtype: str) -> np.ndarray:
+    """
+    Unpack embeddings blob into float32 matrix of shape (count, dim).
+
+    Raises:
+        ValueError: if blob size doesn't match the expected shape (e.g. snapshot and blob are out of sync)
+    """
+    matrix = np.frombuffer(blob, dtype=dtype)
+    if matrix.size != count * dim:
+        raise ValueError(f"Embeddings blob has {matrix.size} values, expected {count}x{dim}")
+    return matrix.reshape(count, dim).astype(np.float32)
@@ -0,0 +1,72 @@
+import asyncio
+from typing import Awaitable, Callable
+
+import numpy as np
+
+from task.tools.memory._models import MemoryData
+
+
+class MemoryWriteQueue:
+    """
+    Write-behind queue of new memories.
+
+    Writes are queued by key (memory shard folder path) and flushed by a single background task per key, so mutations of
+    the same collection never race. All writes queued while a flush is running (or within `flush_delay_ms` after
+    the first one) are merged into the next flush, e.g. several `store_memory` tool calls of one turn are persisted
+    with one upload. `submit` returns once its memories are persisted (and raises if the flush failed).
+
+    Every write carries the api key of its request. A batch is flushed with the key of its newest write: keys are
+    per-request and the key of the first submitter may have expired by the time later writes are flushed.
+    """
+
+    def __init__(self, flush: Callable[[str, str, list[MemoryData], np.ndarray], Awaitable[None]], flush_delay_ms: float = 5.0):
+        """
+        Args:
+            flush: Coroutine function that persists memories (with their embeddings) under the key with provided api key
+            flush_delay_ms: How long the first write waits for others to join its flush
+        """
+        self._flush = flush
+        self.flush_delay_ms = flush_delay_ms
+        self._pending: dict[str, list[tuple[list[MemoryData], np.ndarray, str, asyncio.Future]]] = {}
+        self._flushers: dict[str, asyncio.Task] = {}
+        self.writes = 0
+        self.flushes = 0
+
+    async def submit(self, key: str, api_key: str, memories: list[MemoryData], embeddings: np.ndarray) -> None:
+        """Queue memories and wait until they are persisted."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(key, []).append((memories, embeddings, api_key, future))
+        self.writes += 1
+        if key not in self._flushers:
+            task = asyncio.get_running_loop().create_task(self._run(key))
+            self._flushers[key] = task
+        # Write is completed even if the caller is cancelled
+        await asyncio.shield(future)
+
+    def pending(self, key: str) -> int:
+        return len(self._pending.get(key, []))
+
+    async def _run(self, key: str) -> None:
+        try:
+            await asyncio.sleep(self.flush_delay_ms / 1000)
+            while self._pending.get(key):
+                batch = self._pending.pop(key)
+                self.flushes += 1
+                _, _, api_key, _ = batch[-1]
+                try:
+                    await self._flush(
+                        key,
+                        api_key,
+                        [memory for memories, _, _, _ in batch for memory in memories],
+                        np.vstack([embeddings for _, embeddings, _, _ in batch]),
+                    )
+                except Exception as e:
+                    for _, _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for _, _, _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+        finally:
+            self._flushers.pop(key, None)
@@ -41,6 +41,6 @@ class DeleteMemoryTool(BaseTool):
         # 1. Call `memory_store` `delete_all_memories` (we will implement logic in `memory_store` later
         # 2. Add result to stage
         # 3. Return result
-        result = await self.memory_store.delete_all_memories()
+        result = await self.memory_store.delete_all_memories(api_key=tool_call_params.api_key)
         tool_call_params.stage.append_content(result)
         return result
\ No newline at end of file
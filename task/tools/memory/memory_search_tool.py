@@ -27,57 +27,112 @@ class SearchMemoryTool(BaseTool):
     def description(self) -> str:
         # TODO: provide tool description that will help LLM to understand when to use this tools and cover 'tricky'
         #  moments (not more 1024 chars)
-        return "Searches long-term memories about the user. The tool takes a search query and returns relevant memories based on semantic similarity. " \
-        "Use this tool to find specific information about the user that may be stored in their long-term memory."
+        return "Searches long-term memories about the user. The tool takes search queries and returns relevant memories based on semantic similarity. " \
+        "Use this tool to find specific information about the user that may be stored in their long-term memory. " \
+        "When you need several pieces of information (e.g. location, job and preferences), pass them as separate `queries` in one call instead of calling the tool several times."
 
     @property
     def parameters(self) -> dict[str, Any]:
         # TODO: provide tool parameters JSON Schema:
-        #  - query is string, description: "The search query. Can be a question or keywords to find relevant memories", required
-        #  - top_k is integer, description: "Number of most relevant memories to return.", minimum is 1, maximum is 20, default is 5
+        #  - queries is array of strings, description: "Search queries, one per piece of information. Each can be a question or keywords to find relevant memories", minItems is 1, maxItems is 10, required
+        #  - top_k is integer, description: "Number of most relevant memories to return per query.", minimum is 1, maximum is 20, default is 5
+        #  - categories is array of strings, description: "Only return memories of these categories", optional
+        #  - topics is array of strings, description: "Only return memories with any of these topics", optional
+        #  - min_importance is number, description: "Only return memories with at least this importance", minimum is 0, maximum is 1, optional
+        #  - hybrid is boolean, description: "Also match exact words of the queries (names, places)", default is false
         return {
             "type": "object",
             "properties": {
-                "query": {
-                    "type": "string",
-                    "description": "The search query. Can be a question or keywords to find relevant memories.",
+                "queries": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Search queries, one per piece of information. Each can be a question or keywords to find relevant memories.",
+                    "minItems": 1,
+                    "maxItems": 10,
                 },
                 "top_k": {
                     "type": "integer",
-                    "description": "Number of most relevant memories to return.",
+                    "description": "Number of most relevant memories to return per query.",
                     "minimum": 1,
                     "maximum": 20,
                     "default": 5,
                 },
+                "categories": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Only return memories of these categories (e.g., 'preferences', 'personal_info', 'goals', 'plans', 'context').",
+                },
+                "topics": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Only return memories with any of these topics.",
+                },
+                "min_importance": {
+                    "type": "number",
+                    "description": "Only return memories with at least this importance.",
+                    "minimum": 0,
+                    "maximum": 1,
+                },
+                "hybrid": {
+                    "type": "boolean",
+                    "description": "Also match exact words of the queries. Use it when searching for names, places or other exact terms.",
+                    "default": False,
+                },
             },
-            "required": ["query"],
+            "required": ["queries"],
         }
 
 
     async def _execute(self, tool_call_params: ToolCallParams) -> str:
         #TODO:
         # 1. Load arguments with `json`
-        # 2. Get `query` from arguments
+        # 2. Get `queries` from arguments (single `query` is supported as well)
         # 3. Get `top_k` from arguments, default is 5
-        # 4. Call `memory_store` `search_memories` (we will implement logic in `memory_store` later)
-        # 5. If results are empty then set `final_result` as "No memories found.",
-        #    otherwise iterate through results and collect content, category and topics (if preset) in markdown format
-        # 6. Add result to stage as markdown text
-        # 7. Return result
+        # 4. Get optional filters `categories`, `topics`, `min_importance` and `hybrid` flag from arguments
+        # 5. Call `memory_store` `search_memories_multi` and log hit rates of memory caches (`cache_stats`)
+        # 6. If results are empty then set `final_result` as "No memories found.",
+        #    otherwise iterate through results and collect content, category and topics (if preset) in markdown format,
+        #    grouped by query when there are several queries
+        # 7. Add result to stage as markdown text
+        # 8. Return result
         args = json.loads(tool_call_params.tool_call.function.arguments)
-        query = args["query"]
+        queries = args["queries"] if "queries" in args else [args["query"]]
         top_k = args.get("top_k", 5)
-        search_results: list[MemoryData] = await self.memory_store.search_memories(query=query, top_k=top_k)
-        if not search_results:
+        search_results: dict[str, list[MemoryData]] = await self.memory_store.search_memories_multi(
+            api_key=tool_call_params.api_key,
+            queries=queries,
+            top_k=top_k,
+            categories=args.get("categories"),
+            topics=args.get("topics"),
+            min_importance=args.get("min_importance"),
+            hybrid=args.get("hybrid", False),
+        )
+        stats = self.memory_store.cache_stats()
+        print(
+            f"[SearchMemoryTool] Searched {len(queries)} queries, memory caches: collections "
+            f"{stats['collections']['entries']} entries, "
+            f"{stats['collections']['size_bytes'] / 1024 ** 2:.1f}/{stats['collections']['max_bytes'] / 1024 ** 2:.0f} MB, "
+            f"hit rate {stats['collections']['hit_rate']:.2f}, {stats['collections']['evictions']} evictions; "
+            f"search results hit rate {stats['search_results']['hit_rate']:.2f}; "
+            f"query embeddings hit rate {stats['query_embeddings']['hit_rate']:.2f}"
+        )
+        if not any(search_results.values()):
             final_result = "No memories found."
         else:
             final_result = "Found the following relevant memories:\n\n"
-            for idx, memory in enumerate(search_results, start=1):
-                final_result += f"### Memory {idx}\n"
-                final_result += f"- **Content**: {memory.content}\n"
-                final_result += f"- **Category**: {memory.category}\n"
-                if memory.topics:
-                    final_result += f"- **Topics**: {', '.join(memory.topics)}\n"
-                final_result += "\n"
+            idx = 1
+            for query, memories in search_results.items():
+                if len(search_results) > 1:
+                    final_result += f"## Query: {query}\n\n"
+                    if not memories:
+                        final_result += "No new memories found.\n\n"
+                for memory in memories:
+                    final_result += f"### Memory {idx}\n"
+                    final_result += f"- **Content**: {memory.content}\n"
+                    final_result += f"- **Category**: {memory.category}\n"
+                    if memory.topics:
+                        final_result += f"- **Topics**: {', '.join(memory.topics)}\n"
+                    final_result += "\n"
+                    idx += 1
         tool_call_params.stage.append_content(final_result)
-        return final_result
\ No newline at end of file
+        return final_result
@@ -1,136 +1,767 @@
 import os
 os.environ['OMP_NUM_THREADS'] = '1'
 
-import json
+import asyncio
+import base64
+import re
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime, UTC, timedelta
 import numpy as np
 import faiss
-from aidial_client import AsyncDial
-from sentence_transformers import SentenceTransformer
+from aidial_client import AsyncDial, DialException, EtagMismatchError, ResourceNotFoundError
 
-from task.tools.memory._models import Memory, MemoryData, MemoryCollection
+from task.embeddings.index import INDEX_KINDS
+from task.embeddings.service import EmbeddingService
+from task.embeddings.utils import normalize
+from task.tools.memory._cache import MemoryCache, SearchResultCache
+from task.tools.memory._dedup import deduplicate
+from task.tools.memory._dedup_scheduler import DeduplicationScheduler
+from task.tools.memory._models import (
+    LegacyMemoryCollection, MemoryData, MemoryCollection, MemoryJournalSegment, MemoryManifest, MemoryShard,
+    MemorySnapshot, NewMemory
+)
+from task.tools.memory._ranking import MemoryRanking
+from task.tools.memory._storage import EMBEDDINGS_DTYPE, pack_embeddings, unpack_embeddings
+from task.tools.memory._write_queue import MemoryWriteQueue
+from task.utils.dial_client_pool import DialClientPool
 
 
 class LongTermMemoryStore:
     """
     Manages long-term memory storage for users.
 
-    Storage format: Single JSON file per user in DIAL bucket
-    - File: {user_id}/long-memories.json
-    - Caching: In-memory cache with conversation_id as key
-    - Deduplication: O(n log n) using FAISS batch search
+    Storage format: `__long-memories` folder in appdata of the agent in DIAL bucket
+    - Memories of all categories are stored in the memory folder root until it grows over `MAX_SHARD_SIZE`, then
+      they are split into category shards. Later memories of these categories are appended to the latest shard of
+      the category (a new one is started when it reaches `MAX_SHARD_SIZE`), other categories stay in the root
+    - manifest.json: list of category shards, there is no manifest until the first split
+    - shards/<name>/: one folder per category shard. Each shard folder (and the memory folder root) contains:
+      - memories.json: memories metadata (MemoryData list, timestamps, embeddings layout), uploaded conditionally
+        on the ETag it was loaded with, so a worker with stale memories never overwrites newer ones
+      - embeddings-<id>.bin: packed float16 embeddings matrix of the snapshot, loaded with single `np.frombuffer`
+        (`embeddings.bin` for snapshots written before versioned sidecar files)
+      - journal/*.json: append-only segments written by each add, replayed on top of the snapshot on load and
+        compacted into it together with deduplication (or when the journal grows too long)
+      - data.json (root only): legacy single-file format (embeddings as JSON lists), migrated on first load
+    - Loading: the root is always loaded, category shards are loaded lazily, a search filtered by categories
+      downloads only shards of these categories
+    - Caching: Byte-bounded LRU cache with shard folder path as key, cached collections keep prebuilt FAISS index.
+      Entries are revalidated against snapshot ETag and journal listing after TTL since the last validation (local
+      writes don't extend it), concurrent loads are deduplicated.
+      The manifest is re-downloaded after the same TTL and before appending to a category shard
+    - Search: FAISS index over normalized embeddings (optionally quantized, with exact re-ranking); filtered (category/topics/importance) and hybrid searches
+      take candidate rows and BM25 scores from an inverted index kept next to it
+    - Deduplication: exact clustering of all pairs above the similarity threshold (blocked matrix products and
+      union-find), scheduled in background per shard when a loaded shard is due. The background job only swaps
+      the result into the cached collection, it is saved by the next compaction made in a request
     """
 
     DEDUP_INTERVAL_HOURS = 24
+    DEDUP_SIMILARITY_THRESHOLD = 0.75
+    MEMORY_FOLDER = "__long-memories"
+    SNAPSHOT_FILE = "memories.json"
+    EMBEDDINGS_FILE = "embeddings.bin"
+    LEGACY_FILE = "data.json"
+    JOURNAL_FOLDER = "journal"
+    MANIFEST_FILE = "manifest.json"
+    SHARDS_FOLDER = "shards"
+    MAX_SHARD_SIZE = 2000
+    MANIFEST_UPDATE_ATTEMPTS = 5
+    MAX_CACHED_MANIFESTS = 10_000
+    MAX_JOURNAL_SEGMENTS = 50
+    LOAD_ATTEMPTS = 3
+    LEXICAL_WEIGHT = 0.3
 
-    def __init__(self, endpoint: str):
+    def __init__(
+            self,
+            endpoint: str,
+            embedding_service: EmbeddingService,
+            client_pool: DialClientPool,
+            cache_max_bytes: int = 256 * 1024 * 1024,
+            cache_ttl_seconds: float = 60,
+            max_concurrent_deduplications: int = 2,
+            write_flush_delay_ms: float = 5.0,
+            search_cache_max_entries: int = 10_000,
+            index_kind: str = "flat",
+            ranking: MemoryRanking | None = None,
+    ):
         #TODO:
         # 1. Set endpoint
-        # 2. Create SentenceTransformer as model, model name is `all-MiniLM-L6-v2`
-        # 3. Create cache, doct of str and MemoryCollection (it is imitation of cache, normally such cache should be set aside)
-        # 4. Make `faiss.omp_set_num_threads(1)` (without this set up you won't be able to work in debug mode in `_deduplicate_fast` method
+        # 2. Set embedding service (shared with RAG tool, runs `all-MiniLM-L6-v2` off the event loop)
+        # 3. Create cache bounded by `cache_max_bytes`, entries older than `cache_ttl_seconds` are revalidated,
+        #    and search results cache (query embeddings are cached by embedding service)
+        #    Collections use `index_kind` vector index: 'flat' (exact) or quantized 'sq8'/'pq' with exact re-ranking
+        #    Search candidates are ranked by similarity, importance and recency with `ranking` weights
+        # 4. Create write queue, concurrent adds to the same shard are merged into one journal segment
+        #    Cache manifests of category shards (LRU bounded), concurrent manifest downloads are deduplicated
+        # 5. Make `faiss.omp_set_num_threads(1)` (without this set up you won't be able to work in debug mode in `_deduplicate_fast` method
         self.endpoint = endpoint
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.cache: dict[str, MemoryCollection] = {}
+        self.embedding_service = embedding_service
+        self.client_pool = client_pool
+        self.cache = MemoryCache(max_bytes=cache_max_bytes, ttl_seconds=cache_ttl_seconds)
+        self.search_cache = SearchResultCache(max_entries=search_cache_max_entries)
+        if index_kind not in INDEX_KINDS:
+            raise ValueError(f"Unknown index kind '{index_kind}', expected one of {INDEX_KINDS}")
+        self.index_kind = index_kind
+        self.ranking = ranking or MemoryRanking()
+        self.dedup_scheduler = DeduplicationScheduler(
+            deduplicate=self._deduplicate_in_background,
+            max_concurrency=max_concurrent_deduplications,
+        )
+        self.write_queue = MemoryWriteQueue(flush=self._persist_memories, flush_delay_ms=write_flush_delay_ms)
+        self._manifests: OrderedDict[str, tuple[MemoryManifest, float]] = OrderedDict()
+        self._manifest_loads: dict[str, asyncio.Future] = {}
         faiss.omp_set_num_threads(1)
 
-    async def _get_memory_file_path(self, dial_client: AsyncDial) -> str:
-        """Get the path to the memory file in DIAL bucket."""
-        #TODO:
-        # 1. Get DIAL app home path
-        # 2. Return string with path in such format: `files/{bucket_with_app_home}/__long-memories/data.json`
-        #    The memories will persist in appdata for this agent in `__long-memories` folder and `data.json` file
-        #    (You will be able to check it also in Chat UI in attachments)
-        app_home = await dial_client.my_appdata_home()
-        return f"files/{app_home}/__long-memories/data.json"
-
-    async def _load_memories(self, api_key: str) -> MemoryCollection:
-        #TODO:
-        # 1. Create AsyncDial client (api_version is 2025-01-01-preview)
-        # 2. Get memory file path
-        # 3. Check cache: cache is dict of str and MemoryCollection, for the key we will use `memory file path` to make
-        #    it simple. Such key will be unique for user and will allow to access memories across different
-        #    conversations and only user can access them. In case if cache is present return its MemoryCollection.
-        # ---
-        # Below is logic when cache is not present:
-        # 4. Open try-except block:
-        #   - in try:
-        #       - download file content
-        #       - in response get content and decode it with 'utf-8'
-        #       - load content with `json`
-        #       - create MemoryCollection (it is pydentic model, use `model_validate` method)
-        #   - in except:
-        #       - create MemoryCollection (it will have empty memories, set up time for updated_at, more detailed take
-        #         a look at MemoryCollection pydentic model and it Fields)
-        # 5. Return created MemoryCollection
-        client = AsyncDial(base_url=self.endpoint, api_key=api_key, api_version="2025-01-01-preview")
-        memory_file_path = await self._get_memory_file_path(client)
-        if memory_file_path in self.cache:
+    async def _get_memory_folder_path(self, api_key: str) -> str:
+        """Get the path to the memory folder in DIAL bucket (appdata of this agent)."""
+        app_home = await self.client_pool.get_appdata_home(self.endpoint, api_key)
+        return f"files/{app_home}/{self.MEMORY_FOLDER}"
+
+    def _get_shard_path(self, folder_path: str, shard: MemoryShard) -> str:
+        return f"{folder_path}/{self.SHARDS_FOLDER}/{shard.name}" if shard.name else folder_path
+
+    def _split_shard_path(self, shard_path: str) -> tuple[str, str]:
+        """Memory folder path and shard name (empty for the memory folder root) of the shard folder path."""
+        folder_path, separator, name = shard_path.rpartition(f"/{self.SHARDS_FOLDER}/")
+        return (folder_path, name) if separator else (shard_path, "")
+
+    @staticmethod
+    def _new_shard_name(category: str) -> str:
+        slug = re.sub(r"[^a-z0-9]+", "-", category.lower()).strip("-")[:40] or "shard"
+        return f"{slug}-{uuid.uuid4().hex[:8]}"
+
+    @staticmethod
+    def _shard_matches(shard: MemoryShard, categories: list[str] | None) -> bool:
+        """Whether the shard can contain memories of any of `categories` (None matches all shards)."""
+        if not categories or shard.category is None:
+            return True
+        return shard.category.lower() in {category.lower() for category in categories}
+
+    async def _load_manifest(self, api_key: str, folder_path: str, refresh: bool = False) -> MemoryManifest:
+        """
+        Load manifest of user's category shards from cache or DIAL bucket, cached manifest is re-downloaded after
+        cache TTL (or right away with `refresh`). Concurrent downloads of the same manifest are deduplicated.
+
+        Users without a manifest (until the memory folder root is split) have no category shards.
+        """
+        cached = self._manifests.get(folder_path)
+        if not refresh and cached is not None and time.monotonic() - cached[1] <= self.cache.ttl_seconds:
+            self._manifests.move_to_end(folder_path)
+            return cached[0]
+        future = self._manifest_loads.get(folder_path)
+        if future is None:
+            client = self.client_pool.get_client(self.endpoint, api_key)
+            future = asyncio.ensure_future(
+                self._fetch_manifest(client, folder_path, cached[0] if cached is not None else None)
+            )
+            self._manifest_loads[folder_path] = future
+            future.add_done_callback(lambda _: self._manifest_loads.pop(folder_path, None))
+        return await asyncio.shield(future)
+
+    async def _fetch_manifest(
+            self, client: AsyncDial, folder_path: str, cached: MemoryManifest | None) -> MemoryManifest:
+        try:
+            manifest, _ = await self._download_manifest(client, folder_path)
+        except Exception as e:
+            if cached is not None:
+                print(f"Failed to load memory manifest: {e}. Using cached manifest.")
+                return cached
+            print(f"Failed to load memory manifest: {e}. Using memory folder root only.")
+            return MemoryManifest()
+        manifest = manifest or MemoryManifest()
+        self._cache_manifest(folder_path, manifest)
+        return manifest
+
+    def _cache_manifest(self, folder_path: str, manifest: MemoryManifest) -> None:
+        self._manifests[folder_path] = (manifest, time.monotonic())
+        self._manifests.move_to_end(folder_path)
+        while len(self._manifests) > self.MAX_CACHED_MANIFESTS:
+            self._manifests.popitem(last=False)
+
+    async def _download_manifest(
+            self, client: AsyncDial, folder_path: str) -> tuple[MemoryManifest | None, str | None]:
+        """
+        Download manifest together with its ETag (requested first, the download is conditional on it).
+
+        Returns:
+            Tuple of (manifest, ETag), (None, None) if there is no manifest
+        """
+        manifest_path = f"{folder_path}/{self.MANIFEST_FILE}"
+        for _ in range(self.MANIFEST_UPDATE_ATTEMPTS):
+            etag = await self._get_etag(client, manifest_path)
+            if etag is None:
+                return None, None
+            try:
+                response = await client.files.download(manifest_path, etag_if_match=etag)
+            except (EtagMismatchError, ResourceNotFoundError):
+                # Changed between the requests
+                continue
+            manifest = MemoryManifest.model_validate_json(await response.aget_content())
+            # The memory folder root is always loaded, manifests written before root-first layout list it
+            manifest.shards = [shard for shard in manifest.shards if shard.name]
+            return manifest, etag
+        raise EtagMismatchError(message="Memory manifest keeps changing")
+
+    async def _upload_manifest(
+            self, client: AsyncDial, folder_path: str, manifest: MemoryManifest, etag: str | None) -> None:
+        """
+        Upload manifest if the bucket still has the manifest of the ETag (or no manifest if it is None).
+
+        Raises:
+            EtagMismatchError: if the manifest was changed by another worker
+        """
+        await client.files.upload(
+            url=f"{folder_path}/{self.MANIFEST_FILE}",
+            file=(self.MANIFEST_FILE, manifest.model_dump_json().encode('utf-8'), "application/json"),
+            etag_if_match=etag,
+            etag_if_none_match=None if etag else "*",
+        )
+
+    async def _update_manifest(
+            self,
+            api_key: str,
+            folder_path: str,
+            add: list[MemoryShard] | None = None,
+            remove: set[str] | None = None,
+    ) -> MemoryManifest:
+        """
+        Add shards to the manifest or remove shards (by name) from it, the manifest is created with the first shard
+        and removed with the last one.
+
+        The change is applied to the manifest downloaded right before and uploaded conditionally on its ETag, so an
+        update made by another worker meanwhile is never overwritten (retried up to `MANIFEST_UPDATE_ATTEMPTS` times).
+
+        Raises:
+            EtagMismatchError: if all attempts conflicted with other updates
+        """
+        add, remove = add or [], remove or set()
+        client = self.client_pool.get_client(self.endpoint, api_key)
+        for _ in range(self.MANIFEST_UPDATE_ATTEMPTS):
+            manifest, etag = await self._download_manifest(client, folder_path)
+            manifest = manifest or MemoryManifest()
+            known = {shard.name for shard in manifest.shards}
+            manifest.shards = [shard for shard in manifest.shards if shard.name not in remove]
+            manifest.shards.extend(shard for shard in add if shard.name not in known)
+            manifest.updated_at = datetime.now(UTC)
+            try:
+                if manifest.shards:
+                    await self._upload_manifest(client, folder_path, manifest, etag)
+                elif etag is not None:
+                    await client.files.delete(f"{folder_path}/{self.MANIFEST_FILE}", etag_if_match=etag)
+            except (EtagMismatchError, ResourceNotFoundError):
+                print("Memory manifest was updated concurrently. Retrying...")
+                continue
+            self._cache_manifest(folder_path, manifest)
+            return manifest
+        raise EtagMismatchError(message="Failed to update memory manifest")
+
+    async def _load_shards(self, api_key: str, categories: list[str] | None = None) -> list[tuple[str, MemoryCollection]]:
+        """
+        Load the memory folder root and category shards that can contain memories of any of `categories` (all shards
+        if None) concurrently.
+
+        Returns:
+            List of (shard folder path, memory collection), the memory folder root first
+        """
+        folder_path = await self._get_memory_folder_path(api_key)
+        manifest, root = await asyncio.gather(
+            self._load_manifest(api_key, folder_path),
+            self._load_shard(api_key, folder_path),
+        )
+        shard_paths = [
+            self._get_shard_path(folder_path, shard)
+            for shard in manifest.shards
+            if self._shard_matches(shard, categories)
+        ]
+        collections = await asyncio.gather(*[self._load_shard(api_key, shard_path) for shard_path in shard_paths])
+        return [(folder_path, root), *zip(shard_paths, collections)]
+
+    async def _get_write_shard(self, api_key: str, folder_path: str, category: str) -> str:
+        """
+        Get folder path of the shard new memories of the category are appended to.
+
+        Memories of categories without shards go to the memory folder root. Otherwise they go to the latest shard
+        of the category, a new shard is created when it reached `MAX_SHARD_SIZE`.
+        """
+        manifest = await self._load_manifest(api_key, folder_path)
+        shards = [
+            shard for shard in manifest.shards
+            if shard.category is not None and shard.category.lower() == category.lower()
+        ]
+        if not shards:
+            return folder_path
+        shard_path = self._get_shard_path(folder_path, shards[-1])
+        if len((await self._load_shard(api_key, shard_path)).memories) < self.MAX_SHARD_SIZE:
+            return shard_path
+        shard = MemoryShard(name=self._new_shard_name(category), category=category)
+        print(f"Creating memory shard {shard.name}...")
+        await self._update_manifest(api_key, folder_path, add=[shard])
+        return self._get_shard_path(folder_path, shard)
+
+    async def _split_root(self, api_key: str, folder_path: str, root: MemoryCollection) -> None:
+        """
+        Move memories of the memory folder root to new category shards once it grows over `MAX_SHARD_SIZE`.
+
+        Shards are uploaded and added to the manifest before the memories are removed from the root, so a concurrent
+        reader may see them twice (search returns each memory once) but never misses them. If the root was changed
+        by another worker meanwhile, the new shards are removed again and the split is left to a later write.
+        """
+        client = self.client_pool.get_client(self.endpoint, api_key)
+        count = len(root.memories)
+        rows_by_category: dict[str, list[int]] = {}
+        for row, memory in enumerate(root.memories[:count]):
+            rows_by_category.setdefault(memory.category.lower(), []).append(row)
+
+        new_shards: list[tuple[MemoryShard, MemoryCollection]] = []
+        for rows in rows_by_category.values():
+            for start in range(0, len(rows), self.MAX_SHARD_SIZE):
+                shard_rows = rows[start:start + self.MAX_SHARD_SIZE]
+                category = root.memories[shard_rows[0]].category
+                new_shards.append((
+                    MemoryShard(name=self._new_shard_name(category), category=category),
+                    MemoryCollection(
+                        memories=[root.memories[row] for row in shard_rows],
+                        embeddings=root.embeddings[shard_rows],
+                        last_deduplicated_at=root.last_deduplicated_at,
+                    ),
+                ))
+        print(f"Splitting {count} memories into {len(new_shards)} shards...")
+        await asyncio.gather(*[
+            self._upload_snapshot(client, self._get_shard_path(folder_path, shard), collection)
+            for shard, collection in new_shards
+        ])
+        names = {shard.name for shard, _ in new_shards}
+        await self._update_manifest(api_key, folder_path, add=[shard for shard, _ in new_shards])
+
+        root.replace(root.memories[count:], root.embeddings[count:])
+        try:
+            await self._save_memories(api_key, folder_path, root)
+        except EtagMismatchError:
+            print("Memories were changed by another worker. Reverting split...")
+            await self._update_manifest(api_key, folder_path, remove=names)
+            await asyncio.gather(*[
+                self._delete_shard(client, self._get_shard_path(folder_path, shard)) for shard, _ in new_shards
+            ])
+            return
+        print("Memories split.")
+
+    async def _load_shard(self, api_key: str, shard_path: str) -> MemoryCollection:
+        """
+        Load memories of a shard from cache or DIAL bucket.
+
+        The shard folder path is used as cache key: it is unique per user and allows to access memories across
+        different conversations. Expired entries are revalidated against the bucket, concurrent loads of the same
+        shard share a single download.
+        """
+        client = self.client_pool.get_client(self.endpoint, api_key)
+        cached = self.cache.get(shard_path)
+        if cached is not None and not self.cache.is_expired(shard_path):
             print("Memories loaded from cache.")
-            return self.cache[memory_file_path]
-        
+            memory_collection = cached
+        else:
+            memory_collection = await self.cache.single_flight(
+                shard_path,
+                lambda: self._fetch_memories(client, shard_path, cached)
+            )
+
+        if self._needs_deduplication(memory_collection):
+            self.dedup_scheduler.schedule(shard_path)
+        return memory_collection
+
+    async def _fetch_memories(
+            self, client: AsyncDial, folder_path: str, cached: MemoryCollection | None) -> MemoryCollection:
+        """
+        Revalidate cached memories or download them from DIAL bucket.
+
+        Journal segments are replayed on top of the base snapshot, memories stored in the legacy `data.json` format
+        are migrated on first load.
+        """
+        if cached is not None:
+            try:
+                if await self._revalidate(client, folder_path, cached):
+                    print("Cached memories revalidated.")
+                    self.cache.put(folder_path, cached, validated=True)
+                    return cached
+            except Exception as e:
+                print(f"Failed to revalidate memories: {e}. Using cached memories.")
+                return cached
+
         try:
             print("Loading memories from DIAL bucket...")
-            file_content = await client.files.download(memory_file_path)
-            decoded_content = file_content.decode('utf-8')
-            memories_data = json.loads(decoded_content)
-            memory_collection = MemoryCollection.model_validate(memories_data)
+            for attempt in range(self.LOAD_ATTEMPTS):
+                snapshot_etag, segment_names = await asyncio.gather(
+                    self._get_snapshot_etag(client, folder_path),
+                    self._list_journal(client, folder_path),
+                )
+                try:
+                    memory_collection, journal = await asyncio.gather(
+                        self._load_snapshot(client, folder_path, snapshot_etag),
+                        self._download_journal(client, folder_path, segment_names),
+                    )
+                    break
+                except (EtagMismatchError, ResourceNotFoundError):
+                    # Snapshot was replaced by another worker between the requests, or a listed journal segment was
+                    # removed by compaction into a snapshot newer than the loaded one
+                    if attempt == self.LOAD_ATTEMPTS - 1:
+                        raise
+            self._replay_journal(memory_collection, journal)
             print("Memories loaded from DIAL bucket.")
         except Exception as e:
             print(f"Failed to load memories from DIAL bucket: {e}. Initializing empty memory collection.")
             memory_collection = MemoryCollection(memories=[], updated_at=datetime.now(UTC), last_deduplicated_at=None)
+            memory_collection.use_index(self.index_kind)
+            return memory_collection
 
+        memory_collection.use_index(self.index_kind)
+        self.cache.put(folder_path, memory_collection, validated=True)
         return memory_collection
 
-    async def _save_memories(self, api_key: str, memories: MemoryCollection):
-        """Save memories to DIAL bucket and update cache."""
-        #TODO:
-        # 1. Create AsyncDial client
-        # 2. Get memory file path
-        # 3. Update `updated_at` of memories (now)
-        # 4. Converts memories to json string (it's pydentic model and it have model dump json method for this). Don't
-        #    make any indentations because it will make file 'bigger'. Here is the point that we store all the memories
-        #    in one file and 'one memory' with its embeddings takes ~6-8Kb, we expect that there are won't be more that
-        #    1000 memories but anyway for 1000 memories it will be ~6-8Mb, so, we need to make at least these small
-        #    efforts to make it smaller 😉
-        # 5. Put to cache (kind reminder the key is memory file path)
-        client = AsyncDial(base_url=self.endpoint, api_key=api_key, api_version="2025-01-01-preview")
-        memory_file_path = await self._get_memory_file_path(client)
-        memories.updated_at = datetime.now(UTC)
-        memories_json = memories.model_dump_json()
-        print("Saving memories to DIAL bucket...")
-        await client.files.upload(content=memories_json.encode('utf-8'), path=memory_file_path)
+    async def _revalidate(self, client: AsyncDial, folder_path: str, cached: MemoryCollection) -> bool:
+        """
+        Check cached collection against bucket metadata.
+
+        Journal segments written by other workers are downloaded and applied in place.
+
+        Returns:
+            False if the snapshot was rewritten and the collection must be reloaded
+        """
+        snapshot_etag, segment_names = await asyncio.gather(
+            self._get_snapshot_etag(client, folder_path),
+            self._list_journal(client, folder_path),
+        )
+        if snapshot_etag != cached.snapshot_etag:
+            return False
+
+        known_segments = set(cached.journal_segments) | set(cached.compacted_segments)
+        new_segments = [name for name in segment_names if name not in known_segments]
+        if new_segments:
+            try:
+                journal = await self._download_journal(client, folder_path, new_segments)
+            except ResourceNotFoundError:
+                # Compacted meanwhile, its content is only in the new snapshot
+                return False
+            self._replay_journal(cached, journal)
+        return True
+
+    async def _get_snapshot_etag(self, client: AsyncDial, folder_path: str) -> str | None:
+        """
+        Get ETag of the snapshot, None if there is no snapshot yet.
+
+        Requested before the snapshot download, so the cached ETag is never newer than the cached content.
+        """
+        return await self._get_etag(client, f"{folder_path}/{self.SNAPSHOT_FILE}")
+
+    async def _get_etag(self, client: AsyncDial, path: str) -> str | None:
+        try:
+            metadata = await client.files.get_metadata(path)
+        except DialException as e:
+            if self._is_not_found(e):
+                return None
+            raise
+        return metadata.etag
+
+    async def _load_snapshot(self, client: AsyncDial, folder_path: str, snapshot_etag: str | None) -> MemoryCollection:
+        """
+        Download memory snapshot of the ETag and its embeddings blob, falls back to legacy `data.json` migration.
+
+        Raises:
+            EtagMismatchError, ResourceNotFoundError: if the snapshot was replaced meanwhile
+        """
+        if snapshot_etag is None:
+            return await self._migrate_legacy_memories(client, folder_path)
+
+        snapshot_response = await client.files.download(
+            f"{folder_path}/{self.SNAPSHOT_FILE}", etag_if_match=snapshot_etag
+        )
+        snapshot = MemorySnapshot.model_validate_json(await snapshot_response.aget_content())
+        embeddings_response = await client.files.download(f"{folder_path}/{snapshot.embeddings_file}")
+        embeddings = normalize(unpack_embeddings(
+            blob=await embeddings_response.aget_content(),
+            count=len(snapshot.memories),
+            dim=snapshot.embedding_dim,
+            dtype=snapshot.embedding_dtype,
+        ))
+        return MemoryCollection(
+            memories=snapshot.memories,
+            embeddings=embeddings,
+            updated_at=snapshot.updated_at,
+            last_deduplicated_at=snapshot.last_deduplicated_at,
+            compacted_segments=snapshot.compacted_segments,
+            snapshot_etag=snapshot_etag,
+            embeddings_file=snapshot.embeddings_file,
+        )
+
+    async def _migrate_legacy_memories(self, client: AsyncDial, folder_path: str) -> MemoryCollection:
+        """
+        Convert legacy `data.json` (embeddings as JSON float lists) to the snapshot + packed embeddings format.
+        Returns empty collection if there is nothing to migrate.
+        """
+        legacy_path = f"{folder_path}/{self.LEGACY_FILE}"
+        try:
+            legacy_response = await client.files.download(legacy_path)
+        except ResourceNotFoundError:
+            return MemoryCollection(memories=[], updated_at=datetime.now(UTC), last_deduplicated_at=None)
+
+        print("Migrating memories from legacy format...")
+        legacy = LegacyMemoryCollection.model_validate_json(await legacy_response.aget_content())
+        memory_collection = MemoryCollection(
+            memories=[m.data for m in legacy.memories],
+            updated_at=legacy.updated_at,
+            last_deduplicated_at=legacy.last_deduplicated_at,
+        )
+        if legacy.memories:
+            memory_collection.embeddings = normalize(np.array([m.embedding for m in legacy.memories]))
+        await self._upload_snapshot(client, folder_path, memory_collection)
+        await client.files.delete(legacy_path)
+        print("Memories migrated.")
+        return memory_collection
+
+    async def _download_journal(
+            self, client: AsyncDial, folder_path: str, segment_names: list[str]
+    ) -> list[tuple[str, MemoryJournalSegment]]:
+        """
+        Download journal segments, `segment_names` are expected to be ordered by name (i.e. by write time).
+
+        Raises:
+            ResourceNotFoundError: if a segment was removed by compaction after listing, the snapshot must be reloaded
+        """
+        responses = await asyncio.gather(
+            *[client.files.download(f"{folder_path}/{self.JOURNAL_FOLDER}/{name}") for name in segment_names],
+            return_exceptions=True,
+        )
+        journal = []
+        for name, response in zip(segment_names, responses):
+            if isinstance(response, BaseException):
+                raise response
+            journal.append((name, MemoryJournalSegment.model_validate_json(await response.aget_content())))
+        return journal
+
+    async def _list_journal(self, client: AsyncDial, folder_path: str) -> list[str]:
+        return await self._list_folder(client, f"{folder_path}/{self.JOURNAL_FOLDER}/")
+
+    async def _list_folder(self, client: AsyncDial, path: str, node_type: str = "ITEM") -> list[str]:
+        """Sorted names of files (or folders with `node_type="FOLDER"`) in the folder, empty if it doesn't exist."""
+        try:
+            metadata = await client.files.get_metadata(path)
+        except DialException as e:
+            if self._is_not_found(e):
+                return []
+            raise
+        return sorted(item.name for item in metadata.items or [] if item.node_type == node_type)
+
+    @staticmethod
+    def _is_not_found(e: DialException) -> bool:
+        # Metadata API doesn't map 404 to ResourceNotFoundError
+        return isinstance(e, ResourceNotFoundError) or e.status_code == 404
+
+    @staticmethod
+    def _replay_journal(collection: MemoryCollection, journal: list[tuple[str, MemoryJournalSegment]]) -> None:
+        """Apply journal segments that are not yet compacted into the snapshot."""
+        compacted = set(collection.compacted_segments)
+        for name, segment in journal:
+            if name in compacted:
+                continue
+            collection.append(
+                segment.memories,
+                unpack_embeddings(
+                    blob=base64.b64decode(segment.embeddings),
+                    count=len(segment.memories),
+                    dim=segment.embedding_dim,
+                    dtype=segment.embedding_dtype,
+                )
+            )
+            collection.journal_segments.append(name)
+
+    async def _upload_snapshot(self, client: AsyncDial, folder_path: str, memories: MemoryCollection):
+        """
+        Upload a new embeddings blob first and then the snapshot referencing it, so that the snapshot never references
+        rows that are not uploaded yet. The blob of the replaced snapshot is removed afterwards.
+
+        The snapshot is uploaded only if the bucket still has the snapshot the collection is based on (or no snapshot
+        for a new collection). Both payloads are serialized before the first upload, memories appended meanwhile stay
+        in the journal.
+
+        Raises:
+            EtagMismatchError: if the snapshot was replaced by another worker, the collection must be reloaded
+        """
+        embeddings_file = f"embeddings-{uuid.uuid4().hex[:12]}.bin"
+        snapshot = MemorySnapshot(
+            memories=memories.memories,
+            updated_at=memories.updated_at,
+            last_deduplicated_at=memories.last_deduplicated_at,
+            embedding_dim=memories.embeddings.shape[1],
+            embedding_dtype=EMBEDDINGS_DTYPE,
+            embeddings_file=embeddings_file,
+            compacted_segments=memories.compacted_segments,
+        )
+        embeddings_content = pack_embeddings(memories.embeddings)
+        snapshot_content = snapshot.model_dump_json().encode('utf-8')
+        await client.files.upload(
+            url=f"{folder_path}/{embeddings_file}",
+            file=(embeddings_file, embeddings_content, "application/octet-stream"),
+        )
+        try:
+            snapshot_metadata = await client.files.upload(
+                url=f"{folder_path}/{self.SNAPSHOT_FILE}",
+                file=(self.SNAPSHOT_FILE, snapshot_content, "application/json"),
+                etag_if_match=memories.snapshot_etag,
+                etag_if_none_match=None if memories.snapshot_etag else "*",
+            )
+        except EtagMismatchError:
+            await self._delete_files(client, folder_path, [embeddings_file])
+            raise
+
+        previous_embeddings_file = memories.embeddings_file
+        memories.snapshot_etag = snapshot_metadata.etag
+        memories.embeddings_file = embeddings_file
+        if previous_embeddings_file is not None:
+            await self._delete_files(client, folder_path, [previous_embeddings_file])
+
+    async def _save_memories(self, api_key: str, folder_path: str, memories: MemoryCollection):
+        """
+        Compact memories: save full snapshot to DIAL bucket, remove replayed journal segments and update cache.
+
+        Replayed segments are recorded in the snapshot before removal, so a reader that lists the journal
+        between these two steps doesn't apply them twice. Compactions of the same collection are serialized,
+        otherwise an older snapshot could overwrite a newer one whose segments are already removed. Compactions
+        by different workers are ordered by the conditional snapshot upload.
+
+        Raises:
+            EtagMismatchError: if the snapshot was replaced by another worker. The collection is dropped from cache
+                and nothing is removed from the journal, the caller reloads memories and redoes its change
+        """
+        client = self.client_pool.get_client(self.endpoint, api_key)
+        async with memories.compaction_lock:
+            memories.updated_at = datetime.now(UTC)
+            segments = memories.journal_segments
+            memories.compacted_segments = segments
+            memories.journal_segments = []
+            memories.needs_compaction = False
+            print("Saving memories to DIAL bucket...")
+            try:
+                await self._upload_snapshot(client, folder_path, memories)
+            except EtagMismatchError:
+                print("Memories were changed by another worker, dropping cached memories.")
+                self.cache.pop(folder_path)
+                raise
+            await self._delete_journal_segments(client, folder_path, segments)
         print("Saving memories to cache.")
-        self.cache[memory_file_path] = memories
-        
+        self.cache.put(folder_path, memories)
+
+    async def _append_to_journal(
+            self,
+            api_key: str,
+            folder_path: str,
+            memories: MemoryCollection,
+            new_memories: list[MemoryData],
+            embeddings: np.ndarray,
+    ):
+        """Persist new memories as a journal segment of the shard, cost is proportional to the new memories only."""
+        client = self.client_pool.get_client(self.endpoint, api_key)
+        segment_name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.json"
+        segment = MemoryJournalSegment(
+            memories=new_memories,
+            embeddings=base64.b64encode(pack_embeddings(embeddings)).decode('ascii'),
+            embedding_dim=embeddings.shape[1],
+            embedding_dtype=EMBEDDINGS_DTYPE,
+        )
+        print("Appending memories to journal in DIAL bucket...")
+        await client.files.upload(
+            url=f"{folder_path}/{self.JOURNAL_FOLDER}/{segment_name}",
+            file=(segment_name, segment.model_dump_json().encode('utf-8'), "application/json"),
+        )
+        memories.append(new_memories, embeddings)
+        memories.journal_segments.append(segment_name)
+        memories.updated_at = datetime.now(UTC)
+        self.cache.put(folder_path, memories)
+
+        if memories.needs_compaction or len(memories.journal_segments) > self.MAX_JOURNAL_SEGMENTS:
+            print("Journal is too long or memories were deduplicated. Compacting memories...")
+            try:
+                await self._save_memories(api_key, folder_path, memories)
+            except EtagMismatchError:
+                # New memories are in the journal, they are replayed on top of the newer snapshot
+                pass
+
+    async def _delete_files(self, client: AsyncDial, folder_path: str, file_names: list[str]):
+        """Best-effort removal of files of the folder, files that are already removed are skipped."""
+        results = await asyncio.gather(
+            *[client.files.delete(f"{folder_path}/{name}") for name in file_names],
+            return_exceptions=True,
+        )
+        for name, result in zip(file_names, results):
+            if isinstance(result, BaseException) and not isinstance(result, ResourceNotFoundError):
+                print(f"Failed to delete memory file {name}: {result}")
+
+    async def _delete_journal_segments(self, client: AsyncDial, folder_path: str, segment_names: list[str]):
+        await self._delete_files(client, f"{folder_path}/{self.JOURNAL_FOLDER}", segment_names)
+
+    async def _persist_memories(
+            self, shard_path: str, api_key: str, new_memories: list[MemoryData], embeddings: np.ndarray):
+        """
+        Flush of `write_queue`: append memories queued for the shard since the previous flush to its journal.
+
+        A category shard is checked against a fresh manifest first, memories of a shard removed by another worker
+        (deleted category or all memories) are appended to the memory folder root instead. The root is split into
+        category shards once it grows over `MAX_SHARD_SIZE`.
+        """
+        folder_path, shard_name = self._split_shard_path(shard_path)
+        if shard_name:
+            manifest = await self._load_manifest(api_key, folder_path, refresh=True)
+            if shard_name not in {shard.name for shard in manifest.shards}:
+                print(f"Memory shard {shard_name} was removed. Appending memories to the memory folder root...")
+                shard_path = folder_path
+        memories = await self._load_shard(api_key, shard_path)
+        await self._append_to_journal(api_key, shard_path, memories, new_memories, embeddings)
+        if shard_path == folder_path and len(memories.memories) > self.MAX_SHARD_SIZE:
+            await self._split_root(api_key, folder_path, memories)
 
     async def add_memory(self, api_key: str, content: str, importance: float, category: str, topics: list[str]) -> str:
         """Add a new memory to storage."""
+        return await self.add_memories(
+            api_key, [NewMemory(content=content, importance=importance, category=category, topics=topics)]
+        )
+
+    async def add_memories(self, api_key: str, memories: list[NewMemory]) -> str:
+        """Add new memories to storage with one embedding pass and one write."""
         #TODO:
-        # 1. Load memories
-        # 2. Make encodings for content with embedding model.
-        #    Hint: provide content as list, and after encoding get first result (encode wil return list) and convertit `tolist`
-        # 3. Create Memory
+        # 1. Make encodings for all contents with embedding service in one batch.
+        # 2. Create Memory for each content
         #    - for id use `int(datetime.now(UTC).timestamp())` it will provide time now as int, it will be super enough
         #      to avoid collisions. Also, we won't use id but we added it because maybe in future you will make enhanced
         #      version of long-term memory and after that it will be additional 'headache' to add such ids 😬
-        # 4. Add to memories created memory
-        # 5. Save memories (it is PUT request bzw, -> https://dialx.ai/dial_api#tag/Files/operation/uploadFile)
-        # 6. Return information that content has benn successfully stored
-        memories = await self._load_memories(api_key)
-        embedding = self.model.encode([content])[0].tolist()
-        new_memory = Memory(
-            id=int(datetime.now(UTC).timestamp()),
-            content=content,
-            importance=importance,
-            category=category,
-            topics=topics,
-            embedding=embedding,
+        # 3. Pick a shard for each category (memory folder root, or the latest shard of the category once it is split)
+        # 4. Submit memories to write queue and wait until they are persisted: queue loads the shard, appends all pending
+        #    memories of the shard to its journal with one PUT request (https://dialx.ai/dial_api#tag/Files/operation/uploadFile)
+        # 5. Return information that content has benn successfully stored
+        if not memories:
+            return "No memories to store."
+        folder_path = await self._get_memory_folder_path(api_key)
+        embeddings = await self.embedding_service.embed([memory.content for memory in memories])
+        created_at = datetime.now(UTC)
+        new_memories = [
+            MemoryData(id=int(created_at.timestamp()), created_at=created_at, **memory.model_dump())
+            for memory in memories
+        ]
+        categories = list(dict.fromkeys(memory.category for memory in new_memories))
+        shard_paths = await asyncio.gather(
+            *[self._get_write_shard(api_key, folder_path, category) for category in categories]
         )
-        memories.memories.append(new_memory)
-        await self._save_memories(api_key, memories)
-        print("Memory added successfully.")
-        return "Memory successfully stored."
+        shard_of = dict(zip(categories, shard_paths))
+        shard_rows: dict[str, list[int]] = {}
+        for row, memory in enumerate(new_memories):
+            shard_rows.setdefault(shard_of[memory.category], []).append(row)
+        await asyncio.gather(*[
+            self.write_queue.submit(shard_path, api_key, [new_memories[row] for row in rows], embeddings[rows])
+            for shard_path, rows in shard_rows.items()
+        ])
+        print(f"Memories added successfully: {len(new_memories)}.")
+        if len(new_memories) == 1:
+            return "Memory successfully stored."
+        return f"{len(new_memories)} memories successfully stored."
 
     async def search_memories(self, api_key: str, query: str, top_k: int = 5) -> list[MemoryData]:
         """
@@ -139,40 +770,198 @@ class LongTermMemoryStore:
         Returns:
             List of MemoryData objects (without embeddings)
         """
+        results = await self.search_memories_multi(api_key, [query], top_k)
+        return results[query]
+
+    async def search_memories_multi(
+            self,
+            api_key: str,
+            queries: list[str],
+            top_k: int = 5,
+            categories: list[str] | None = None,
+            topics: list[str] | None = None,
+            min_importance: float | None = None,
+            hybrid: bool = False,
+    ) -> dict[str, list[MemoryData]]:
+        """
+        Search memories for several queries at once: queries are embedded in one batch and searched with one
+        multi-row FAISS search per shard.
+
+        With filters (any of `categories`, any of `topics`, importance >= `min_importance`) only candidate rows
+        selected by the inverted index are scored, and with `categories` only shards of these categories are loaded.
+        With `hybrid` cosine similarity is fused with BM25 score, so exact names and places are ranked higher.
+
+        Each memory is returned once, in the group of the query it is the most similar to.
+
+        Returns:
+            Up to `top_k` MemoryData objects per query, in order of provided queries and ranking score
+        """
         #TODO:
-        # 1. Load memories
-        # 2. If they are empty return empty array
+        # 1. Load the memory folder root and shards of requested categories (all shards without category filter)
+        # 2. If they are empty return empty groups (deduplication is scheduled in background by `_load_shard`)
         # ---
-        # 3. Check if they needs_deduplication, if yes then deduplicate_and_save (need to implements both of these methods)
-        # 4. Make vector search (embeddings are part of memory)😈
-        # 5. Return `top_k` MemoryData based on vector search
-        memories = await self._load_memories(api_key)
-        if not memories.memories:
+        # 3. In each shard take hits of repeated queries from search cache, make vector search (embeddings are part of
+        #    memory)😈 for the rest of queries at once and rank candidates by similarity, importance and recency
+        # 4. Merge hits of all shards, keep `top_k` per query (a memory is in two shards for a moment while they are split)
+        # 5. Assign each found memory to the query with the highest score
+        # 6. Return `top_k` MemoryData per query based on ranking
+        queries = list(dict.fromkeys(queries))
+        groups: dict[str, list[MemoryData]] = {query: [] for query in queries}
+        if not queries:
+            return groups
+        # Queries are embedded (into query embeddings cache) while shards are loading
+        shards, _ = await asyncio.gather(
+            self._load_shards(api_key, categories),
+            self.embedding_service.embed_queries(queries),
+        )
+        if not any(memories.memories for _, memories in shards):
             print("No memories to search.")
-            return []
-        
-        if self._needs_deduplication(memories):
-            print("Deduplication needed. Deduplicating memories...")
-            memories = await self._deduplicate_and_save(api_key, memories)
-            print("Deduplication completed.")
-        
-        embeddings = np.array([m.embedding for m in memories.memories]).astype('float32')
-        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-        normalized_embeddings = embeddings / norms
-
-        index = faiss.IndexFlatIP(normalized_embeddings.shape[1])
-        index.add(normalized_embeddings)
-
-        query_embedding = self.model.encode([query]).astype('float32')
-        query_norm = np.linalg.norm(query_embedding, keepdims=True)
-        normalized_query = query_embedding / query_norm
+            return groups
+
+        # (score, memory) per query, memories are resolved right away as shards can change meanwhile
+        hits: dict[str, dict[tuple[int, str], tuple[float, MemoryData]]] = {query: {} for query in queries}
+        for shard_path, memories in shards:
+            if not memories.memories:
+                continue
+            shard_hits = await self._search_shard(
+                shard_path, memories, queries, top_k, categories, topics, min_importance, hybrid
+            )
+            for query, (scores, indices) in shard_hits.items():
+                for score, memory_idx in zip(scores, indices):
+                    if memory_idx >= 0:
+                        memory = memories.memories[memory_idx]
+                        hits[query].setdefault((memory.id, memory.content), (float(score), memory))
 
+        best_query: dict[tuple[int, str], tuple[float, str]] = {}
+        top_hits: dict[str, list[tuple[tuple[int, str], MemoryData]]] = {}
+        for query in queries:
+            ranked = sorted(hits[query].items(), key=lambda hit: -hit[1][0])[:top_k]
+            top_hits[query] = [(key, memory) for key, (_, memory) in ranked]
+            for key, (score, _) in ranked:
+                if key not in best_query or score > best_query[key][0]:
+                    best_query[key] = (score, query)
+
+        for query, query_hits in top_hits.items():
+            for key, memory in query_hits:
+                if best_query[key][1] == query:
+                    groups[query].append(memory)
+        return groups
+
+    async def _search_shard(
+            self,
+            shard_path: str,
+            memories: MemoryCollection,
+            queries: list[str],
+            top_k: int,
+            categories: list[str] | None,
+            topics: list[str] | None,
+            min_importance: float | None,
+            hybrid: bool,
+    ) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+        """
+        Search the shard for each query.
+
+        Returns:
+            Tuple of (scores, indices) per query, up to `top_k` hits ordered by ranking score, missing hits are -1
+        """
         k = min(top_k, len(memories.memories))
-        similarities, indices = index.search(normalized_query, k)
+        candidates_k = min(k * self.ranking.candidates_factor, len(memories.memories)) if self.ranking.enabled else k
+        filtered = bool(categories or topics or min_importance is not None)
+        options = (
+            tuple(sorted(categories or [])), tuple(sorted(topics or [])), min_importance, hybrid
+        ) if filtered or hybrid else ()
+        while True:
+            # Cached hits are only valid for the version they were found in, collection can change while embedding
+            version = memories.version
+            hits = {query: self.search_cache.get(shard_path, version, query, candidates_k, options) for query in queries}
+            missing = [query for query, hit in hits.items() if hit is None]
+            normalized_queries = await self.embedding_service.embed_queries(missing) if missing else None
+            if memories.version == version:
+                break
+
+        if missing:
+            if filtered or hybrid:
+                candidates = memories.inverted_index.candidates(categories, topics, min_importance)
+                similarities, indices = self._search_candidates(
+                    memories, missing, normalized_queries, candidates_k, candidates,
+                    self.LEXICAL_WEIGHT if hybrid else 0.0
+                )
+            else:
+                similarities, indices = memories.search(normalized_queries, candidates_k)
+            for query, query_similarities, query_indices in zip(missing, similarities, indices):
+                self.search_cache.put(
+                    shard_path, version, query, candidates_k, query_similarities, query_indices, options
+                )
+                hits[query] = (query_similarities, query_indices)
+
+        if self.ranking.enabled:
+            hits = self._rank_hits(memories, hits, k)
+        return hits
+
+    def _rank_hits(
+            self, memories: MemoryCollection, hits: dict[str, tuple[np.ndarray, np.ndarray]], k: int
+    ) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+        """Rank candidates of all queries with one vectorized pass, keep top k per query."""
+        width = max(len(query_indices) for _, query_indices in hits.values())
+        similarities = np.full((len(hits), width), -np.inf, dtype=np.float32)
+        indices = np.full((len(hits), width), -1, dtype=np.int64)
+        for row, (query_similarities, query_indices) in enumerate(hits.values()):
+            similarities[row, :len(query_indices)] = query_similarities
+            indices[row, :len(query_indices)] = query_indices
+
+        scores, indices = self.ranking.rank(
+            similarities,
+            indices,
+            importance=memories.inverted_index.importance,
+            created_at=memories.inverted_index.created_at,
+            now=time.time(),
+            k=k,
+        )
+        return {query: (scores[row], indices[row]) for row, query in enumerate(hits)}
+
+    @staticmethod
+    def _search_candidates(
+            memories: MemoryCollection,
+            queries: list[str],
+            normalized_queries: np.ndarray,
+            k: int,
+            candidates: np.ndarray | None,
+            lexical_weight: float,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Exact search over candidate rows (all rows if None), only candidate embeddings are scored.
+
+        With `lexical_weight` score is `(1 - w) * cosine + w * bm25 / max(bm25)` per query.
+
+        Returns:
+            Tuple of (scores, indices), both of shape (len(queries), min(k, len(candidates)))
+        """
+        embeddings = memories.embeddings if candidates is None else memories.embeddings[candidates]
+        rows = np.arange(len(embeddings)) if candidates is None else candidates
+        k = min(k, len(rows))
+        if k == 0:
+            return np.empty((len(queries), 0), dtype=np.float32), np.empty((len(queries), 0), dtype=np.int64)
+
+        scores = normalized_queries @ embeddings.T
+        if lexical_weight:
+            for query_idx, query in enumerate(queries):
+                lexical_scores = memories.inverted_index.bm25(query, candidates)
+                max_score = lexical_scores.max()
+                if max_score > 0:
+                    scores[query_idx] = (1 - lexical_weight) * scores[query_idx] + lexical_weight * lexical_scores / max_score
 
-        results = [memories.memories[i].data for i in indices[0]]
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top_scores, order, axis=1), rows[np.take_along_axis(top, order, axis=1)]
 
-        return results
+    def cache_stats(self) -> dict[str, dict[str, int | float]]:
+        """Hit ratios and sizes of memory caches."""
+        return {
+            "collections": self.cache.stats(),
+            "search_results": self.search_cache.stats(),
+            "query_embeddings": self.embedding_service.query_cache_stats(),
+        }
 
     def _needs_deduplication(self, collection: MemoryCollection) -> bool:
         """Check if deduplication is needed (>24 hours since last deduplication)."""
@@ -185,98 +974,151 @@ class LongTermMemoryStore:
             return True
         return (datetime.now(UTC) - collection.last_deduplicated_at) > timedelta(hours=24)
 
-    async def _deduplicate_and_save(self, api_key: str, collection: MemoryCollection) -> MemoryCollection:
+    async def _deduplicate_in_background(self, shard_path: str) -> None:
         """
-        Deduplicate memories synchronously and save the result.
-        Returns the updated collection.
+        Deduplication job run by `dedup_scheduler` for one cached shard outside of user requests.
+
+        The job makes no DIAL requests: the api key of the request that loaded the shard expires with that request.
+        Deduplicated memories are swapped into the cached collection and saved by the next compaction made in a
+        request (the next write to the shard), other workers deduplicate their copies meanwhile.
         """
-        #TODO:
-        # 1. Make fast deduplication (need to implement)
-        # 2. Update last_deduplicated_at as now
-        # 3. Save deduplicated memories
-        # 4. Return deduplicated collection
-        deduplicated_memories = self._deduplicate_fast(collection.memories)
-        collection.memories = deduplicated_memories
-        collection.last_deduplicated_at = datetime.now(UTC)
-        await self._save_memories(api_key, collection)
-        return collection
+        collection = self.cache.peek(shard_path)
+        if collection is not None and self._needs_deduplication(collection):
+            print("Deduplicating memories in background...")
+            if await self._deduplicate(collection):
+                self.cache.put(shard_path, collection)
+                print("Deduplication completed.")
 
-    def _deduplicate_fast(self, memories: list[Memory]) -> list[Memory]:
+    async def _deduplicate(self, collection: MemoryCollection) -> bool:
         """
-        Fast deduplication using FAISS batch search with cosine similarity.
+        Deduplicate memories in a worker thread and swap the result into the collection, it is marked for compaction.
 
-        Strategy:
-        - Find k nearest neighbors for each memory using cosine similarity
-        - Mark duplicates based on similarity threshold (cosine similarity > 0.75)
-        - Keep memory with higher importance
+        Returns:
+            False if memories were replaced meanwhile (e.g. memories of a category were deleted) and the result was
+            dropped
         """
-        #TODO:
-        # This is the hard part 🔥🔥🔥
-        # You need to deduplicate memories, duplicates are the memories that have 75% similarity.
-        # Among duplicates remember about `importance`, most important have more priorities to survive
-        # It must be fast, it is possible to do for O(n log n), probably you can find faster way (share with community if do 😉)
-        # Return deduplicated memories
+        # Deduplicate a frozen prefix, memories appended meanwhile are kept as is
+        generation = collection.generation
+        count = len(collection.memories)
+        memories, embeddings = collection.memories[:count], collection.embeddings[:count]
+        keep = await asyncio.to_thread(self._deduplicate_fast, memories, embeddings)
+        if collection.generation != generation:
+            print("Memories were replaced during deduplication, dropping its result.")
+            return False
+        collection.replace(
+            [memories[i] for i in keep] + collection.memories[count:],
+            np.vstack([embeddings[keep], collection.embeddings[count:]]),
+        )
+        collection.last_deduplicated_at = datetime.now(UTC)
+        collection.needs_compaction = True
+        return True
 
-        if len(memories) < 2:
-            return memories
+    def _deduplicate_fast(self, memories: list[MemoryData], embeddings: np.ndarray) -> list[int]:
+        """
+        Exact deduplication with cosine similarity.
 
-        embeddings = np.array([m.embedding for m in memories]).astype('float32')
-        n = len(embeddings)
+        Strategy:
+        - Find all pairs of memories with cosine similarity > 0.75 (blocked matrix products)
+        - Group them into clusters of duplicates with union-find
+        - Keep exactly one memory per cluster, the one with the highest importance
 
-        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-        normalized_embeddings = embeddings / norms
+        Returns:
+            Sorted indices of memories that survive deduplication
+        """
+        importance = np.fromiter((memory.importance for memory in memories), dtype=np.float32, count=len(memories))
+        return deduplicate(embeddings, importance, self.DEDUP_SIMILARITY_THRESHOLD).tolist()
 
-        index = faiss.IndexFlatIP(normalized_embeddings.shape[1])
-        index.add(normalized_embeddings)
+    async def delete_all_memories(self, api_key: str, ) -> str:
+        """
+        Delete all memories for the user.
 
-        k = min(10, n)
-        similarities, indices = index.search(normalized_embeddings, k)
+        Removes the manifest first, so other workers append new memories to the memory folder root rather than to
+        removed shards, then all shards and the root (including legacy `data.json`) from DIAL bucket, and clears
+        the cache. Shard folders missing in the manifest (e.g. left by a reverted split) are removed as well.
+        """
+        client = self.client_pool.get_client(self.endpoint, api_key)
+        folder_path = await self._get_memory_folder_path(api_key)
+        shard_paths = {folder_path}
+        try:
+            (manifest, _), shard_names = await asyncio.gather(
+                self._download_manifest(client, folder_path),
+                self._list_folder(client, f"{folder_path}/{self.SHARDS_FOLDER}/", node_type="FOLDER"),
+            )
+            shard_paths.update(self._get_shard_path(folder_path, shard) for shard in (manifest.shards if manifest else []))
+            shard_paths.update(f"{folder_path}/{self.SHARDS_FOLDER}/{name}" for name in shard_names)
+        except Exception as e:
+            print(f"Failed to list memory shards in DIAL bucket: {e}.")
 
-        duplicates_to_remove = set()
+        await self._delete_files(client, folder_path, [self.MANIFEST_FILE])
+        self._manifests.pop(folder_path, None)
+        await asyncio.gather(*[self._delete_shard(client, shard_path) for shard_path in shard_paths])
 
-        for i in range(n):
-            if i in duplicates_to_remove:
-                continue
+        return "All memories have been successfully deleted."
 
-            for j in range(1, k):
-                neighbor_idx = indices[i][j]
+    async def delete_memories(self, api_key: str, category: str) -> str:
+        """
+        Delete memories of the category. Not exposed by `DeleteMemoryTool`, which deletes all memories.
 
-                if neighbor_idx in duplicates_to_remove:
-                    continue
+        Shards of the category are removed from the manifest and deleted as a whole, then the memory folder root is
+        compacted without memories of the category (including memories other workers appended to it meanwhile
+        instead of the removed shards).
+        """
+        client = self.client_pool.get_client(self.endpoint, api_key)
+        folder_path = await self._get_memory_folder_path(api_key)
+        manifest = await self._load_manifest(api_key, folder_path, refresh=True)
+        category_shards = [shard for shard in manifest.shards if self._shard_matches(shard, [category])]
+        deleted = 0
 
-                if similarities[i][j] > 0.75:
-                    if memories[i].data.importance >= memories[neighbor_idx].data.importance:
-                        duplicates_to_remove.add(neighbor_idx)
-                    else:
-                        duplicates_to_remove.add(i)
-                        break
+        if category_shards:
+            shard_paths = [self._get_shard_path(folder_path, shard) for shard in category_shards]
+            collections = await asyncio.gather(*[self._load_shard(api_key, shard_path) for shard_path in shard_paths])
+            deleted += sum(len(collection.memories) for collection in collections)
+            # Removed from the manifest first, so the shards are not loaded or appended to while being deleted
+            await self._update_manifest(api_key, folder_path, remove={shard.name for shard in category_shards})
+            await asyncio.gather(*[self._delete_shard(client, shard_path) for shard_path in shard_paths])
 
-        deduplicated = [m for i, m in enumerate(memories) if i not in duplicates_to_remove]
-        return deduplicated
-        
+        deleted += await self._delete_from_shard(api_key, folder_path, category)
+        return f"{deleted} memories of category '{category}' have been successfully deleted."
 
-    async def delete_all_memories(self, api_key: str, ) -> str:
+    async def _delete_from_shard(self, api_key: str, shard_path: str, category: str) -> int:
         """
-        Delete all memories for the user.
+        Compact the shard without memories of the category, redone on top of memories saved by another worker
+        meanwhile.
 
-        Removes the memory file from DIAL bucket and clears the cache
-        for the current conversation.
+        Returns:
+            Number of deleted memories
         """
-        #TODO:
-        # 1. Create AsyncDial client
-        # 2. Get memory file path
-        # 3. Delete file
-        # 4. Return info about successful memory deletion
-        client = AsyncDial(base_url=self.endpoint, api_key=api_key, api_version="2025-01-01-preview")
-        memory_file_path = await self._get_memory_file_path(client)
+        for _ in range(self.LOAD_ATTEMPTS):
+            collection = await self._load_shard(api_key, shard_path)
+            keep = [i for i, memory in enumerate(collection.memories) if memory.category.lower() != category.lower()]
+            deleted = len(collection.memories) - len(keep)
+            if not deleted:
+                return 0
+            collection.replace([collection.memories[i] for i in keep], collection.embeddings[keep])
+            try:
+                await self._save_memories(api_key, shard_path, collection)
+            except EtagMismatchError:
+                continue
+            return deleted
+        raise EtagMismatchError(message=f"Memories of {shard_path} keep changing")
+
+    async def _delete_shard(self, client: AsyncDial, shard_path: str):
+        """Remove shard files and journal from DIAL bucket and the shard from the cache."""
         try:
-            await client.files.delete(memory_file_path)
-            print("Memory file deleted from DIAL bucket.")
+            file_names = await self._list_folder(client, f"{shard_path}/")
         except Exception as e:
-            print(f"Failed to delete memory file from DIAL bucket: {e}. It may not exist, but we will proceed to clear cache and return success message.")
-        
-        if memory_file_path in self.cache:
-            del self.cache[memory_file_path]
-            print("Memory cache cleared.")
+            print(f"Failed to list memory files in DIAL bucket: {e}.")
+            file_names = [self.LEGACY_FILE, self.EMBEDDINGS_FILE]
+        # Snapshot first, so that readers don't load a snapshot whose embeddings blob is removed
+        await self._delete_files(client, shard_path, [self.SNAPSHOT_FILE])
+        await self._delete_files(client, shard_path, [
+            name for name in file_names
+            if name == self.LEGACY_FILE or (name.startswith("embeddings") and name.endswith(".bin"))
+        ])
+        try:
+            await self._delete_journal_segments(client, shard_path, await self._list_journal(client, shard_path))
+        except Exception as e:
+            print(f"Failed to delete memory journal from DIAL bucket: {e}.")
 
-        return "All memories have been successfully deleted."
\ No newline at end of file
+        if self.cache.pop(shard_path) is not None:
+            print("Memory cache cleared.")
@@ -2,6 +2,7 @@ import json
 from typing import Any
 
 from task.tools.base import BaseTool
+from task.tools.memory._models import NewMemory
 from task.tools.memory.memory_store import LongTermMemoryStore
 from task.tools.models import ToolCallParams
 
@@ -31,60 +32,72 @@ class StoreMemoryTool(BaseTool):
         # TODO: provide tool description that will help LLM to understand when to use this tools and cover 'tricky'
         #  moments (not more 1024 chars)
         return "Stores long-term memories about the user. " \
-        "Use this tool to save important, novel facts about the user for future reference." \
+        "Use this tool to save important, novel facts about the user for future reference. " \
+        "Pass all facts learned in the current turn in one call as items of `memories`, one clear fact per item. " \
         "Examples of memories to store: user preferences (likes Python, prefers morning meetings), personal information (lives in Paris, works at Google), goals and plans (learning Spanish, traveling to Japan), important context (has a cat named Mittens)."
 
     @property
     def parameters(self) -> dict[str, Any]:
         # TODO: provide tool parameters JSON Schema:
-        #  - content is string, description: "The memory content to store. Should be a clear, concise fact about the user.", required
-        #  - category is string, description: "Category of the info (e.g., 'preferences', 'personal_info', 'goals', 'plans', 'context')", default is 'general' required
-        #  - importance is number, description: "Importance score between 0 and 1. Higher means more important to remember.", minimum is 0, maximum is 1, default is 0.5
-        #  - topics is array of strings, description: "Related topics or tags for the memory", default is empty array
+        #  - memories is array of objects, description: "Memories to store, one fact per item.", minItems is 1, required
+        #  - each memory:
+        #    - content is string, description: "The memory content to store. Should be a clear, concise fact about the user.", required
+        #    - category is string, description: "Category of the info (e.g., 'preferences', 'personal_info', 'goals', 'plans', 'context')", default is 'general' required
+        #    - importance is number, description: "Importance score between 0 and 1. Higher means more important to remember.", minimum is 0, maximum is 1, default is 0.5
+        #    - topics is array of strings, description: "Related topics or tags for the memory", default is empty array
         return {
             "type": "object",
             "properties": {
-                "content": {
-                    "type": "string",
-                    "description": "The memory content to store. Should be a clear, concise fact about the user.",
-                },
-                "category": {
-                    "type": "string",
-                    "description": "Category of the info (e.g., 'preferences', 'personal_info', 'goals', 'plans', 'context').",
-                    "default": "general",
-                },
-                "importance": {
-                    "type": "number",
-                    "description": "Importance score between 0 and 1. Higher means more important to remember.",
-                    "minimum": 0,
-                    "maximum": 1,
-                    "default": 0.5,
-                },
-                "topics": {
+                "memories": {
                     "type": "array",
-                    "items": {"type": "string"},
-                    "description": "Related topics or tags for the memory.",
-                    "default": [],
+                    "description": "Memories to store, one fact per item.",
+                    "minItems": 1,
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "content": {
+                                "type": "string",
+                                "description": "The memory content to store. Should be a clear, concise fact about the user.",
+                            },
+                            "category": {
+                                "type": "string",
+                                "description": "Category of the info (e.g., 'preferences', 'personal_info', 'goals', 'plans', 'context').",
+                                "default": "general",
+                            },
+                            "importance": {
+                                "type": "number",
+                                "description": "Importance score between 0 and 1. Higher means more important to remember.",
+                                "minimum": 0,
+                                "maximum": 1,
+                                "default": 0.5,
+                            },
+                            "topics": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "Related topics or tags for the memory.",
+                                "default": [],
+                            },
+                        },
+                        "required": ["content"],
+                    },
                 },
             },
-            "required": ["content"],
+            "required": ["memories"],
         }
 
     async def _execute(self, tool_call_params: ToolCallParams) -> str:
         #TODO:
         # 1. Load arguments with `json`
-        # 2. Get `content` from arguments
-        # 3. Get `category` from arguments
-        # 4. Get `importance` from arguments, default is 0.5
-        # 5. Get `topics` from arguments, default is empty array
-        # 6. Call `memory_store` `add_memory` (we will implement logic in `memory_store` later)
-        # 7. Add result to stage
-        # 8. Return result
+        # 2. Get `memories` from arguments (single memory passed as top-level `content` is supported as well)
+        # 3. Validate each memory, `category` default is 'general', `importance` default is 0.5, `topics` default is empty array
+        # 4. Call `memory_store` `add_memories`
+        # 5. Add result to stage
+        # 6. Return result
         args = json.loads(tool_call_params.tool_call.function.arguments)
-        content = args["content"]
-        category = args.get("category", "general")
-        importance = args.get("importance", 0.5)
-        topics = args.get("topics", [])
-        result = await self.memory_store.add_memory(content=content, category=category, importance=importance, topics=topics)
+        memories = args["memories"] if "memories" in args else [args]
+        result = await self.memory_store.add_memories(
+            api_key=tool_call_params.api_key,
+            memories=[NewMemory.model_validate(memory) for memory in memories],
+        )
         tool_call_params.stage.append_content(result)
         return result
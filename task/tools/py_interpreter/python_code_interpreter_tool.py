@@ -2,7 +2,6 @@ import base64
 import json
 from typing import Any, Optional
 
-from aidial_client import Dial
 from aidial_sdk.chat_completion import Message, Attachment
 from pydantic import StrictStr, AnyUrl
 
@@ -11,6 +10,7 @@ from task.tools.py_interpreter._response import _ExecutionResult
 from task.tools.mcp.mcp_client import MCPClient
 from task.tools.mcp.mcp_tool_model import MCPToolModel
 from task.tools.models import ToolCallParams
+from task.utils.dial_client_pool import DialClientPool
 
 
 class PythonCodeInterpreterTool(BaseTool):
@@ -21,8 +21,10 @@ class PythonCodeInterpreterTool(BaseTool):
             mcp_tool_models: list[MCPToolModel],
             tool_name: str,
             dial_endpoint: str,
+            client_pool: DialClientPool,
     ):
         self.dial_endpoint = dial_endpoint
+        self.client_pool = client_pool
         self._mcp_client = mcp_client
 
         self._code_execute_tool: Optional[MCPToolModel] = None
@@ -39,6 +41,7 @@ class PythonCodeInterpreterTool(BaseTool):
             mcp_url: str,
             tool_name: str,
             dial_endpoint: str,
+            client_pool: DialClientPool,
     ) -> 'PythonCodeInterpreterTool':
         """Async factory method to create PythonCodeInterpreterTool"""
         mcp_client = await MCPClient.create(mcp_url)
@@ -48,6 +51,7 @@ class PythonCodeInterpreterTool(BaseTool):
             mcp_tool_models=tools,
             tool_name=tool_name,
             dial_endpoint=dial_endpoint,
+            client_pool=client_pool,
         )
 
     @property
@@ -86,11 +90,8 @@ class PythonCodeInterpreterTool(BaseTool):
         execution_result = _ExecutionResult.model_validate(execution_result_json)
 
         if execution_result.files:
-            dial_client = Dial(
-                base_url=self.dial_endpoint,
-                api_key=tool_call_params.api_key,
-            )
-            files_home = dial_client.my_appdata_home()
+            dial_client = self.client_pool.get_client(self.dial_endpoint, tool_call_params.api_key)
+            files_home = await self.client_pool.get_appdata_home(self.dial_endpoint, tool_call_params.api_key)
 
             for file in execution_result.files:
                 name = file.name
@@ -106,7 +107,7 @@ class PythonCodeInterpreterTool(BaseTool):
                 url = f"files/{(files_home / name).as_posix()}"
                 print(url)
 
-                dial_client.files.upload(url=url, file=file_data)
+                await dial_client.files.upload(url=url, file=file_data)
 
                 attachment = Attachment(
                     url=StrictStr(url),
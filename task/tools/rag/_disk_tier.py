@@ -0,0 +1,166 @@
+import mmap
+import os
+import re
+import struct
+import uuid
+from pathlib import Path
+from typing import Sequence
+
+import faiss
+import numpy as np
+
+from task.embeddings.index import VectorIndex
+
+_MAGIC = b"RAGC"
+_HEADER = struct.Struct("<4sB8sI")  # magic, format version, index kind, chunks count
+_FORMAT_VERSION = 2
+_SUFFIXES = (".index", ".vectors", ".chunks")
+
+
+class MappedChunks(Sequence[str]):
+    """Document chunks backed by a memory-mapped chunks file, a chunk is decoded when it is accessed."""
+
+    def __init__(self, buffer: mmap.mmap, offsets: np.ndarray, data_offset: int):
+        self._buffer = buffer
+        self._offsets = offsets
+        self._data_offset = data_offset
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    @property
+    def nbytes(self) -> int:
+        """Size of chunk offsets, chunk texts stay in the mapped file and are decoded on access."""
+        return self._offsets.nbytes
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("chunk index out of range")
+        start, stop = self._data_offset + int(self._offsets[idx]), self._data_offset + int(self._offsets[idx + 1])
+        return self._buffer[start:stop].decode("utf-8")
+
+
+class DocumentDiskTier:
+    """
+    Persistent tier of `DocumentCache` on local disk, survives restarts and is shared by workers on the same host.
+
+    Each document is stored in files named after its cache key:
+    - <key>.index: FAISS index written with `faiss.write_index`, read back with `IO_FLAG_MMAP_IFC`: codes of flat,
+      SQ and PQ indexes are memory-mapped instead of copied, so workers share their pages through the OS page cache
+    - <key>.vectors (quantized indexes only): float16 vectors for re-ranking (`VectorIndex.vectors`) as .npy file,
+      memory-mapped as well
+    - <key>.chunks: index kind, chunk offsets and UTF-8 chunk texts, memory-mapped as well
+
+    Files are written to temporary names and renamed, the chunks file is renamed last and marks a complete entry.
+    Total size is kept within `max_bytes` by removing least recently used entries (by modification time of chunks
+    file, which is updated on load). Removing files that other workers have mapped is safe, their mappings stay valid.
+    `size_bytes` is counted on save and eviction, the directory is only scanned on start and when enforcing budget.
+
+    All methods do blocking file I/O, `DocumentCache` calls them from a worker thread.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.evictions = 0
+        self._size_bytes = sum(size for _, size, _ in self._scan())
+
+    def load(self, key: str) -> tuple[VectorIndex, MappedChunks] | None:
+        index_path, vectors_path, chunks_path = self._paths(key)
+        try:
+            with open(chunks_path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            magic, version, kind, count = _HEADER.unpack_from(buffer, 0)
+            if magic != _MAGIC or version != _FORMAT_VERSION:
+                buffer.close()
+                return None
+            kind = kind.rstrip(b"\0").decode("ascii")
+            index = faiss.read_index(str(index_path), faiss.IO_FLAG_MMAP_IFC)
+            vectors = np.load(vectors_path, mmap_mode="r") if kind != "flat" else None
+        except (OSError, RuntimeError, ValueError, struct.error):
+            buffer.close()
+            return None
+        offsets = np.frombuffer(buffer, dtype="<u8", count=count + 1, offset=_HEADER.size)
+        os.utime(chunks_path)
+        chunks = MappedChunks(buffer, offsets, _HEADER.size + offsets.nbytes)
+        return VectorIndex(index, kind, vectors=vectors), chunks
+
+    def save(self, key: str, index: VectorIndex, chunks: Sequence[str]) -> None:
+        index_path, vectors_path, chunks_path = self._paths(key)
+        encoded = [chunk.encode("utf-8") for chunk in chunks]
+        offsets = np.zeros(len(encoded) + 1, dtype="<u8")
+        np.cumsum([len(chunk) for chunk in encoded], out=offsets[1:])
+
+        replaced_size = self._entry_size(index_path, vectors_path, chunks_path)
+        suffix = f".{uuid.uuid4().hex[:8]}.tmp"
+        faiss.write_index(index.index, str(index_path) + suffix)
+        if index.vectors is not None:
+            with open(str(vectors_path) + suffix, "wb") as f:
+                np.save(f, np.ascontiguousarray(index.vectors))
+        with open(str(chunks_path) + suffix, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, index.kind.encode("ascii"), len(encoded)))
+            f.write(offsets.tobytes())
+            f.write(b"".join(encoded))
+        os.replace(str(index_path) + suffix, index_path)
+        if index.vectors is not None:
+            os.replace(str(vectors_path) + suffix, vectors_path)
+        os.replace(str(chunks_path) + suffix, chunks_path)
+        self._size_bytes += self._entry_size(index_path, vectors_path, chunks_path) - replaced_size
+        if self._size_bytes > self.max_bytes:
+            self.enforce_budget()
+
+    def enforce_budget(self) -> None:
+        """
+        Remove least recently used entries until total size fits `max_bytes`. Scans the directory, which also picks
+        up entries written and removed by other workers sharing it.
+        """
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        for _, size, paths in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            # Chunks file goes first, an entry without it is incomplete
+            for path in reversed(paths):
+                path.unlink(missing_ok=True)
+            total -= size
+            self.evictions += 1
+        self._size_bytes = total
+
+    @property
+    def size_bytes(self) -> int:
+        """Total size of entries, as of the last save or eviction of this process."""
+        return self._size_bytes
+
+    def _scan(self) -> list[tuple[float, int, list[Path]]]:
+        entries = []
+        for chunks_path in self.directory.glob("*.chunks"):
+            paths = [chunks_path.with_suffix(suffix) for suffix in _SUFFIXES]
+            try:
+                mtime = chunks_path.stat().st_mtime
+            except OSError:
+                continue
+            entries.append((mtime, self._entry_size(*paths), paths))
+        return entries
+
+    @staticmethod
+    def _entry_size(*paths: Path) -> int:
+        size = 0
+        for path in paths:
+            try:
+                size += path.stat().st_size
+            except FileNotFoundError:
+                pass
+        return size
+
+    def _paths(self, key: str) -> tuple[Path, Path, Path]:
+        name = re.sub(r"[^A-Za-z0-9_-]", "_", key)
+        return tuple(self.directory / f"{name}{suffix}" for suffix in _SUFFIXES)
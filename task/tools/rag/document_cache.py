@@ -1,101 +1,210 @@
-from datetime import datetime, time, timedelta
-from typing import Any, Tuple
+import asyncio
+import sys
 import threading
+import time
+from collections import OrderedDict
+from typing import Any, Sequence, Tuple
+
+from task.tools.rag._disk_tier import DocumentDiskTier, MappedChunks
 
 
 class DocumentCache:
     """
-    Thread-safe document cache with automatic cleanup at midnight.
-    Removes entries older than 24 hours.
+    Thread-safe LRU cache of document indexes bounded by their approximate size in bytes.
+
+    - Entry size is the size of vectors stored in the index plus the size of chunk strings, entries loaded from
+      the disk tier are memory-mapped and only their chunk offsets count
+    - Least recently used entries are evicted on insert until the cache fits `max_bytes`, the inserted entry is
+      never evicted, even if it alone exceeds the budget
+    - Entries older than `ttl_seconds` are expired on access and removed by a background sweep every
+      `cleanup_interval_seconds`
+
+    With `persist_dir` entries are also written to a persistent tier on local disk (see `DocumentDiskTier`),
+    bounded by `disk_max_bytes`. Entries missing in memory (e.g. after restart or eviction) are loaded back from
+    disk memory-mapped, instead of being extracted and embedded again. Disk I/O runs outside of the lock, on the
+    event loop use `aget` and `aset`, which run it in a worker thread.
     """
 
-    def __init__(self):
-        self._cache: dict[str, Tuple[Any, Any, datetime]] = {}
+    def __init__(
+            self,
+            max_bytes: int = 512 * 1024 * 1024,
+            ttl_seconds: float = 24 * 60 * 60,
+            cleanup_interval_seconds: float = 5 * 60,
+            persist_dir: str | None = None,
+            disk_max_bytes: int = 1024 * 1024 * 1024,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.cleanup_interval_seconds = cleanup_interval_seconds
+        self._cache: OrderedDict[str, Tuple[Any, Any, int, float]] = OrderedDict()
+        self._size = 0
         self._lock = threading.Lock()
         self._cleanup_thread = None
         self._stop_event = threading.Event()
         self._running = False
+        self._disk = DocumentDiskTier(persist_dir, disk_max_bytes) if persist_dir else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
 
     @classmethod
-    def create(cls) ->'DocumentCache':
-        instance = cls()
+    def create(
+            cls,
+            max_bytes: int = 512 * 1024 * 1024,
+            ttl_seconds: float = 24 * 60 * 60,
+            persist_dir: str | None = None,
+            disk_max_bytes: int = 1024 * 1024 * 1024,
+    ) -> 'DocumentCache':
+        instance = cls(
+            max_bytes=max_bytes,
+            ttl_seconds=ttl_seconds,
+            persist_dir=persist_dir,
+            disk_max_bytes=disk_max_bytes,
+        )
         instance.start_cleanup_task()
         return instance
 
     def get(self, key: str) -> Tuple[Any, Any] | None:
         """
-        Retrieve a cached entry.
+        Retrieve a cached entry, the disk tier is read in the calling thread.
 
         Args:
             key: Cache key
 
         Returns:
-            Tuple of (index, chunks) if found and not expired, None otherwise
+            Tuple of (index, chunks) if found and not expired (in memory or on disk), None otherwise
         """
-        with self._lock:
-            if key in self._cache:
-                index, chunks, timestamp = self._cache[key]
-                if datetime.now() - timestamp < timedelta(hours=24):
-                    return (index, chunks)
-                else:
-                    del self._cache[key]
-            return None
+        cached = self._get_from_memory(key)
+        if cached is None and self._disk is not None:
+            cached = self._load_from_disk(key)
+        if cached is None:
+            self._count_miss()
+        return cached
+
+    async def aget(self, key: str) -> Tuple[Any, Any] | None:
+        """Retrieve a cached entry like `get`, the disk tier is read in a worker thread."""
+        cached = self._get_from_memory(key)
+        if cached is None and self._disk is not None:
+            cached = await asyncio.to_thread(self._load_from_disk, key)
+        if cached is None:
+            self._count_miss()
+        return cached
 
     def set(self, key: str, index: Any, chunks: Any) -> None:
         """
-        Store an entry in the cache.
+        Store an entry in the cache, evicting least recently used entries if it doesn't fit the budget. The entry
+        is written to the disk tier in the calling thread.
 
         Args:
             key: Cache key
-            index: FAISS index
+            index: Vector index
             chunks: Document chunks
         """
         with self._lock:
-            self._cache[key] = (index, chunks, datetime.now())
+            self._insert(key, index, chunks)
+        if self._disk is not None:
+            self._save_to_disk(key, index, chunks)
+
+    async def aset(self, key: str, index: Any, chunks: Any) -> None:
+        """Store an entry like `set`, the entry is written to the disk tier in a worker thread."""
+        with self._lock:
+            self._insert(key, index, chunks)
+        if self._disk is not None:
+            await asyncio.to_thread(self._save_to_disk, key, index, chunks)
 
     def clear(self) -> None:
         """Clear all cached entries."""
         with self._lock:
             self._cache.clear()
+            self._size = 0
 
     def cleanup_old_entries(self) -> int:
         """
-        Remove entries older than 24 hours.
+        Remove entries older than `ttl_seconds`.
 
         Returns:
             Number of entries removed
         """
-        now = datetime.now()
-        cutoff_time = now - timedelta(hours=24)
+        cutoff_time = time.monotonic() - self.ttl_seconds
 
         with self._lock:
             keys_to_remove = [
-                key for key, (_, _, timestamp) in self._cache.items()
-                if timestamp < cutoff_time
+                key for key, (_, _, _, created_at) in self._cache.items()
+                if created_at < cutoff_time
             ]
 
             for key in keys_to_remove:
-                del self._cache[key]
+                self._remove(key)
 
             removed_count = len(keys_to_remove)
+            self.expirations += removed_count
             if removed_count > 0:
-                print(f"[DocumentCache] Cleaned up {removed_count} expired entries at {now}")
+                print(f"[DocumentCache] Cleaned up {removed_count} expired entries")
 
             return removed_count
 
-    def _schedule_midnight_cleanup(self) -> None:
-        """Background thread that runs cleanup at midnight every day."""
-        while not self._stop_event.is_set():
-            now = datetime.now()
-            tomorrow = now + timedelta(days=1)
-            midnight = datetime.combine(tomorrow.date(), time.min)
-            seconds_until_midnight = (midnight - now).total_seconds()
+    def _get_from_memory(self, key: str) -> Tuple[Any, Any] | None:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            index, chunks, _, created_at = entry
+            if time.monotonic() - created_at < self.ttl_seconds:
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return (index, chunks)
+            self._remove(key)
+            self.expirations += 1
+            return None
 
-            if self._stop_event.wait(timeout=seconds_until_midnight):
-                break
+    def _load_from_disk(self, key: str) -> Tuple[Any, Any] | None:
+        loaded = self._disk.load(key)
+        if loaded is None:
+            return None
+        with self._lock:
+            self.disk_hits += 1
+            self._insert(key, *loaded)
+        return loaded
+
+    def _save_to_disk(self, key: str, index: Any, chunks: Any) -> None:
+        try:
+            self._disk.save(key, index, chunks)
+        except Exception as e:
+            print(f"[DocumentCache] Failed to persist entry {key}: {e}")
+
+    def _count_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def _insert(self, key: str, index: Any, chunks: Any) -> None:
+        self._remove(key)
+        size = self._approximate_size(index, chunks)
+        self._cache[key] = (index, chunks, size, time.monotonic())
+        self._size += size
+        while self._size > self.max_bytes and len(self._cache) > 1:
+            _, (_, _, evicted_size, _) = self._cache.popitem(last=False)
+            self._size -= evicted_size
+            self.evictions += 1
 
-            if not self._stop_event.is_set():
-                self.cleanup_old_entries()
+    def _remove(self, key: str) -> None:
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            self._size -= entry[2]
+
+    @staticmethod
+    def _approximate_size(index: Any, chunks: Sequence[str]) -> int:
+        """Vectors stored in the index plus chunk strings (only chunk offsets for entries mapped from the disk tier)."""
+        if isinstance(chunks, MappedChunks):
+            # Index codes are mapped along with chunks, their pages belong to the OS page cache
+            return chunks.nbytes
+        return getattr(index, "nbytes", 0) + sum(sys.getsizeof(chunk) for chunk in chunks)
+
+    def _schedule_cleanup(self) -> None:
+        """Background thread that removes expired entries every `cleanup_interval_seconds`."""
+        while not self._stop_event.wait(timeout=self.cleanup_interval_seconds):
+            self.cleanup_old_entries()
 
     def start_cleanup_task(self) -> None:
         """Start the background cleanup thread."""
@@ -103,12 +212,12 @@ class DocumentCache:
             self._running = True
             self._stop_event.clear()
             self._cleanup_thread = threading.Thread(
-                target=self._schedule_midnight_cleanup,
+                target=self._schedule_cleanup,
                 daemon=True,
                 name="DocumentCache-Cleanup"
             )
             self._cleanup_thread.start()
-            print("[DocumentCache] Started automatic cleanup thread (runs at midnight)")
+            print(f"[DocumentCache] Started automatic cleanup thread (runs every {self.cleanup_interval_seconds}s)")
 
     def stop_cleanup_task(self) -> None:
         """Stop the background cleanup thread."""
@@ -124,6 +233,30 @@ class DocumentCache:
         with self._lock:
             return len(self._cache)
 
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def stats(self) -> dict[str, int | float]:
+        """Hit ratio, evictions and size of the cache (and of its disk tier if enabled)."""
+        with self._lock:
+            requests = self.hits + self.disk_hits + self.misses
+            stats = {
+                "entries": len(self._cache),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / requests if requests else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+            if self._disk is not None:
+                stats["disk_size_bytes"] = self._disk.size_bytes
+                stats["disk_evictions"] = self._disk.evictions
+            return stats
+
     def __contains__(self, key: str) -> bool:
         """Check if a key exists in the cache (and is not expired)."""
-        return self.get(key) is not None
\ No newline at end of file
+        return self.get(key) is not None
@@ -0,0 +1,42 @@
+from collections import OrderedDict
+
+
+class DocumentKeyMap:
+    """
+    Resolves files to keys of the content-addressed `DocumentCache`, so an index is built once per unique document.
+
+    - (conversation_id, file_url) -> key: documents a conversation has already accessed, reused without requests
+    - (file_url, etag) -> key: known versions of files; other conversations resolve them after a metadata request
+      made with their own api key (which is the access check), without downloading the file again
+
+    Both maps are LRU bounded by `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._conversations: OrderedDict[tuple[str, str], str] = OrderedDict()
+        self._versions: OrderedDict[tuple[str, str], str] = OrderedDict()
+
+    def get_conversation_document(self, conversation_id: str, file_url: str) -> str | None:
+        return self._get(self._conversations, (conversation_id, file_url))
+
+    def link_conversation(self, conversation_id: str, file_url: str, document_key: str) -> None:
+        self._put(self._conversations, (conversation_id, file_url), document_key)
+
+    def get_file_version(self, file_url: str, etag: str) -> str | None:
+        return self._get(self._versions, (file_url, etag))
+
+    def link_file_version(self, file_url: str, etag: str, document_key: str) -> None:
+        self._put(self._versions, (file_url, etag), document_key)
+
+    def _get(self, entries: OrderedDict, key: tuple[str, str]) -> str | None:
+        document_key = entries.get(key)
+        if document_key is not None:
+            entries.move_to_end(key)
+        return document_key
+
+    def _put(self, entries: OrderedDict, key: tuple[str, str], document_key: str) -> None:
+        entries[key] = document_key
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
@@ -1,17 +1,21 @@
+import asyncio
+import hashlib
 import json
 from typing import Any
 
-import faiss
-import numpy as np
-from aidial_client import AsyncDial
 from aidial_sdk.chat_completion import Message, Role
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer
+import numpy as np
 
+from task.embeddings.index import INDEX_KINDS, VectorIndex
+from task.embeddings.service import EmbeddingService
+from task.embeddings.utils import normalize
 from task.tools.base import BaseTool
 from task.tools.models import ToolCallParams
 from task.tools.rag.document_cache import DocumentCache
-from task.utils.dial_file_conent_extractor import DialFileContentExtractor
+from task.tools.rag.document_keys import DocumentKeyMap
+from task.utils.dial_client_pool import DialClientPool
+from task.utils.dial_file_conent_extractor import DialFileContentExtractor, FileParserPool
 
 _SYSTEM_PROMPT = """You are a helpful assistant that answers questions based on provided document context.
 
@@ -26,20 +30,56 @@ Instructions:
 
 
 class RagTool(BaseTool):
-
-    def __init__(self, endpoint: str, deployment_name: str, document_cache: DocumentCache):
+    """
+    Answers questions about a document with retrieval augmented generation.
+
+    Document indexes are cached by content (SHA-256 of the file plus a version of chunking, embedding model and
+    index settings), so the same file attached in another conversation, or shared between users, is indexed once
+    per worker. Which conversation may use which document is tracked separately by `DocumentKeyMap`: a conversation
+    gets a cached index only after it has accessed the file with its own api key.
+
+    Documents are chunked page by page as pages are parsed (PDF), chunks are embedded in batches while next pages are
+    still being parsed.
+    """
+
+    CHUNK_SIZE = 500
+    CHUNK_OVERLAP = 50
+
+    def __init__(
+            self,
+            endpoint: str,
+            deployment_name: str,
+            document_cache: DocumentCache,
+            embedding_service: EmbeddingService,
+            client_pool: DialClientPool,
+            parser_pool: FileParserPool,
+            index_kind: str = "flat",
+            document_keys: DocumentKeyMap | None = None,
+    ):
         self.endpoint = endpoint
         self.deployment_name = deployment_name
         self.document_cache = document_cache
-
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.embedding_service = embedding_service
+        self.client_pool = client_pool
+        self.parser_pool = parser_pool
+        if index_kind not in INDEX_KINDS:
+            raise ValueError(f"Unknown index kind '{index_kind}', expected one of {INDEX_KINDS}")
+        # Quantized indexes keep float16 vectors, candidates are re-ranked against them
+        self.index_kind = index_kind
+        self.document_keys = document_keys or DocumentKeyMap()
+        self._indexing: dict[str, asyncio.Task] = {}
 
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=50,
+            chunk_size=self.CHUNK_SIZE,
+            chunk_overlap=self.CHUNK_OVERLAP,
             length_function=len,
             separators=["\n\n", "\n", ". ", " ", ""]
         )
+        # Cached indexes are only valid for the settings they were built with
+        self.index_version = hashlib.sha256(
+            f"{embedding_service.model_name}:{embedding_service.backend}:{self.CHUNK_SIZE}:{self.CHUNK_OVERLAP}:"
+            f"pages:{index_kind}".encode()
+        ).hexdigest()[:16]
 
     @property
     def show_in_stage(self) -> bool:
@@ -86,43 +126,30 @@ class RagTool(BaseTool):
         stage.append_content(f"**Request**: {request}\n\r")
         stage.append_content(f"**Document URL**: {file_url}\n")
 
-        cache_document_key = f"{tool_call_params.conversation_id}:{file_url}"
-        cached_data = self.document_cache.get(cache_document_key)
-        if cached_data is not None:
-            index, chunks = cached_data
-        else:
-            text_content = DialFileContentExtractor(
-                endpoint=self.endpoint,
-                api_key=tool_call_params.api_key
-            ).extract_text(file_url)
-
-            if not text_content:
+        conversation_id = tool_call_params.conversation_id
+        document_key = self.document_keys.get_conversation_document(conversation_id, file_url)
+        cached_data = await self.document_cache.aget(document_key) if document_key is not None else None
+        if cached_data is None:
+            document_key, cached_data = await self._load_document(tool_call_params.api_key, file_url)
+            if cached_data is None:
                 stage.append_content("## Response: \n")
                 content = "Error: File content not found."
                 stage.append_content(f"{content}\n")
                 return content
+            self.document_keys.link_conversation(conversation_id, file_url, document_key)
+        index, chunks = cached_data
 
-            chunks = self.text_splitter.split_text(text_content)
-            embeddings = self.model.encode(chunks)
-            index = faiss.IndexFlatL2(384)
-            index.add(np.array(embeddings).astype('float32'))
-            self.document_cache.set(cache_document_key, index, chunks)
-
-        query_embedding = self.model.encode([request]).astype('float32')
+        query_embedding = await self.embedding_service.embed_queries([request])
         k = min(3, len(chunks))
-        distances, indices = index.search(query_embedding, k=k)
+        similarities, indices = index.search_reranked(query_embedding, k=k)
 
-        retrieved_chunks = [chunks[idx] for idx in indices[0]]
+        retrieved_chunks = [chunks[idx] for idx in indices[0] if idx >= 0]
         augmented_prompt = self.__augmentation(request, retrieved_chunks)
         stage.append_content(f"## RAG Request: \n")
         stage.append_content(f"```text\n\r{augmented_prompt}\n\r```\n\r")
         stage.append_content("## Response: \n")
 
-        dial_client = AsyncDial(
-            base_url=self.endpoint,
-            api_key=tool_call_params.api_key,
-            api_version='2025-01-01-preview'
-        )
+        dial_client = self.client_pool.get_client(self.endpoint, tool_call_params.api_key)
         chunks_stream = await dial_client.chat.completions.create(
             messages=[
                 {
@@ -135,6 +162,7 @@ class RagTool(BaseTool):
                 }
             ],
             deployment_name=self.deployment_name,
+            api_version=DialClientPool.API_VERSION,
             stream=True,
         )
 
@@ -148,6 +176,75 @@ class RagTool(BaseTool):
 
         return content
 
+    async def _load_document(self, api_key: str, file_url: str) -> tuple[str, tuple[VectorIndex, list[str]] | None]:
+        """
+        Resolve the file to its document key and get the document index, building it if it is not cached.
+
+        The metadata request made with the user's api key checks access to the file. Known versions of the file
+        (by ETag) are resolved without download, otherwise the key is computed from the downloaded content.
+
+        Returns:
+            Tuple of (document key, (index, chunks) or None if the file has no text content)
+        """
+        client = self.client_pool.get_client(self.endpoint, api_key)
+        etag = (await client.files.get_metadata(file_url)).etag
+        document_key = self.document_keys.get_file_version(file_url, etag) if etag else None
+        if document_key is not None:
+            cached_data = await self.document_cache.aget(document_key)
+            if cached_data is not None:
+                return document_key, cached_data
+
+        extractor = DialFileContentExtractor(dial_client=client, parser_pool=self.parser_pool)
+        filename, file_content = await extractor.download(file_url)
+        document_key = f"{hashlib.sha256(file_content).hexdigest()}:{self.index_version}"
+        if etag:
+            self.document_keys.link_file_version(file_url, etag, document_key)
+        cached_data = await self.document_cache.aget(document_key)
+        if cached_data is not None:
+            return document_key, cached_data
+
+        # Concurrent requests for the same document share one indexing
+        task = self._indexing.get(document_key)
+        if task is None:
+            task = asyncio.ensure_future(self._index_document(extractor, document_key, filename, file_content))
+            self._indexing[document_key] = task
+            task.add_done_callback(lambda _: self._indexing.pop(document_key, None))
+        return document_key, await asyncio.shield(task)
+
+    async def _index_document(
+            self, extractor: DialFileContentExtractor, document_key: str, filename: str, file_content: bytes
+    ) -> tuple[VectorIndex, list[str]] | None:
+        chunks: list[str] = []
+        embedding_tasks: list[asyncio.Future] = []
+        batch_start = 0
+        try:
+            async for text in extractor.iter_text_from_content(filename, file_content):
+                chunks.extend(self.text_splitter.split_text(text))
+                if len(chunks) - batch_start >= self.embedding_service.max_batch_size:
+                    embedding_tasks.append(asyncio.ensure_future(self.embedding_service.embed(chunks[batch_start:])))
+                    batch_start = len(chunks)
+            if len(chunks) > batch_start:
+                embedding_tasks.append(asyncio.ensure_future(self.embedding_service.embed(chunks[batch_start:])))
+            if not chunks:
+                return None
+            embeddings = normalize(np.vstack(await asyncio.gather(*embedding_tasks)))
+        except Exception as e:
+            for task in embedding_tasks:
+                task.cancel()
+            print(f"Error indexing {filename}: {str(e)}")
+            return None
+
+        # Training of quantizers takes seconds for large documents
+        index = await asyncio.to_thread(VectorIndex.build, embeddings, kind=self.index_kind, keep_vectors=True)
+        await self.document_cache.aset(document_key, index, chunks)
+        stats = self.document_cache.stats()
+        print(
+            f"[RagTool] Indexed {filename} ({len(chunks)} chunks), document cache: {stats['entries']} entries, "
+            f"{stats['size_bytes'] / 1024 ** 2:.1f}/{stats['max_bytes'] / 1024 ** 2:.0f} MB, "
+            f"hit rate {stats['hit_rate']:.2f}, {stats['evictions']} evictions"
+        )
+        return index, chunks
+
     def __augmentation(self, request: str, chunks: list[str]) -> str:
         """Combine retrieved chunks with the user's request."""
         joined_chunks = "\n\n".join(chunks)
@@ -0,0 +1,85 @@
+import hashlib
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from pathlib import PurePosixPath
+from typing import Any
+
+import httpx
+from aidial_client import AsyncDial, AsyncDialClientPool
+
+_MAX_RETRIES = 2
+_TIMEOUT = httpx.Timeout(timeout=600.0, connect=5.0)
+
+# Stable identity of the user of the current request (hash of the forwarded user token), see `DialClientPool.bind_user`
+_user_identity: ContextVar[str | None] = ContextVar('dial_user_identity', default=None)
+
+
+class DialClientPool:
+    """
+    Shared DIAL clients.
+
+    All clients are created by `AsyncDialClientPool` and reuse its HTTP connection pool (keep-alive), so calls
+    don't pay TCP/TLS setup each time. Clients are cached per (endpoint, api key) in LRU order: they authenticate
+    with the api key, which DIAL Core issues per request, so a client is reused only by the calls of one request
+    (creating one is cheap anyway). Pooled clients have no default API version, chat completions pass
+    `API_VERSION`.
+
+    Resolved appdata homes are cached with TTL by the user of the request, bound with `bind_user`, so they are
+    resolved once per user and not once per request. Requests without a forwarded user token (callers using
+    an api key directly) fall back to caching by the per-request api key, i.e. one lookup per request. Like
+    clients, at most `max_clients` of them are kept in LRU order.
+    """
+
+    API_VERSION = '2025-01-01-preview'
+
+    def __init__(
+            self,
+            max_clients: int = 1024,
+            appdata_ttl_seconds: float = 3600,
+            connection_limits: httpx.Limits = httpx.Limits(max_connections=200, max_keepalive_connections=50),
+    ):
+        self.max_clients = max_clients
+        self.appdata_ttl_seconds = appdata_ttl_seconds
+        self._pool = AsyncDialClientPool(connection_limits=connection_limits, timeout=_TIMEOUT)
+        self._clients: OrderedDict[tuple[str, str], AsyncDial] = OrderedDict()
+        self._appdata_homes: OrderedDict[tuple[str, str], tuple[PurePosixPath | None, float]] = OrderedDict()
+
+    def get_client(self, endpoint: str, api_key: str) -> AsyncDial:
+        key = (endpoint, api_key)
+        client = self._clients.get(key)
+        if client is None:
+            client = self._pool.create_client(
+                base_url=endpoint, api_key=api_key, max_retries=_MAX_RETRIES, timeout=_TIMEOUT
+            )
+        self._remember(self._clients, key, client)
+        return client
+
+    @staticmethod
+    def bind_user(jwt: str | None) -> None:
+        """
+        Bind the user of the current request (and of tasks it starts) by the user token forwarded by DIAL Core.
+
+        Only a hash of the token is kept. Cached appdata homes are shared by requests with the same token, which
+        all belong to the same user, while the api keys of these requests differ.
+        """
+        _user_identity.set(hashlib.sha256(jwt.encode()).hexdigest() if jwt else None)
+
+    async def get_appdata_home(self, endpoint: str, api_key: str) -> PurePosixPath | None:
+        """Get appdata home of the application for the user of the request, resolved once per TTL."""
+        key = (endpoint, _user_identity.get() or api_key)
+        cached = self._appdata_homes.get(key)
+        if cached is not None and cached[1] > time.monotonic():
+            self._appdata_homes.move_to_end(key)
+            return cached[0]
+
+        appdata = await self.get_client(endpoint, api_key).bucket.get_appdata()
+        app_home = PurePosixPath(appdata.raw) if appdata else None
+        self._remember(self._appdata_homes, key, (app_home, time.monotonic() + self.appdata_ttl_seconds))
+        return app_home
+
+    def _remember(self, entries: OrderedDict, key: tuple[str, str], value: Any) -> None:
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_clients:
+            entries.popitem(last=False)
@@ -1,66 +1,326 @@
+import asyncio
 import io
+import math
+import multiprocessing
+import signal
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
+from typing import AsyncIterator, Callable
 
 import pdfplumber
 import pandas as pd
-from aidial_client import Dial
+from aidial_client import AsyncDial
 from bs4 import BeautifulSoup
 
 
-class DialFileContentExtractor:
+class FileParserPool:
+    """
+    Process pool for CPU-heavy parsing of file content (PDF, CSV, HTML), so that parsing of a large document doesn't
+    block the event loop (and other conversations served by the worker).
 
-    def __init__(self, endpoint: str, api_key: str):
-        self.dial_client = Dial(
-            base_url=endpoint,
-            api_key=api_key,
-        )
+    - At most `max_workers` parsing jobs (a file or a slice of PDF pages) run at the same time, the rest wait for
+      a free worker in the calling process
+    - Extraction of a file (all slices of a PDF together) is abandoned after `timeout_seconds`, slices still
+      queued or running are cancelled
+    - A job running longer than `timeout_seconds` is interrupted inside its worker (`ParsingTimeoutError`), so a
+      cancelled job doesn't keep its worker busy, other jobs and workers are not affected. Only a worker that
+      doesn't respond within `kill_grace_seconds` after that (stuck in native code) gets the pool restarted: its
+      worker processes are terminated and jobs that were running in them are resubmitted to the new pool once
+    - Plain text smaller than `inline_max_bytes` is decoded in the calling process, the round trip costs more
+    - PDF page range is split into slices of `pdf_pages_per_task` pages parsed by different workers, text is
+      reassembled in page order (identical to sequential extraction), `iter_pdf_pages` yields pages as they are ready.
+      At most `max_workers` slices of one document are in flight, so a large PDF doesn't queue all its slices ahead
+      of other files
+    - Workers are started from a single-threaded fork server (`start_method`) with this module preloaded, so
+      restarting the pool never forks the multithreaded application process. Like spawned processes, workers
+      import the main module as `__mp_main__` when the application is run as a script (not with `uvicorn
+      task.app:app`), it must not create the application then
+    """
 
-    def extract_text(self, file_url: str) -> str:
-        file_download_response = self.dial_client.files.download(file_url)
-        filename = file_download_response.filename
-        file_content: bytes = file_download_response.get_content()
+    def __init__(
+            self,
+            max_workers: int = 2,
+            timeout_seconds: float = 60.0,
+            inline_max_bytes: int = 256 * 1024,
+            pdf_pages_per_task: int = 16,
+            start_method: str = "forkserver",
+            kill_grace_seconds: float = 5.0,
+    ):
+        self.max_workers = max_workers
+        self.timeout_seconds = timeout_seconds
+        self.inline_max_bytes = inline_max_bytes
+        self.pdf_pages_per_task = pdf_pages_per_task
+        self.start_method = start_method
+        self.kill_grace_seconds = kill_grace_seconds
+        self._executor: ProcessPoolExecutor | None = None
+        self._slots: tuple[asyncio.AbstractEventLoop, asyncio.Semaphore] | None = None
+        self.timeouts = 0
+        self.restarts = 0
 
-        file_extension = Path(filename).suffix.lower()
-        text_content = self.__extract_text(file_content, file_extension, filename)
+    def warm_up(self) -> None:
+        """Start worker processes, doesn't require running event loop."""
+        executor = self._get_executor()
+        for _ in range(self.max_workers):
+            executor.submit(_noop)
 
-        return text_content
+    async def extract_text(self, file_content: bytes, file_extension: str, filename: str) -> str:
+        """
+        Extract text content based on file type.
 
-    def __extract_text(self, file_content: bytes, file_extension: str, filename: str) -> str:
-        """Extract text content based on file type."""
-        try:
-            if file_extension == '.txt':
-                return file_content.decode('utf-8', errors='ignore')
-
-            elif file_extension == '.pdf':
-                pdf_file = io.BytesIO(file_content)
-                text = []
-                with pdfplumber.open(pdf_file) as pdf:
-                    for page in pdf.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text.append(page_text)
-                return '\n\n'.join(text)
-
-            elif file_extension == '.csv':
-                text_content = file_content.decode('utf-8', errors='ignore')
-                csv_buffer = io.StringIO(text_content)
-                df = pd.read_csv(csv_buffer)
-                return df.to_markdown(index=False)
-
-            elif file_extension in ['.html', '.htm']:
-                html_content = file_content.decode('utf-8', errors='ignore')
-                soup = BeautifulSoup(html_content, 'html.parser')
-
-                # Remove script and style elements
-                for script in soup(["script", "style"]):
-                    script.decompose()
-
-                return soup.get_text(separator='\n', strip=True)
-
-            else:
-                # Fallback: try to decode as text
-                return file_content.decode('utf-8', errors='ignore')
+        Returns:
+            Extracted text, empty string if parsing failed or timed out
+        """
+        if file_extension not in _PARSED_EXTENSIONS and len(file_content) <= self.inline_max_bytes:
+            return _extract_text(file_content, file_extension, filename)
 
+        try:
+            if file_extension == '.pdf':
+                return '\n\n'.join([text async for text in self.iter_pdf_pages(file_content) if text])
+            async with asyncio.timeout(self.timeout_seconds):
+                return await self._call(_extract_text, file_content, file_extension, filename)
+        except TimeoutError:
+            print(f"Extracting text from {filename} timed out after {self.timeout_seconds}s.")
+            return ""
         except Exception as e:
             print(f"Error extracting text from {filename}: {str(e)}")
             return ""
+
+    async def iter_pdf_pages(self, file_content: bytes) -> AsyncIterator[str | None]:
+        """
+        Yield text of each PDF page in page order (None for pages without text), a page is yielded as soon as it
+        and all pages before it are parsed, so consumers can start before the last page is ready. Next slice is
+        submitted when the oldest one in flight is consumed.
+
+        Raises:
+            TimeoutError: if the whole document is not parsed within `timeout_seconds` after the iteration started
+        """
+        # One deadline for the whole document, applied to each wait for pages: a timeout can't span yields,
+        # it would cancel the consumer
+        deadline = asyncio.get_running_loop().time() + self.timeout_seconds
+        async with asyncio.timeout_at(deadline):
+            page_count = await self._call(_count_pdf_pages, file_content)
+        tasks_count = max(1, math.ceil(page_count / self.pdf_pages_per_task))
+        slice_size = math.ceil(page_count / tasks_count) if page_count else 0
+        starts = iter(range(0, page_count, slice_size or 1))
+        in_flight: deque[asyncio.Future] = deque()
+
+        def submit_next() -> None:
+            start = next(starts, None)
+            if start is not None:
+                in_flight.append(asyncio.ensure_future(
+                    self._call(_extract_pdf_pages, file_content, start, min(start + slice_size, page_count))
+                ))
+
+        for _ in range(self.max_workers):
+            submit_next()
+        try:
+            while in_flight:
+                async with asyncio.timeout_at(deadline):
+                    texts = await in_flight[0]
+                in_flight.popleft()
+                submit_next()
+                for text in texts:
+                    yield text
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    async def _call(self, func: Callable, *args):
+        """
+        Run function in the pool once a worker is free, resubmit once if its worker was terminated.
+
+        Raises:
+            TimeoutError: if the function ran longer than `timeout_seconds`
+        """
+        slots = self._get_slots()
+        for attempt in range(2):
+            await slots.acquire()
+            executor = self._get_executor()
+            try:
+                future = asyncio.get_running_loop().run_in_executor(
+                    executor, _run_with_timeout, self.timeout_seconds, func, *args
+                )
+            except BaseException:
+                slots.release()
+                raise
+            # Slot is held until the job leaves its worker, even if the caller stops waiting for it
+            future.add_done_callback(lambda done: self._release_slot(slots, done))
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), self.timeout_seconds + self.kill_grace_seconds)
+            except ParsingTimeoutError:
+                self.timeouts += 1
+                raise
+            except asyncio.TimeoutError:
+                # Worker ignored the timeout signal (stuck in native code), terminating it is the only option
+                self.timeouts += 1
+                self._restart(executor)
+                raise
+            except BrokenProcessPool:
+                # Worker was terminated because of a timed out neighbour (or crashed on this file)
+                self._restart(executor)
+                if attempt:
+                    raise
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            mp_context = multiprocessing.get_context(self.start_method)
+            if self.start_method == "forkserver":
+                # Workers forked from the fork server start with parsing libraries already imported
+                mp_context.set_forkserver_preload([__name__])
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=mp_context)
+        return self._executor
+
+    @staticmethod
+    def _release_slot(slots: asyncio.Semaphore, future: asyncio.Future) -> None:
+        slots.release()
+        # Result of a job abandoned by its caller is not retrieved otherwise
+        if not future.cancelled():
+            future.exception()
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        """Free workers of the pool, semaphore is bound to the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots[0] is not loop:
+            self._slots = (loop, asyncio.Semaphore(self.max_workers))
+        return self._slots[1]
+
+    def _restart(self, executor: ProcessPoolExecutor) -> None:
+        """Drop the executor and terminate its workers, no-op if it was already replaced."""
+        if self._executor is not executor:
+            return
+        self._executor = None
+        self.restarts += 1
+        # Running calls can't be cancelled, the only way to stop them is to terminate their processes
+        processes = list((executor._processes or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+
+class DialFileContentExtractor:
+
+    def __init__(self, dial_client: AsyncDial, parser_pool: FileParserPool):
+        self.dial_client = dial_client
+        self.parser_pool = parser_pool
+
+    async def extract_text(self, file_url: str) -> str:
+        filename, file_content = await self.download(file_url)
+        return await self.extract_text_from_content(filename, file_content)
+
+    async def download(self, file_url: str) -> tuple[str, bytes]:
+        """Download file, returns its name and content."""
+        file_download_response = await self.dial_client.files.download(file_url)
+        file_content: bytes = await file_download_response.aget_content()
+        return file_download_response.filename, file_content
+
+    async def extract_text_from_content(self, filename: str, file_content: bytes) -> str:
+        file_extension = Path(filename).suffix.lower()
+        return await self.parser_pool.extract_text(file_content, file_extension, filename)
+
+    async def iter_text_from_content(self, filename: str, file_content: bytes) -> AsyncIterator[str]:
+        """
+        Yield text of each PDF page with text as soon as it is parsed, whole text for other files (if not empty).
+
+        Raises:
+            Exception: if parsing of PDF pages failed or timed out
+        """
+        file_extension = Path(filename).suffix.lower()
+        if file_extension != '.pdf':
+            text = await self.extract_text_from_content(filename, file_content)
+            if text:
+                yield text
+            return
+        async for text in self.parser_pool.iter_pdf_pages(file_content):
+            if text:
+                yield text
+
+
+_PARSED_EXTENSIONS = ('.pdf', '.csv', '.html', '.htm')
+
+
+class ParsingTimeoutError(TimeoutError):
+    """Parsing job was interrupted in its worker after running longer than the pool timeout."""
+
+
+def _noop() -> None:
+    pass
+
+
+def _on_timeout(signum, frame) -> None:
+    raise ParsingTimeoutError("Parsing timed out")
+
+
+def _run_with_timeout(timeout_seconds: float, func: Callable, *args):
+    """Run function in a worker process, interrupted with `ParsingTimeoutError` after `timeout_seconds`."""
+    previous_handler = signal.signal(signal.SIGALRM, _on_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout_seconds)
+    try:
+        return func(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def _count_pdf_pages(file_content: bytes) -> int:
+    with pdfplumber.open(io.BytesIO(file_content)) as pdf:
+        return len(pdf.pages)
+
+
+def _extract_pdf_pages(file_content: bytes, start: int, stop: int) -> list[str | None]:
+    """Text of pages in [start, stop) range, parsed by a worker independently of other ranges."""
+    with pdfplumber.open(io.BytesIO(file_content), pages=list(range(start + 1, stop + 1))) as pdf:
+        return [page.extract_text() for page in pdf.pages]
+
+
+def _extract_text(file_content: bytes, file_extension: str, filename: str) -> str:
+    """
+    Extract text content based on file type (runs in worker processes of `FileParserPool`).
+
+    PDFs are parsed page by page sequentially, `FileParserPool` splits them across workers instead.
+    """
+    try:
+        if file_extension == '.txt':
+            return file_content.decode('utf-8', errors='ignore')
+
+        elif file_extension == '.pdf':
+            pdf_file = io.BytesIO(file_content)
+            text = []
+            with pdfplumber.open(pdf_file) as pdf:
+                for page in pdf.pages:
+                    page_text = page.extract_text()
+                    if page_text:
+                        text.append(page_text)
+            return '\n\n'.join(text)
+
+        elif file_extension == '.csv':
+            text_content = file_content.decode('utf-8', errors='ignore')
+            csv_buffer = io.StringIO(text_content)
+            df = pd.read_csv(csv_buffer)
+            return df.to_markdown(index=False)
+
+        elif file_extension in ['.html', '.htm']:
+            html_content = file_content.decode('utf-8', errors='ignore')
+            soup = BeautifulSoup(html_content, 'html.parser')
+
+            # Remove script and style elements
+            for script in soup(["script", "style"]):
+                script.decompose()
+
+            return soup.get_text(separator='\n', strip=True)
+
+        else:
+            # Fallback: try to decode as text
+            return file_content.decode('utf-8', errors='ignore')
+
+    except ParsingTimeoutError:
+        raise
+    except Exception as e:
+        print(f"Error extracting text from {filename}: {str(e)}")
+        return ""
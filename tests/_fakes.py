@@ -0,0 +1,211 @@
+"""
+Test doubles for tests and benchmarks: DIAL files API (in memory or on local disk, with simulated latency),
+a deterministic embedder and a generator of synthetic PDFs, so that the memory store and document parsing run
+without DIAL Core, the embedding model and sample files.
+"""
+import asyncio
+import hashlib
+import random
+from pathlib import Path, PurePosixPath
+from types import SimpleNamespace
+
+import numpy as np
+from aidial_client import EtagMismatchError, ResourceNotFoundError
+
+from task.embeddings.service import EmbeddingService
+from task.tools.memory._inverted_index import tokenize
+from task.tools.memory._models import EMBEDDING_DIM
+
+
+class FakeFiles:
+    """
+    Subset of `AsyncDial.files` used by the memory store: upload, download, delete and get_metadata.
+
+    Every call sleeps `latency_ms` plus transfer time of its payload at `bandwidth_mbps` (0 for unlimited), so
+    request count and transferred bytes both show up in timings. Files are kept in memory, or under `root` on
+    local disk if provided. Calls and transferred bytes are counted.
+
+    Conditional requests (`etag_if_match`, `etag_if_none_match="*"`) fail with `EtagMismatchError` like DIAL Core.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, bandwidth_mbps: float = 0.0, root: str | None = None):
+        self.latency_ms = latency_ms
+        self.bandwidth_mbps = bandwidth_mbps
+        self.root = Path(root) if root else None
+        self._files: dict[str, bytes] = {}
+        self._etags: dict[str, str] = {}
+        self.requests = 0
+        self.bytes_downloaded = 0
+        self.bytes_uploaded = 0
+
+    def reset_stats(self) -> None:
+        self.requests = self.bytes_downloaded = self.bytes_uploaded = 0
+
+    async def upload(
+            self,
+            url: str,
+            file: tuple[str, bytes, str],
+            etag_if_match: str | None = None,
+            etag_if_none_match: str | None = None,
+    ) -> SimpleNamespace:
+        content = file[1]
+        await self._transfer(len(content))
+        self._check_etag(url, etag_if_match, etag_if_none_match)
+        self.bytes_uploaded += len(content)
+        self._write(url, content)
+        self._etags[url] = hashlib.md5(content).hexdigest()
+        return SimpleNamespace(url=url, etag=self._etags[url])
+
+    async def download(self, url: str, etag_if_match: str | None = None) -> SimpleNamespace:
+        content = self._read(url)
+        await self._transfer(len(content))
+        self._check_etag(url, etag_if_match)
+        self.bytes_downloaded += len(content)
+
+        async def aget_content() -> bytes:
+            return content
+
+        return SimpleNamespace(filename=url.rsplit("/", 1)[-1], aget_content=aget_content)
+
+    async def delete(self, url: str, etag_if_match: str | None = None) -> None:
+        await self._transfer(0)
+        if url not in self._etags:
+            raise ResourceNotFoundError(message=f"File {url} not found")
+        self._check_etag(url, etag_if_match)
+        del self._etags[url]
+        if self.root is None:
+            del self._files[url]
+        else:
+            self._path(url).unlink()
+
+    async def get_metadata(self, url: str) -> SimpleNamespace:
+        await self._transfer(0)
+        if not url.endswith("/"):
+            if url not in self._etags:
+                raise ResourceNotFoundError(message=f"File {url} not found")
+            return SimpleNamespace(url=url, name=url.rsplit("/", 1)[-1], node_type="ITEM", etag=self._etags[url])
+
+        names = {path[len(url):].split("/", 1)[0]: "/" in path[len(url):] for path in self._etags if path.startswith(url)}
+        if not names:
+            raise ResourceNotFoundError(message=f"Folder {url} not found")
+        items = [
+            SimpleNamespace(url=f"{url}{name}", name=name, node_type="FOLDER" if is_folder else "ITEM")
+            for name, is_folder in sorted(names.items())
+        ]
+        return SimpleNamespace(url=url, name=url.rstrip("/").rsplit("/", 1)[-1], node_type="FOLDER", items=items)
+
+    def _check_etag(self, url: str, etag_if_match: str | None = None, etag_if_none_match: str | None = None) -> None:
+        etag = self._etags.get(url)
+        if etag_if_match is not None and etag != etag_if_match:
+            raise EtagMismatchError(message=f"ETag of {url} doesn't match")
+        if etag_if_none_match == "*" and etag is not None:
+            raise EtagMismatchError(message=f"File {url} already exists")
+
+    async def _transfer(self, size: int) -> None:
+        self.requests += 1
+        delay = self.latency_ms / 1000
+        if self.bandwidth_mbps:
+            delay += size * 8 / (self.bandwidth_mbps * 1_000_000)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def _path(self, url: str) -> Path:
+        return self.root / url
+
+    def _write(self, url: str, content: bytes) -> None:
+        if self.root is None:
+            self._files[url] = content
+            return
+        path = self._path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+
+    def _read(self, url: str) -> bytes:
+        if url not in self._etags:
+            raise ResourceNotFoundError(message=f"File {url} not found")
+        return self._files[url] if self.root is None else self._path(url).read_bytes()
+
+
+class FakeClientPool:
+    """Stands in for `DialClientPool`: every api key gets a client with the shared `FakeFiles`."""
+
+    def __init__(self, files: FakeFiles):
+        self.files = files
+
+    def get_client(self, endpoint: str, api_key: str) -> SimpleNamespace:
+        return SimpleNamespace(files=self.files)
+
+    async def get_appdata_home(self, endpoint: str, api_key: str) -> PurePosixPath:
+        return PurePosixPath(f"bucket-{api_key}/appdata/general-purpose-agent")
+
+
+class HashEmbeddingService(EmbeddingService):
+    """
+    Deterministic embedder: a text is the sum of pseudo-random word vectors seeded by a stable hash of each word.
+
+    Texts sharing words are similar, vectors are identical across runs and processes, and encoding costs
+    microseconds, so timings reflect the memory store rather than the model. Batching and query cache of
+    `EmbeddingService` are kept.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(model_name="hash", **kwargs)
+        self._word_vectors: dict[str, np.ndarray] = {}
+
+    def warm_up(self):
+        pass
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        embeddings = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in tokenize(text):
+                embeddings[row] += self._word_vector(word)
+        return embeddings
+
+    def _word_vector(self, word: str) -> np.ndarray:
+        vector = self._word_vectors.get(word)
+        if vector is None:
+            seed = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+            vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM).astype(np.float32)
+            self._word_vectors[word] = vector
+        return vector
+
+
+WORDS = (
+    "revenue quarter analysis results method data model training evaluation table figure contract party agreement "
+    "terms payment delivery schedule customer support product release version section report appendix summary"
+).split()
+
+
+def make_pdf(pages: int, lines_per_page: int = 45, seed: int = 0) -> bytes:
+    """Minimal PDF 1.4 document with Helvetica text lines on every page."""
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, written once page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page in range(pages):
+        lines = [f"Page {page + 1}"] + [" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(lines_per_page)]
+        text = "".join(f"({line}) Tj 0 -14 Td " for line in lines)
+        stream = f"BT /F1 10 Tf 50 800 Td {text}ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+            b"/Contents %d 0 R >>" % len(objects)
+        )
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    content = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(content))
+        content += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(content)
+    content += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    content += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    content += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(content)
@@ -0,0 +1,78 @@
+import unittest
+
+import numpy as np
+
+from task.embeddings.utils import normalize
+from task.tools.memory._dedup import connected_components, deduplicate, find_similar_pairs
+
+
+def clustered_vectors(clusters: int, per_cluster: int, dim: int = 32, noise: float = 0.05, seed: int = 0) -> np.ndarray:
+    """`clusters` groups of near-duplicate vectors, group by group."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    vectors = np.repeat(centers, per_cluster, axis=0) + noise * rng.standard_normal((clusters * per_cluster, dim))
+    return normalize(vectors.astype(np.float32))
+
+
+class TestSimilarPairs(unittest.TestCase):
+
+    def test_blocked_search_finds_exactly_the_pairs_above_threshold(self):
+        embeddings = clustered_vectors(10, 7)
+        similarities = embeddings @ embeddings.T
+        expected = {(i, j) for i, j in zip(*np.nonzero(similarities > 0.9)) if i < j}
+        for block_size in (4, 16, 1000):
+            with self.subTest(block_size=block_size):
+                rows, cols = find_similar_pairs(embeddings, 0.9, block_size=block_size)
+                self.assertEqual(expected, set(zip(rows.tolist(), cols.tolist())))
+                self.assertEqual(len(expected), len(rows))
+
+    def test_no_pairs_among_distinct_vectors(self):
+        rows, cols = find_similar_pairs(normalize(np.eye(8, dtype=np.float32)), 0.5)
+        self.assertEqual((0, 0), (len(rows), len(cols)))
+
+
+class TestConnectedComponents(unittest.TestCase):
+
+    def test_chains_are_labelled_with_their_smallest_node(self):
+        # 5-3-1 and 4-0 chains, 2 and 6 alone
+        labels = connected_components(7, np.array([3, 1, 0]), np.array([5, 3, 4]))
+        self.assertEqual([0, 1, 2, 1, 0, 1, 6], labels.tolist())
+
+    def test_long_chain_converges(self):
+        n = 1000
+        labels = connected_components(n, np.arange(n - 1)[::-1], np.arange(1, n)[::-1])
+        self.assertTrue(np.all(labels == 0))
+
+
+class TestDeduplicate(unittest.TestCase):
+
+    def test_one_memory_survives_per_cluster(self):
+        embeddings = clustered_vectors(5, 4)
+        importance = np.full(20, 0.5, dtype=np.float32)
+        importance[[1, 6]] = 0.9
+        survivors = deduplicate(embeddings, importance, 0.9)
+        # Most important memory of a cluster, the most recent one among equally important
+        self.assertEqual([1, 6, 11, 15, 19], survivors.tolist())
+
+    def test_transitive_duplicates_form_one_cluster(self):
+        # a ~ b and b ~ c, while a and c are below the threshold
+        angles = np.radians([0, 20, 40])
+        embeddings = np.stack([np.cos(angles), np.sin(angles)], axis=1).astype(np.float32)
+        self.assertLess(embeddings[0] @ embeddings[2], 0.9)
+        self.assertEqual([2], deduplicate(embeddings, np.zeros(3, dtype=np.float32), 0.9).tolist())
+
+    def test_result_does_not_depend_on_memory_order(self):
+        embeddings = clustered_vectors(8, 5, seed=1)
+        importance = np.random.default_rng(2).random(40).astype(np.float32)
+        survivors = set(deduplicate(embeddings, importance, 0.9).tolist())
+        permutation = np.random.default_rng(3).permutation(40)
+        shuffled = deduplicate(embeddings[permutation], importance[permutation], 0.9)
+        self.assertEqual(survivors, set(permutation[shuffled].tolist()))
+
+    def test_small_collections_are_kept(self):
+        self.assertEqual([], deduplicate(np.empty((0, 4), dtype=np.float32), np.empty(0), 0.9).tolist())
+        self.assertEqual([0], deduplicate(normalize(np.ones((1, 4), dtype=np.float32)), np.ones(1), 0.9).tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
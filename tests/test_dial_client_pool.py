@@ -0,0 +1,54 @@
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from task.utils.dial_client_pool import DialClientPool
+
+
+class TestDialClientPool(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.pool = DialClientPool(max_clients=2, appdata_ttl_seconds=60)
+        self.lookups = []
+
+        async def get_appdata():
+            self.lookups.append(None)
+            return SimpleNamespace(raw=f"bucket-{len(self.lookups)}/appdata/agent")
+
+        self.pool.get_client = lambda endpoint, api_key: SimpleNamespace(bucket=SimpleNamespace(get_appdata=get_appdata))
+
+    def test_clients_share_connection_pool_and_are_cached_per_api_key(self):
+        pool = DialClientPool(max_clients=2)
+        client = pool.get_client("http://core", "key-1")
+        self.assertIs(client, pool.get_client("http://core", "key-1"))
+        self.assertIsNot(client, pool.get_client("http://core", "key-2"))
+        pool.get_client("http://core", "key-3")
+        self.assertIsNot(client, pool.get_client("http://core", "key-1"))
+
+    async def test_appdata_home_is_resolved_once_per_user(self):
+        self.pool.bind_user("user-token")
+        home = await self.pool.get_appdata_home("http://core", "key-1")
+        self.assertEqual(home, await self.pool.get_appdata_home("http://core", "key-2"))
+        self.assertEqual(1, len(self.lookups))
+
+        with mock.patch("task.utils.dial_client_pool.time.monotonic", return_value=time.monotonic() + 61):
+            await self.pool.get_appdata_home("http://core", "key-3")
+        self.assertEqual(2, len(self.lookups))
+
+    async def test_appdata_homes_are_bounded_least_recently_used(self):
+        for user in ("a", "b", "a", "c"):
+            self.pool.bind_user(user)
+            await self.pool.get_appdata_home("http://core", f"key-{user}")
+        self.assertEqual(3, len(self.lookups))
+        self.assertEqual(2, len(self.pool._appdata_homes))
+
+        self.pool.bind_user("a")
+        await self.pool.get_appdata_home("http://core", "key-a")
+        self.pool.bind_user("b")
+        await self.pool.get_appdata_home("http://core", "key-b")
+        self.assertEqual(4, len(self.lookups))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+import asyncio
+import contextlib
+import io
+import mmap
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from task.embeddings.index import VectorIndex
+from task.embeddings.utils import normalize
+from task.tools.rag._disk_tier import DocumentDiskTier, MappedChunks
+from task.tools.rag.document_cache import DocumentCache
+
+
+def random_vectors(count: int, dim: int = 64, seed: int = 0) -> np.ndarray:
+    return normalize(np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32))
+
+
+class DiskTierTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.output = contextlib.redirect_stdout(io.StringIO())
+        self.output.__enter__()
+        self.addCleanup(self.output.__exit__, None, None, None)
+
+    def new_tier(self, max_bytes: int = 1024 ** 3) -> DocumentDiskTier:
+        return DocumentDiskTier(self.directory.name, max_bytes)
+
+
+class TestDiskTier(DiskTierTestCase):
+
+    def test_quantized_entry_is_loaded_with_vectors_for_reranking(self):
+        vectors = random_vectors(1000)
+        index = VectorIndex.build(vectors, kind="sq8", keep_vectors=True)
+        chunks = [f"chunk {i}" for i in range(1000)]
+        self.new_tier().save("doc", index, chunks)
+
+        loaded_index, loaded_chunks = self.new_tier().load("doc")
+        self.assertEqual("sq8", loaded_index.kind)
+        self.assertIsInstance(loaded_index.vectors, np.memmap)
+        np.testing.assert_array_equal(index.vectors, loaded_index.vectors)
+        queries = random_vectors(5, seed=1)
+        np.testing.assert_array_equal(index.search_reranked(queries, 3)[1], loaded_index.search_reranked(queries, 3)[1])
+        self.assertEqual("chunk 999", loaded_chunks[999])
+
+    def test_flat_entry_has_no_vectors_file(self):
+        self.new_tier().save("doc", VectorIndex.build(random_vectors(10), keep_vectors=True), ["a"] * 10)
+        index, _ = self.new_tier().load("doc")
+        self.assertIsNone(index.vectors)
+        self.assertEqual(["doc.chunks", "doc.index"], sorted(path.name for path in self.new_tier().directory.iterdir()))
+
+
+class TestPersistentCache(DiskTierTestCase):
+
+    def test_entry_survives_restart_and_is_mapped_from_disk(self):
+        chunks = ["first chunk", "second chunk", "třetí"]
+        cache = DocumentCache(persist_dir=self.directory.name)
+        cache.set("doc", VectorIndex.build(random_vectors(3)), chunks)
+
+        restarted = DocumentCache(persist_dir=self.directory.name)
+        index, loaded_chunks = restarted.get("doc")
+        self.assertIsInstance(loaded_chunks, MappedChunks)
+        self.assertEqual(chunks, list(loaded_chunks))
+        self.assertEqual(chunks[1:], loaded_chunks[1:])
+        self.assertEqual(3, index.size)
+        # Mapped entry counts its chunk offsets only, and is served from memory afterwards
+        self.assertEqual(4 * 8, restarted.size_bytes)
+        self.assertIsNotNone(restarted.get("doc"))
+        self.assertEqual((1, 1, 0), (restarted.disk_hits, restarted.hits, restarted.misses))
+
+    def test_async_access_reads_and_writes_disk_in_worker_thread(self):
+        async def scenario():
+            cache = DocumentCache(persist_dir=self.directory.name)
+            await cache.aset("doc", VectorIndex.build(random_vectors(3)), ["a", "b", "c"])
+            restarted = DocumentCache(persist_dir=self.directory.name)
+            return await restarted.aget("doc"), await restarted.aget("missing"), restarted
+
+        (_, chunks), missing, restarted = asyncio.run(scenario())
+        self.assertEqual(["a", "b", "c"], list(chunks))
+        self.assertIsNone(missing)
+        self.assertEqual((1, 1), (restarted.disk_hits, restarted.misses))
+
+    def test_least_recently_loaded_entries_are_removed_from_disk(self):
+        tier = self.new_tier()
+        for seed, key in enumerate(("a", "b")):
+            tier.save(key, VectorIndex.build(random_vectors(100, seed=seed)), [key] * 100)
+        os.utime(tier.directory / "a.chunks", (time.time() - 60, time.time() - 60))
+        os.utime(tier.directory / "b.chunks", (time.time() - 30, time.time() - 30))
+        # Load refreshes the entry, "b" becomes the least recently used one
+        self.assertIsNotNone(tier.load("a"))
+
+        tier.max_bytes = tier.size_bytes
+        tier.save("c", VectorIndex.build(random_vectors(100, seed=2)), ["c"] * 100)
+        self.assertEqual(["a", "c"], sorted(path.stem for path in tier.directory.glob("*.chunks")))
+        self.assertFalse((tier.directory / "b.index").exists())
+
+
+class TestDiskTierSize(DiskTierTestCase):
+
+    def test_size_is_counted_on_save_and_eviction_without_scanning(self):
+        tier = self.new_tier()
+        tier.save("a", VectorIndex.build(random_vectors(100)), ["a"] * 100)
+        entry_size = tier.size_bytes
+        self.assertGreater(entry_size, 100 * 64 * 4)
+
+        with mock.patch.object(DocumentDiskTier, "_scan", side_effect=AssertionError("directory scanned")):
+            tier.save("b", VectorIndex.build(random_vectors(100, seed=1)), ["b"] * 100)
+            # Overwritten entry replaces its own size
+            tier.save("b", VectorIndex.build(random_vectors(100, seed=1)), ["b"] * 100)
+            self.assertEqual(2 * entry_size, tier.size_bytes)
+        # Existing entries are counted once on start
+        self.assertEqual(2 * entry_size, DocumentCache(persist_dir=self.directory.name).stats()["disk_size_bytes"])
+
+        tier.max_bytes = 2 * entry_size
+        tier.save("c", VectorIndex.build(random_vectors(100, seed=2)), ["c"] * 100)
+        self.assertEqual(1, tier.evictions)
+        self.assertEqual(2 * entry_size, tier.size_bytes)
+        self.assertIsNone(tier.load("a"))
+        self.assertEqual(2 * entry_size, self.new_tier().size_bytes)
+
+
+class TestDiskTierFailures(DiskTierTestCase):
+
+    def load_closing_mappings(self, tier: DocumentDiskTier, key: str):
+        buffers = []
+        map_file = mmap.mmap
+
+        def recording_mmap(*args, **kwargs):
+            buffers.append(map_file(*args, **kwargs))
+            return buffers[-1]
+
+        with mock.patch("task.tools.rag._disk_tier.mmap.mmap", side_effect=recording_mmap):
+            loaded = tier.load(key)
+        return loaded, buffers
+
+    def test_mapping_is_closed_when_entry_is_unreadable(self):
+        tier = self.new_tier()
+        tier.save("broken_index", VectorIndex.build(random_vectors(10)), ["a"] * 10)
+        tier.directory.joinpath("broken_index.index").write_bytes(b"garbage")
+        tier.save("old_format", VectorIndex.build(random_vectors(10)), ["a"] * 10)
+        chunks_path = tier.directory / "old_format.chunks"
+        chunks_path.write_bytes(b"RAGC\x01" + chunks_path.read_bytes()[5:])
+        tier.save("no_vectors", VectorIndex.build(random_vectors(1000), kind="sq8", keep_vectors=True), ["a"] * 1000)
+        tier.directory.joinpath("no_vectors.vectors").unlink()
+        tier.directory.joinpath("truncated.chunks").write_bytes(b"RAGC")
+        tier.directory.joinpath("truncated.index").write_bytes(b"")
+
+        for key in ("broken_index", "old_format", "no_vectors", "truncated"):
+            with self.subTest(key=key):
+                loaded, buffers = self.load_closing_mappings(tier, key)
+                self.assertIsNone(loaded)
+                self.assertEqual(1, len(buffers))
+                self.assertTrue(buffers[0].closed)
+
+    def test_missing_and_empty_entries_are_not_loaded(self):
+        tier = self.new_tier()
+        self.assertIsNone(tier.load("missing"))
+        tier.directory.joinpath("empty.chunks").write_bytes(b"")
+        self.assertIsNone(tier.load("empty"))
+
+
+class TestDocumentCache(unittest.TestCase):
+
+    def test_least_recently_used_entries_are_evicted_by_size(self):
+        cache = DocumentCache(max_bytes=3 * 100 * 64 * 4)
+        for key in ("a", "b", "c"):
+            cache.set(key, VectorIndex.build(random_vectors(100)), [])
+        self.assertEqual(3, cache.size())
+        self.assertIsNotNone(cache.get("a"))
+
+        cache.set("d", VectorIndex.build(random_vectors(100)), [])
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertEqual(1, cache.evictions)
+        self.assertEqual(3 * 100 * 64 * 4, cache.size_bytes)
+
+    def test_entry_larger_than_budget_is_kept_alone(self):
+        cache = DocumentCache(max_bytes=100)
+        cache.set("a", VectorIndex.build(random_vectors(10)), [])
+        cache.set("b", VectorIndex.build(random_vectors(10)), [])
+        self.assertEqual(1, cache.size())
+        self.assertIsNotNone(cache.get("b"))
+
+    def test_expired_entries_are_removed_on_access_and_by_sweep(self):
+        cache = DocumentCache(ttl_seconds=60)
+        cache.set("a", VectorIndex.build(random_vectors(10)), ["a"])
+        cache.set("b", VectorIndex.build(random_vectors(10)), ["b"])
+        with contextlib.redirect_stdout(io.StringIO()), \
+                mock.patch("task.tools.rag.document_cache.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(1, cache.cleanup_old_entries())
+        self.assertEqual(0, cache.size())
+        self.assertEqual(0, cache.size_bytes)
+        self.assertEqual(2, cache.expirations)
+
+    def test_stats_count_hits_and_misses(self):
+        cache = DocumentCache()
+        cache.set("a", VectorIndex.build(random_vectors(10)), ["a"])
+        cache.get("a")
+        cache.get("missing")
+        stats = cache.stats()
+        self.assertEqual((1, 1, 0.5), (stats["hits"], stats["misses"], stats["hit_rate"]))
+        self.assertNotIn("disk_size_bytes", stats)
+
+
+if __name__ == "__main__":
+    unittest.main()
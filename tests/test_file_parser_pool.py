@@ -0,0 +1,136 @@
+import asyncio
+import contextlib
+import io
+import time
+import unittest
+
+from task.utils.dial_file_conent_extractor import (
+    DialFileContentExtractor, FileParserPool, ParsingTimeoutError, _extract_text
+)
+from tests._fakes import make_pdf
+
+
+class FileParserPoolTestCase(unittest.IsolatedAsyncioTestCase):
+    """Worker processes are started once per test class, the fork server is shared by all pools of the process."""
+
+    MAX_WORKERS = 2
+    TIMEOUT_SECONDS = 1.0
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = FileParserPool(max_workers=cls.MAX_WORKERS, timeout_seconds=cls.TIMEOUT_SECONDS)
+        cls.pool.warm_up()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    async def asyncSetUp(self):
+        self.output = contextlib.redirect_stdout(io.StringIO())
+        self.output.__enter__()
+        self.pool.timeout_seconds = self.TIMEOUT_SECONDS
+        self.pool.timeouts = self.pool.restarts = 0
+
+    async def asyncTearDown(self):
+        self.output.__exit__(None, None, None)
+
+
+class TestTimeouts(FileParserPoolTestCase):
+
+    async def test_time_in_queue_does_not_count_towards_job_timeout(self):
+        # 6 jobs of 0.6s on 2 workers: the last ones finish after 1.8s, but each of them runs for 0.6s only
+        await asyncio.gather(*[self.pool._call(time.sleep, 0.6) for _ in range(6)])
+        self.assertEqual(0, self.pool.timeouts)
+
+    async def test_slow_job_is_interrupted_in_its_worker_without_restart(self):
+        results = await asyncio.gather(
+            self.pool._call(time.sleep, 5), self.pool._call(sum, [1, 2]), return_exceptions=True
+        )
+        self.assertIsInstance(results[0], ParsingTimeoutError)
+        self.assertEqual(3, results[1])
+        self.assertEqual(0, self.pool.restarts)
+        self.assertEqual(3, await self.pool._call(sum, [1, 2]))
+
+    async def test_whole_document_is_abandoned_after_timeout(self):
+        # Every slice of one page parses well within the timeout, all of them don't
+        pool = FileParserPool(max_workers=1, timeout_seconds=1.0, pdf_pages_per_task=1)
+        self.addCleanup(pool.shutdown)
+        content = make_pdf(40)
+        await pool._call(sum, [])
+
+        started_at = time.monotonic()
+        self.assertEqual("", await pool.extract_text(content, ".pdf", "report.pdf"))
+        self.assertLess(time.monotonic() - started_at, 2.0)
+        # Cancelled slices don't hold the worker
+        started_at = time.monotonic()
+        self.assertEqual(3, await pool._call(sum, [1, 2]))
+        self.assertLess(time.monotonic() - started_at, 1.0)
+
+
+class TestExtraction(FileParserPoolTestCase):
+
+    async def test_csv_and_html_are_parsed_in_workers(self):
+        csv = await self.pool.extract_text(b"name,age\nAnn,31\n", ".csv", "people.csv")
+        self.assertIn("| Ann    |    31 |", csv)
+        html = await self.pool.extract_text(
+            b"<html><script>var x;</script><body><p>Hello</p></body></html>", ".html", "page.html"
+        )
+        self.assertEqual("Hello", html)
+
+    async def test_parsing_error_returns_empty_text(self):
+        self.assertEqual("", await self.pool.extract_text(b"not a pdf", ".pdf", "broken.pdf"))
+
+
+class TestPdfPages(FileParserPoolTestCase):
+
+    async def test_pages_are_identical_to_sequential_extraction(self):
+        pool = FileParserPool(max_workers=self.MAX_WORKERS, pdf_pages_per_task=3)
+        self.addCleanup(pool.shutdown)
+        content = make_pdf(10)
+        pages = [text async for text in pool.iter_pdf_pages(content)]
+        self.assertEqual(10, len(pages))
+        self.assertTrue(pages[3].startswith("Page 4"))
+        self.assertEqual(_extract_text(content, ".pdf", "report.pdf"), "\n\n".join(pages))
+
+    async def test_slices_in_flight_are_capped_per_document(self):
+        pool = FileParserPool(max_workers=self.MAX_WORKERS, pdf_pages_per_task=1)
+        self.addCleanup(pool.shutdown)
+        in_flight = peak = 0
+        call = pool._call
+
+        async def counting_call(func, *args):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            try:
+                return await call(func, *args)
+            finally:
+                in_flight -= 1
+
+        pool._call = counting_call
+        pages = [text async for text in pool.iter_pdf_pages(make_pdf(12))]
+        self.assertEqual(12, len(pages))
+        self.assertEqual(self.MAX_WORKERS, peak)
+
+    async def test_consumer_gets_first_page_before_last_is_parsed(self):
+        pool = FileParserPool(max_workers=1, pdf_pages_per_task=1)
+        self.addCleanup(pool.shutdown)
+        pages = pool.iter_pdf_pages(make_pdf(20))
+        started_at = time.monotonic()
+        first = await anext(pages)
+        first_page_time = time.monotonic() - started_at
+        rest = [text async for text in pages]
+        self.assertTrue(first.startswith("Page 1"))
+        self.assertEqual(19, len(rest))
+        self.assertLess(first_page_time, (time.monotonic() - started_at) / 4)
+
+    async def test_extractor_yields_pages_of_pdf_and_whole_text_of_other_files(self):
+        extractor = DialFileContentExtractor(dial_client=None, parser_pool=self.pool)
+        pages = [text async for text in extractor.iter_text_from_content("report.pdf", make_pdf(3))]
+        self.assertEqual(["Page 1", "Page 2", "Page 3"], [page.split("\n")[0] for page in pages])
+        self.assertEqual(["plain text"], [text async for text in extractor.iter_text_from_content("a.txt", b"plain text")])
+        self.assertEqual([], [text async for text in extractor.iter_text_from_content("empty.txt", b"")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+import numpy as np
+
+from task.tools.memory._models import NewMemory
+from task.tools.memory._ranking import MemoryRanking
+from tests.test_memory_store import API_KEY, MemoryStoreTestCase
+
+DAY = 24 * 60 * 60
+NOW = 1_000 * DAY
+
+
+class TestMemoryRanking(unittest.TestCase):
+
+    def rank(self, ranking: MemoryRanking, similarities: list[float], importance: list[float], ages_days: list[float]):
+        created_at = NOW - np.array(ages_days) * DAY
+        indices = np.arange(len(similarities))[None, :]
+        return ranking.rank(np.array([similarities]), indices, np.array(importance), created_at, NOW, 2)
+
+    def test_importance_and_recency_break_near_ties(self):
+        ranking = MemoryRanking()
+        _, indices = self.rank(ranking, [0.80, 0.79, 0.78], [0.1, 0.9, 0.1], [0, 0, 0])
+        self.assertEqual([1, 0], indices[0].tolist())
+        _, indices = self.rank(ranking, [0.80, 0.79, 0.78], [0.5, 0.5, 0.5], [365, 365, 0])
+        self.assertEqual([2, 0], indices[0].tolist())
+
+    def test_score_combines_weights_and_half_life(self):
+        ranking = MemoryRanking(similarity=1.0, importance=0.5, recency=0.2, recency_half_life_days=10)
+        scores, indices = self.rank(ranking, [0.6, 0.2], [0.4, 0.0], [10, 0])
+        np.testing.assert_allclose([[0.6 + 0.2 + 0.1, 0.2 + 0.2]], scores, rtol=1e-6)
+        self.assertEqual([0, 1], indices[0].tolist())
+
+    def test_missing_hits_stay_last(self):
+        ranking = MemoryRanking()
+        similarities = np.array([[0.1, 0.9]])
+        scores, indices = ranking.rank(similarities, np.array([[0, -1]]), np.array([1.0]), np.array([NOW]), NOW, 2)
+        self.assertEqual([0, -1], indices[0].tolist())
+        self.assertEqual(-np.inf, scores[0, 1])
+
+    def test_zero_weights_disable_ranking(self):
+        self.assertFalse(MemoryRanking(importance=0, recency=0).enabled)
+        self.assertTrue(MemoryRanking(importance=0).enabled)
+
+
+class TestRankedSearch(MemoryStoreTestCase):
+
+    async def test_important_memory_wins_among_similar_ones(self):
+        await self.new_store().add_memories(API_KEY, [
+            NewMemory(content="likes hiking in the mountains", importance=0.1, category="preferences"),
+            NewMemory(content="likes hiking with the dog", importance=1.0, category="preferences"),
+        ])
+        ranked = await self.new_store(ranking=MemoryRanking(importance=1.0)).search_memories(API_KEY, "likes hiking", 1)
+        self.assertEqual("likes hiking with the dog", ranked[0].content)
+        similarity_only = self.new_store(ranking=MemoryRanking(importance=0, recency=0))
+        self.assertEqual(1, len(await similarity_only.search_memories(API_KEY, "likes hiking", 1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+
+import numpy as np
+
+from task.tools.memory._inverted_index import MemoryInvertedIndex
+from task.tools.memory._models import MemoryData, NewMemory
+from tests.test_memory_store import API_KEY, MemoryStoreTestCase
+
+
+def memory(memory_id: int, content: str, category: str = "context", topics: list[str] = (), importance: float = 0.5):
+    return MemoryData(id=memory_id, content=content, category=category, topics=list(topics), importance=importance)
+
+
+MEMORIES = [
+    memory(0, "likes green tea", "preferences", ["drinks"], 0.3),
+    memory(1, "prefers morning meetings", "Preferences", ["work"], 0.8),
+    memory(2, "works at a bakery in Utrecht", "personal_info", ["work", "city"], 0.9),
+    memory(3, "learning Spanish for a trip", "goals", ["travel"], 0.6),
+    memory(4, "trip to Japan in spring", "plans", ["travel"], 0.4),
+]
+
+
+class TestInvertedIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = MemoryInvertedIndex.build(MEMORIES)
+
+    def test_filters_select_candidate_rows(self):
+        self.assertIsNone(self.index.candidates())
+        self.assertEqual([0, 1], self.index.candidates(categories=["PREFERENCES"]).tolist())
+        self.assertEqual([1, 2, 3, 4], self.index.candidates(topics=["work", "travel"]).tolist())
+        # Any of categories and any of topics
+        self.assertEqual([1], self.index.candidates(categories=["preferences", "goals"], topics=["work"]).tolist())
+        self.assertEqual([1, 2, 3], self.index.candidates(min_importance=0.6).tolist())
+        self.assertEqual([3], self.index.candidates(topics=["travel"], min_importance=0.5).tolist())
+        self.assertEqual([], self.index.candidates(categories=["unknown"]).tolist())
+
+    def test_bm25_scores_matching_rows_and_prefers_rare_terms(self):
+        scores = self.index.bm25("trip to Japan")
+        self.assertEqual([3, 4], np.flatnonzero(scores).tolist())
+        self.assertGreater(scores[4], scores[3])
+        self.assertEqual(scores[[4, 0]].tolist(), self.index.bm25("trip to Japan", np.array([4, 0])).tolist())
+        self.assertFalse(self.index.bm25("coffee").any())
+
+    def test_extended_index_matches_rebuilt_one(self):
+        index = MemoryInvertedIndex.build(MEMORIES[:2])
+        index.add(MEMORIES[2:])
+        np.testing.assert_allclose(self.index.bm25("work trip tea"), index.bm25("work trip tea"))
+        self.assertEqual(self.index.candidates(topics=["work"]).tolist(), index.candidates(topics=["work"]).tolist())
+
+
+class TestFilteredSearch(MemoryStoreTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        await self.new_store().add_memories(API_KEY, [
+            NewMemory(content=m.content, category=m.category, topics=m.topics, importance=m.importance) for m in MEMORIES
+        ])
+
+    async def search(self, query: str, top_k: int = 5, **kwargs) -> list[str]:
+        results = await self.new_store().search_memories_multi(API_KEY, [query], top_k, **kwargs)
+        return [memory.content for memory in results[query]]
+
+    async def test_filters_restrict_results(self):
+        self.assertEqual(
+            {"likes green tea", "prefers morning meetings"},
+            set(await self.search("trip to Japan", categories=["preferences"])),
+        )
+        self.assertEqual(["works at a bakery in Utrecht"], await self.search("trip", topics=["city"]))
+        self.assertEqual(
+            {"prefers morning meetings", "works at a bakery in Utrecht"},
+            set(await self.search("meetings", min_importance=0.8)),
+        )
+        self.assertEqual([], await self.search("tea", categories=["unknown"]))
+
+    async def test_filtered_and_unfiltered_results_are_cached_apart(self):
+        store = self.new_store()
+        unfiltered = await store.search_memories_multi(API_KEY, ["trip"], 1)
+        filtered = await store.search_memories_multi(API_KEY, ["trip"], 1, categories=["goals"])
+        self.assertEqual("learning Spanish for a trip", filtered["trip"][0].content)
+        self.assertEqual(unfiltered, await store.search_memories_multi(API_KEY, ["trip"], 1))
+
+    async def test_hybrid_search_finds_keyword_matches(self):
+        results = await self.search("Utrecht bakery", top_k=1, hybrid=True)
+        self.assertEqual(["works at a bakery in Utrecht"], results)
+        results = await self.search("Japan", top_k=2, hybrid=True, categories=["goals", "plans"])
+        self.assertEqual("trip to Japan in spring", results[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
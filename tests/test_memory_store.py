@@ -0,0 +1,250 @@
+import asyncio
+import contextlib
+import io
+import threading
+import unittest
+
+from task.tools.memory._models import MemoryShard, NewMemory
+from task.tools.memory.memory_store import LongTermMemoryStore
+from tests._fakes import FakeClientPool, FakeFiles, HashEmbeddingService
+
+API_KEY = "test"
+
+
+class MemoryStoreTestCase(unittest.IsolatedAsyncioTestCase):
+    """Memory stores sharing one fake DIAL bucket stand in for workers of the application."""
+
+    async def asyncSetUp(self):
+        self.files = FakeFiles()
+        self.embedding_service = HashEmbeddingService()
+        self.output = contextlib.redirect_stdout(io.StringIO())
+        self.output.__enter__()
+
+    async def asyncTearDown(self):
+        self.output.__exit__(None, None, None)
+        self.embedding_service.shutdown()
+
+    def new_store(self, ttl_seconds: float = 60.0, max_shard_size: int | None = None, **kwargs) -> LongTermMemoryStore:
+        store = LongTermMemoryStore(
+            endpoint="test",
+            embedding_service=self.embedding_service,
+            client_pool=FakeClientPool(self.files),
+            cache_ttl_seconds=ttl_seconds,
+            write_flush_delay_ms=0,
+            **kwargs,
+        )
+        if max_shard_size is not None:
+            store.MAX_SHARD_SIZE = max_shard_size
+        return store
+
+    async def add_facts(self, store: LongTermMemoryStore, count: int, category: str = "context", prefix: str = "fact"):
+        await store.add_memories(API_KEY, [
+            NewMemory(content=f"{prefix} number {i} {category}", category=category) for i in range(count)
+        ])
+
+    async def stored_contents(self) -> list[str]:
+        """Contents of all memories as seen by a fresh worker."""
+        shards = await self.new_store()._load_shards(API_KEY)
+        return sorted(memory.content for _, collection in shards for memory in collection.memories)
+
+
+class TestLoading(MemoryStoreTestCase):
+
+    async def test_concurrent_loads_share_downloads(self):
+        await self.add_facts(self.new_store(), 5)
+        store = self.new_store()
+        self.files.reset_stats()
+        await store._load_shards(API_KEY)
+        single_load = self.files.requests
+
+        store = self.new_store()
+        self.files.reset_stats()
+        results = await asyncio.gather(*[store.search_memories(API_KEY, "fact number", 2) for _ in range(10)])
+        self.assertEqual(single_load, self.files.requests)
+        self.assertTrue(all(len(memories) == 2 for memories in results))
+
+    async def test_journal_compacted_during_load_is_not_lost(self):
+        worker_a, worker_b = self.new_store(), self.new_store()
+        await worker_a.add_memory(API_KEY, "works at a bakery", 0.5, "personal_info", [])
+        shard_path, collection = (await worker_a._load_shards(API_KEY))[0]
+        await worker_a._save_memories(API_KEY, shard_path, collection)
+        await worker_a.add_memory(API_KEY, "has a dog named Rex", 0.5, "personal_info", [])
+        _, collection = (await worker_a._load_shards(API_KEY))[0]
+
+        # Worker A compacts the journal segment after worker B listed it, before B downloads it
+        download_journal = worker_b._download_journal
+        compacted = False
+
+        async def compacting_download_journal(client, folder_path, segment_names):
+            nonlocal compacted
+            if segment_names and not compacted:
+                compacted = True
+                await worker_a._save_memories(API_KEY, shard_path, collection)
+            return await download_journal(client, folder_path, segment_names)
+
+        worker_b._download_journal = compacting_download_journal
+        _, loaded = (await worker_b._load_shards(API_KEY))[0]
+        self.assertTrue(compacted)
+        self.assertEqual(["has a dog named Rex", "works at a bakery"], sorted(m.content for m in loaded.memories))
+
+
+class TestSharding(MemoryStoreTestCase):
+
+    async def test_small_user_has_no_manifest(self):
+        store = self.new_store()
+        self.files.reset_stats()
+        await store.add_memories(API_KEY, [
+            NewMemory(content=f"fact about {category}", category=category)
+            for category in ("preferences", "personal_info", "goals", "plans", "context")
+        ])
+        # Manifest check, root snapshot and journal metadata, one journal segment
+        self.assertLessEqual(self.files.requests, 4)
+
+        self.files.reset_stats()
+        results = await self.new_store().search_memories(API_KEY, "fact about goals", 2)
+        self.assertEqual("fact about goals", results[0].content)
+        # Manifest check, root snapshot and journal metadata, journal segment
+        self.assertLessEqual(self.files.requests, 4)
+        self.assertFalse(any(path.endswith("manifest.json") for path in self.files._etags))
+
+    async def test_root_is_split_into_category_shards(self):
+        store = self.new_store(max_shard_size=6)
+        await self.add_facts(store, 4, "goals")
+        await self.add_facts(store, 4, "plans")
+
+        shards = await self.new_store()._load_shards(API_KEY)
+        self.assertEqual(3, len(shards))
+        self.assertEqual([], shards[0][1].memories)
+        self.assertEqual({"goals", "plans"}, {collection.memories[0].category for _, collection in shards[1:]})
+
+        # Memories of split categories go to their shards, search returns each memory once
+        await self.add_facts(store, 1, "goals", prefix="new")
+        goals = (await self.new_store()._load_shards(API_KEY, categories=["goals"]))
+        self.assertEqual(5, sum(len(collection.memories) for _, collection in goals))
+        results = await self.new_store().search_memories(API_KEY, "number goals", 10)
+        self.assertEqual(len(results), len({memory.content for memory in results}))
+        self.assertEqual(9, len(await self.stored_contents()))
+
+    async def test_write_after_delete_all_is_kept(self):
+        worker_a, worker_b = self.new_store(max_shard_size=6), self.new_store(max_shard_size=6)
+        await self.add_facts(worker_b, 5, "personal_info")
+        await self.add_facts(worker_b, 2, "goals")
+        await worker_a.delete_all_memories(API_KEY)
+
+        # Worker B still has the manifest listing the removed shard in cache
+        await worker_b.add_memory(API_KEY, "lives in Utrecht", 0.9, "personal_info", [])
+        self.assertEqual(["lives in Utrecht"], await self.stored_contents())
+
+    async def test_concurrent_shard_creation_is_not_lost(self):
+        store = self.new_store(max_shard_size=6)
+        await self.add_facts(store, 8, "goals")
+        workers = [self.new_store(max_shard_size=6) for _ in range(4)]
+        await asyncio.gather(*[
+            worker._update_manifest(API_KEY, (await worker._get_memory_folder_path(API_KEY)), add=[
+                MemoryShard(name=f"plans-{i}", category="plans")
+            ])
+            for i, worker in enumerate(workers)
+        ])
+        manifest = await self.new_store()._load_manifest(API_KEY, await store._get_memory_folder_path(API_KEY))
+        self.assertEqual(
+            {"plans-0", "plans-1", "plans-2", "plans-3"},
+            {shard.name for shard in manifest.shards if shard.category == "plans"},
+        )
+
+
+class TestCompaction(MemoryStoreTestCase):
+
+    async def test_writing_worker_revalidates_before_compaction(self):
+        worker_a, worker_b = self.new_store(ttl_seconds=0.05), self.new_store(ttl_seconds=0.05)
+        await worker_b.add_memory(API_KEY, "likes green tea", 0.5, "personal_info", [])
+
+        await worker_a.add_memory(API_KEY, "lives in Utrecht", 0.9, "personal_info", [])
+        shard_path, collection = (await worker_a._load_shards(API_KEY))[0]
+        await worker_a._save_memories(API_KEY, shard_path, collection)
+
+        # Worker B keeps writing more often than its cache TTL, then compacts its (possibly stale) collection
+        for i in range(5):
+            await worker_b.add_memory(API_KEY, f"read book number {i}", 0.5, "personal_info", [])
+            await asyncio.sleep(0.03)
+        shard_path, collection = (await worker_b._load_shards(API_KEY))[0]
+        with contextlib.suppress(Exception):
+            await worker_b._save_memories(API_KEY, shard_path, collection)
+
+        contents = await self.stored_contents()
+        self.assertIn("lives in Utrecht", contents)
+        self.assertIn("likes green tea", contents)
+        self.assertEqual(7, len(contents))
+
+    async def test_stale_compaction_is_rejected(self):
+        worker_a, worker_b = self.new_store(), self.new_store()
+        await worker_a.add_memory(API_KEY, "works at a bakery", 0.5, "personal_info", [])
+        shard_path, stale = (await worker_b._load_shards(API_KEY))[0]
+
+        await worker_a.add_memory(API_KEY, "has a dog named Rex", 0.5, "personal_info", [])
+        _, collection = (await worker_a._load_shards(API_KEY))[0]
+        await worker_a._save_memories(API_KEY, shard_path, collection)
+
+        stale.replace(stale.memories[:0], stale.embeddings[:0])
+        with self.assertRaises(Exception):
+            await worker_b._save_memories(API_KEY, shard_path, stale)
+        self.assertEqual(["has a dog named Rex", "works at a bakery"], await self.stored_contents())
+
+
+class TestDeduplication(MemoryStoreTestCase):
+
+    async def fill_due_collection(self, store: LongTermMemoryStore) -> None:
+        """12 memories never deduplicated: 6 duplicated preferences and 6 distinct facts."""
+        await store.add_memories(API_KEY, [
+            NewMemory(content="likes green tea", category="preferences") for _ in range(6)
+        ] + [
+            NewMemory(content=content, category="context")
+            for content in (
+                "owns a red bicycle", "born in Lisbon", "plays chess weekly",
+                "allergic to peanuts", "studies marine biology", "drives an old van",
+            )
+        ])
+
+    async def test_background_job_makes_no_requests_and_next_write_saves_it(self):
+        store = self.new_store()
+        await self.fill_due_collection(store)
+        self.files.reset_stats()
+        await store._load_shards(API_KEY)
+        requests = self.files.requests
+        await asyncio.gather(*store.dedup_scheduler._scheduled.values())
+        self.assertEqual(requests, self.files.requests)
+
+        (_, collection), = await store._load_shards(API_KEY)
+        self.assertTrue(collection.needs_compaction)
+        await store.add_memory(API_KEY, "golf is a new hobby", 0.5, "context", [])
+        contents = await self.stored_contents()
+        self.assertEqual(1, sum("green tea" in content for content in contents))
+        self.assertEqual(8, len(contents))
+
+    async def test_deleted_category_is_not_restored_by_deduplication(self):
+        store = self.new_store()
+        await self.fill_due_collection(store)
+        started, release = threading.Event(), threading.Event()
+        deduplicate_fast = store._deduplicate_fast
+
+        def blocking_deduplicate(memories, embeddings):
+            started.set()
+            release.wait(5)
+            return deduplicate_fast(memories, embeddings)
+
+        store._deduplicate_fast = blocking_deduplicate
+        await store._load_shards(API_KEY)
+        await asyncio.to_thread(started.wait, 5)
+
+        result = await store.delete_memories(API_KEY, "preferences")
+        self.assertTrue(result.startswith("6 memories"))
+        release.set()
+        await asyncio.gather(*store.dedup_scheduler._scheduled.values())
+        await store.add_memory(API_KEY, "golf is a new hobby", 0.5, "context", [])
+
+        contents = await self.stored_contents()
+        self.assertFalse(any("green tea" in content for content in contents))
+        self.assertEqual(7, len(contents))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+import asyncio
+import contextlib
+import io
+import unittest
+
+from aidial_client import ResourceNotFoundError
+
+from task.tools.rag.document_cache import DocumentCache
+from task.tools.rag.document_keys import DocumentKeyMap
+from task.tools.rag.rag_tool import RagTool
+from task.utils.dial_file_conent_extractor import DialFileContentExtractor, FileParserPool
+from tests._fakes import FakeClientPool, FakeFiles, HashEmbeddingService, make_pdf
+
+
+class RagToolTestCase(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.parser_pool = FileParserPool(max_workers=2, pdf_pages_per_task=2)
+        cls.parser_pool.warm_up()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.parser_pool.shutdown()
+
+    async def asyncSetUp(self):
+        self.embedding_service = HashEmbeddingService(max_batch_size=16)
+        self.output = contextlib.redirect_stdout(io.StringIO())
+        self.output.__enter__()
+
+    async def asyncTearDown(self):
+        self.output.__exit__(None, None, None)
+        self.embedding_service.shutdown()
+
+    def new_tool(
+            self, document_cache: DocumentCache | None = None, index_kind: str = "flat", files: FakeFiles | None = None
+    ) -> RagTool:
+        return RagTool(
+            endpoint="test",
+            deployment_name="test",
+            document_cache=document_cache or DocumentCache(),
+            embedding_service=self.embedding_service,
+            client_pool=FakeClientPool(files) if files is not None else None,
+            parser_pool=self.parser_pool,
+            index_kind=index_kind,
+        )
+
+    def new_extractor(self) -> DialFileContentExtractor:
+        return DialFileContentExtractor(dial_client=None, parser_pool=self.parser_pool)
+
+
+class TestIndexing(RagToolTestCase):
+
+    async def test_pdf_is_chunked_page_by_page_and_embedded_in_batches(self):
+        tool = self.new_tool()
+        embedded_batches = []
+        embed = self.embedding_service.embed
+
+        async def recording_embed(texts):
+            embedded_batches.append(len(texts))
+            return await embed(texts)
+
+        self.embedding_service.embed = recording_embed
+        index, chunks = await tool._index_document(self.new_extractor(), "key", "report.pdf", make_pdf(6))
+
+        self.assertEqual(len(chunks), index.size)
+        self.assertEqual(len(chunks), sum(embedded_batches))
+        self.assertGreater(len(embedded_batches), 1)
+        # Chunks don't span pages, every page starts a new chunk
+        self.assertEqual(6, sum(chunk.startswith("Page ") for chunk in chunks))
+        self.assertTrue(all(chunk.count("Page ") <= 1 for chunk in chunks))
+        self.assertIsNotNone(tool.document_cache.get("key"))
+
+    async def test_unparsable_document_is_not_indexed(self):
+        tool = self.new_tool()
+        self.assertIsNone(await tool._index_document(self.new_extractor(), "key", "broken.pdf", b"not a pdf"))
+        self.assertIsNone(await tool._index_document(self.new_extractor(), "empty", "empty.txt", b""))
+        self.assertEqual(0, tool.document_cache.size())
+
+    async def test_quantized_index_keeps_vectors_for_reranking(self):
+        tool = self.new_tool(index_kind="sq8")
+        index, chunks = await tool._index_document(self.new_extractor(), "key", "report.pdf", make_pdf(40))
+        self.assertEqual("sq8", index.kind)
+        self.assertEqual((len(chunks), 384), index.vectors.shape)
+
+        # Query is the only text embedded at search time
+        embed = self.embedding_service.embed
+        embedded = []
+
+        async def recording_embed(texts):
+            embedded.extend(texts)
+            return await embed(texts)
+
+        self.embedding_service.embed = recording_embed
+        query = chunks[100]
+        _, indices = index.search_reranked(await self.embedding_service.embed_queries([query]), 3)
+        self.assertEqual(100, indices[0][0])
+        self.assertEqual([query], embedded)
+
+
+class TestDocumentKeys(RagToolTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.files = FakeFiles()
+        self.indexed = 0
+        embed = self.embedding_service.embed
+
+        async def counting_embed(texts):
+            self.indexed += len(texts)
+            return await embed(texts)
+
+        self.embedding_service.embed = counting_embed
+
+    async def upload(self, url: str, content: bytes) -> None:
+        await self.files.upload(url, (url.rsplit("/", 1)[-1], content, "application/pdf"))
+
+    async def test_same_content_at_different_urls_is_indexed_once(self):
+        tool = self.new_tool(files=self.files)
+        content = make_pdf(3)
+        await self.upload("files/bucket-a/report.pdf", content)
+        await self.upload("files/bucket-b/copy of report.pdf", content)
+
+        key_a, (index_a, _) = await tool._load_document("key-a", "files/bucket-a/report.pdf")
+        indexed = self.indexed
+        key_b, (index_b, _) = await tool._load_document("key-b", "files/bucket-b/copy of report.pdf")
+        self.assertEqual(key_a, key_b)
+        self.assertIs(index_a, index_b)
+        self.assertEqual(indexed, self.indexed)
+
+    async def test_known_file_version_is_resolved_without_download(self):
+        tool = self.new_tool(files=self.files)
+        await self.upload("files/bucket-a/report.pdf", make_pdf(3))
+        key, _ = await tool._load_document("key-a", "files/bucket-a/report.pdf")
+        downloaded = self.files.bytes_downloaded
+
+        self.assertEqual(key, (await tool._load_document("key-b", "files/bucket-a/report.pdf"))[0])
+        self.assertEqual(downloaded, self.files.bytes_downloaded)
+
+        # New version of the file is downloaded and indexed under its own key
+        await self.upload("files/bucket-a/report.pdf", make_pdf(3, seed=1))
+        new_key, _ = await tool._load_document("key-a", "files/bucket-a/report.pdf")
+        self.assertNotEqual(key, new_key)
+        self.assertGreater(self.files.bytes_downloaded, downloaded)
+
+    async def test_concurrent_requests_share_one_indexing(self):
+        tool = self.new_tool(files=self.files)
+        await self.upload("files/bucket-a/report.pdf", make_pdf(3))
+        results = await asyncio.gather(
+            *[tool._load_document(f"key-{i}", "files/bucket-a/report.pdf") for i in range(3)]
+        )
+        self.assertEqual(1, len({id(index) for _, (index, _) in results}))
+        self.assertEqual(len(results[0][1][1]), self.indexed)
+
+    async def test_missing_file_is_not_resolved(self):
+        tool = self.new_tool(files=self.files)
+        with self.assertRaises(ResourceNotFoundError):
+            await tool._load_document("key-a", "files/bucket-a/missing.pdf")
+
+
+class TestDocumentKeyMap(unittest.TestCase):
+
+    def test_maps_are_bounded_least_recently_used(self):
+        keys = DocumentKeyMap(max_entries=2)
+        keys.link_conversation("c1", "a.pdf", "doc-a")
+        keys.link_conversation("c1", "b.pdf", "doc-b")
+        self.assertEqual("doc-a", keys.get_conversation_document("c1", "a.pdf"))
+        keys.link_conversation("c2", "a.pdf", "doc-a")
+        self.assertIsNone(keys.get_conversation_document("c1", "b.pdf"))
+        self.assertEqual("doc-a", keys.get_conversation_document("c1", "a.pdf"))
+
+    def test_conversations_and_versions_are_kept_apart(self):
+        keys = DocumentKeyMap()
+        keys.link_file_version("a.pdf", "etag-1", "doc-a")
+        self.assertEqual("doc-a", keys.get_file_version("a.pdf", "etag-1"))
+        self.assertIsNone(keys.get_file_version("a.pdf", "etag-2"))
+        self.assertIsNone(keys.get_conversation_document("etag-1", "a.pdf"))
+
+
+if __name__ == "__main__":
+    unittest.main()
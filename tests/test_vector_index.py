@@ -0,0 +1,72 @@
+import unittest
+
+import numpy as np
+
+from task.embeddings.index import VectorIndex, rerank
+from task.embeddings.utils import normalize
+
+
+def random_vectors(count: int, dim: int = 64, seed: int = 0) -> np.ndarray:
+    return normalize(np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32))
+
+
+class TestVectorIndex(unittest.TestCase):
+
+    def test_small_indexes_fall_back_to_exact_kinds(self):
+        self.assertEqual("flat", VectorIndex.build(random_vectors(100), kind="sq8").kind)
+        self.assertEqual("sq8", VectorIndex.build(random_vectors(1000), kind="pq").kind)
+        self.assertTrue(VectorIndex.build(random_vectors(100), kind="pq").is_exact)
+
+    def test_quantized_search_returns_more_candidates(self):
+        index = VectorIndex.build(random_vectors(1000), kind="sq8", rerank_factor=4)
+        _, indices = index.search(random_vectors(2, seed=1), 5)
+        self.assertEqual((2, 20), indices.shape)
+
+    def test_rerank_orders_candidates_by_exact_similarity(self):
+        vectors = random_vectors(50)
+        queries = random_vectors(3, seed=1)
+        candidates = np.tile(np.arange(50), (3, 1))
+        candidates[:, -5:] = -1
+        similarities, indices = rerank(queries, candidates, lambda rows: vectors[rows], 4)
+
+        expected = np.argsort(-(queries @ vectors[:45].T), axis=1)[:, :4]
+        np.testing.assert_array_equal(expected, indices)
+        np.testing.assert_allclose(np.take_along_axis(queries @ vectors.T, indices, axis=1), similarities, rtol=1e-5)
+
+
+class TestKeptVectors(unittest.TestCase):
+
+    def test_quantized_index_keeps_float16_vectors(self):
+        vectors = random_vectors(1000)
+        index = VectorIndex.build(vectors, kind="sq8", keep_vectors=True)
+        self.assertEqual(np.float16, index.vectors.dtype)
+        self.assertEqual(1000 * 64 + 1000 * 64 * 2, index.nbytes)
+        self.assertIsNone(VectorIndex.build(vectors[:100], kind="sq8", keep_vectors=True).vectors)
+        self.assertIsNone(VectorIndex.build(vectors, kind="sq8").vectors)
+
+    def test_search_reranked_matches_exact_search(self):
+        vectors = random_vectors(VectorIndex.PQ_MIN_TRAIN_SIZE)
+        queries = random_vectors(20, seed=1)
+        _, expected = VectorIndex.build(vectors, kind="flat").search(queries, 3)
+        for kind in ("sq8", "pq"):
+            with self.subTest(kind=kind):
+                index = VectorIndex.build(vectors, kind=kind, keep_vectors=True, pq_subquantizers=32)
+                self.assertEqual(kind, index.kind)
+                _, indices = index.search_reranked(queries, 3)
+                self.assertEqual((20, 3), indices.shape)
+                recall = np.mean([len(set(row) & set(exact)) / 3 for row, exact in zip(indices, expected)])
+                self.assertGreater(recall, 0.9)
+
+    def test_search_reranked_requires_kept_vectors(self):
+        index = VectorIndex.build(random_vectors(1000), kind="sq8")
+        with self.assertRaises(ValueError):
+            index.search_reranked(random_vectors(1, seed=1), 3)
+
+    def test_index_keeping_vectors_is_not_extended(self):
+        index = VectorIndex.build(random_vectors(1000), kind="sq8", keep_vectors=True)
+        with self.assertRaises(ValueError):
+            index.add(random_vectors(1, seed=1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import asyncio
+import unittest
+
+import numpy as np
+
+from task.tools.memory._models import MemoryData
+from task.tools.memory._write_queue import MemoryWriteQueue
+
+
+class TestWriteQueue(unittest.IsolatedAsyncioTestCase):
+
+    @staticmethod
+    def memory(content: str) -> MemoryData:
+        return MemoryData(id=0, content=content, importance=0.5, category="context", topics=[])
+
+    async def test_writes_are_merged_per_key_and_flushed_with_newest_api_key(self):
+        flushes = []
+        first_flush_started, release = asyncio.Event(), asyncio.Event()
+
+        async def flush(key, api_key, memories, embeddings):
+            flushes.append((key, api_key, [memory.content for memory in memories], embeddings.shape[0]))
+            first_flush_started.set()
+            await release.wait()
+
+        queue = MemoryWriteQueue(flush=flush, flush_delay_ms=0)
+        first = asyncio.ensure_future(queue.submit("a", "key-1", [self.memory("one")], np.zeros((1, 4))))
+        await first_flush_started.wait()
+        # Queued while the first flush is running: merged into one flush with the key of the newest request
+        rest = [
+            asyncio.ensure_future(queue.submit("a", f"key-{i}", [self.memory(str(i))], np.zeros((1, 4))))
+            for i in (2, 3)
+        ]
+        other = asyncio.ensure_future(queue.submit("b", "key-4", [self.memory("four")], np.zeros((1, 4))))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(first, *rest, other)
+
+        self.assertEqual([
+            ("a", "key-1", ["one"], 1),
+            ("a", "key-3", ["2", "3"], 2),
+        ], [flush for flush in flushes if flush[0] == "a"])
+        self.assertIn(("b", "key-4", ["four"], 1), flushes)
+        self.assertEqual(4, queue.writes)
+        self.assertEqual(3, queue.flushes)
+
+    async def test_failed_flush_is_raised_to_its_writers_only(self):
+        async def flush(key, api_key, memories, embeddings):
+            if api_key == "expired":
+                raise RuntimeError("401")
+
+        queue = MemoryWriteQueue(flush=flush, flush_delay_ms=0)
+        with self.assertRaises(RuntimeError):
+            await queue.submit("a", "expired", [self.memory("one")], np.zeros((1, 4)))
+        await queue.submit("a", "valid", [self.memory("two")], np.zeros((1, 4)))
+        self.assertEqual(0, queue.pending("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()